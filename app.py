@@ -1,81 +1,226 @@
-import pathlib
-from typing import Annotated, Any, Dict, Union
+import asyncio
+from typing import Annotated, Any, Dict, Literal, Optional, Union
 
-import uvicorn
-from aiofiles import os as aiofiles_os
-from fastapi import Depends, FastAPI, HTTPException, UploadFile, status
-from fastapi.concurrency import asynccontextmanager
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.concurrency import asynccontextmanager, run_in_threadpool
 from fastapi.exceptions import RequestValidationError, ResponseValidationError
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.database import async_get_db, engine
+from database.changes import (
+    LIKES,
+    get_tweet_changes,
+    get_watermark,
+    log_tweet_changes,
+)
+from database.counters import (
+    add_to_counters,
+    get_counters,
+)
+from database.database import async_get_db, configure_database, dispose_database
 from database.init_db import create_db_models, seed
-from database.models import Like, Media, Tweet, User
+from database.locks import (
+    SCHEDULER_LOCK_KEY,
+    SCHEMA_LOCK_KEY,
+    advisory_lock,
+    run_as_leader,
+)
+from database.models import Like, Media, UploadSession, User
+from database.purge import soft_delete_tweet, soft_delete_user
+from database.ranking import add_likes_to_scores, get_top_tweet_ids
+from database.search import search_tweets
+from database.suggestions import get_follow_suggestions
+from database.tags import get_mentioned_tweets, get_tweets_by_tag
+from database.uploads import (
+    commit_upload_chunk,
+    create_upload_session,
+    get_upload_session,
+    lease_upload_session,
+    release_upload_lease,
+)
 from database.utils import (
-    associate_media_with_tweet,
-    check_follow_user_ability,
+    create_tweets,
+    follow,
     get_all_following_tweets,
-    get_all_tweets,
+    get_feed_items,
+    get_following_ids,
     get_like_by_id,
-    get_media_by_tweet_id,
     get_tweet_by_id,
+    get_user_by_api_key,
     get_user_by_id,
+    home_feed_authors,
+    load_options,
+    stream_tweets,
+    unfollow,
 )
+from database.versions import FEED, USER, bump_versions, get_version
 from schemas.base_sch import DefaultSchema
-from schemas.media_sch import MediaUpload
-from schemas.tweet_sch import TweetCreate, TweetIn, TweetOut
+from schemas.media_sch import MediaUpload, UploadSessionIn
+from schemas.tweet_sch import (
+    TweetBatchIn,
+    TweetBatchOut,
+    TweetCreate,
+    TweetIn,
+    TweetOut,
+)
 from schemas.user_sch import UserOutSchema
-from utils.authorize import authenticate_user
+from utils.authorize import authenticate_admin, authenticate_user
+from utils.compression import CompressionMiddleware
+from utils.etag import etag_matches, make_etag, not_modified, set_etag
 from utils.exceptions import (
     custom_http_exception_handler,
     response_validation_exception_handler,
     validation_exception_handler,
 )
-from utils.for_file import save_uploaded_file
-from utils.setting import MEDIA_PATH
-
-session = async_get_db()
+from utils.export import export_response
+from utils.feed import encode_feed, likes_event, serialize_tweets
+from utils.for_file import (
+    ChunkTooLarge,
+    create_part_file,
+    finish_part_file,
+    restore_part_file,
+    save_uploaded_file,
+    write_chunk,
+)
+from utils.jobs import (
+    enqueue_new_tweet_jobs,
+    fan_out,
+    make_thumbnail,
+    purge_deleted_tweet,
+    purge_deleted_user,
+    unindex_deleted_tweets,
+)
+from utils.profiler import ProfilerMiddleware, list_profiles, profile_path
+from utils.pubsub import feed_hub
+from utils.rate_limit import create_rate_limiter, rate_limit
+from utils.setting import (
+    FEED_MAX_PAGE_SIZE,
+    FEED_PAGE_SIZE,
+    SEARCH_MAX_PAGE_SIZE,
+    SEARCH_PAGE_SIZE,
+    STATIC_DIR,
+    SUGGESTIONS_PAGE_SIZE,
+    TOP_FEED_MAX_PAGE_SIZE,
+    TOP_FEED_PAGE_SIZE,
+    TRENDING_SIZE,
+    Settings,
+    get_settings,
+)
+from utils.static import PrecompressedStaticFiles, SpaIndex, precompress_static
+from utils.tasks import task_queue
+from utils.trending import trending_tags
 
+router = APIRouter()
+spa_index = SpaIndex(STATIC_DIR / "index.html")
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Создание таблиц и заполнение начальными данными
-    await create_db_models()
-    await seed()
-    yield
+# ------------ 1. ПРИЛОЖЕНИЕ И ОТДАЧА СТАТИКИ ------------
 
 
-app = FastAPI(lifespan=lifespan)
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Build the application. Nothing is connected on import or here: the
+    engine is created from the settings (app.env and the environment by
+    default) when the application starts. Run with
+    `uvicorn app:create_app --factory` or serve.py.
 
+    Handlers read the settings from app.state.settings, the database
+    functions and the background jobs get them when the app starts.
+    """
+    settings = settings or get_settings()
 
-app.add_exception_handler(RequestValidationError, validation_exception_handler)
-app.add_exception_handler(HTTPException, custom_http_exception_handler)
-app.add_exception_handler(
-    ResponseValidationError, response_validation_exception_handler
-)
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        configure_database(settings)
+        task_queue.configure(settings)
+        feed_hub.configure(settings)
+        # Создание таблиц и заполнение начальными данными, воркеры по очереди
+        async with advisory_lock(SCHEMA_LOCK_KEY):
+            await create_db_models()
+            await seed()
+        await run_in_threadpool(precompress_static, STATIC_DIR)
+        await feed_hub.start()
+        # Периодические задачи ставит только один из воркеров
+        await task_queue.start(schedules=False)
+        scheduler = asyncio.create_task(
+            run_as_leader(
+                SCHEDULER_LOCK_KEY,
+                task_queue.start_schedules,
+                task_queue.stop_schedules,
+                retry=settings.scheduler_leader_retry,
+            )
+        )
+        yield
+        scheduler.cancel()
+        await asyncio.gather(scheduler, return_exceptions=True)
+        await task_queue.stop()
+        await feed_hub.stop()
+        await dispose_database()
 
-# Путь к статике
-ROOT_DIR = pathlib.Path(__file__).parent
-STATIC_DIR = ROOT_DIR / "server" / "static"
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.state.rate_limiter = create_rate_limiter(settings)
 
+    # Сжатие ответов API по Accept-Encoding, статика сжата заранее
+    if settings.compression:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.compression_min_size,
+            threadpool_size=settings.compression_threadpool_size,
+        )
+    # Добавляется последним, чтобы профиль включал и сжатие ответа
+    if settings.profiling:
+        app.add_middleware(
+            ProfilerMiddleware,
+            admin_api_keys=settings.admin_api_keys,
+            sample_rate=settings.profiling_sample_rate,
+            interval=settings.profiling_interval,
+            directory=settings.profiles_path,
+            keep=settings.profiles_keep,
+        )
 
-# ------------ 1. ОТДАЧА СТАТИКИ ------------
+    app.add_exception_handler(RequestValidationError, validation_exception_handler)
+    app.add_exception_handler(HTTPException, custom_http_exception_handler)
+    app.add_exception_handler(
+        ResponseValidationError, response_validation_exception_handler
+    )
 
-# Все файлы из server/static доступны по /static/*
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+    # Все файлы из server/static доступны по /static/*, сжатые заранее.
+    # Монтируется раньше маршрутов, чтобы catch-all SPA их не перекрыл
+    app.mount("/static", PrecompressedStaticFiles(directory=STATIC_DIR), name="static")
+    app.include_router(router)
+    return app
 
 
 # ------------ 2. API user------------
 
 
-@app.get("/api/users/me", status_code=status.HTTP_200_OK)
+@router.get("/api/users/me", status_code=status.HTTP_200_OK)
 async def get_info_about_me(
     current_user: Annotated[
         UserOutSchema, "User model obtained from the api key"
     ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_db),
+    if_none_match: Optional[str] = Header(None),
 ):
+    # Версия читается до профиля: неизменившийся профиль не загружается
+    etag = make_etag(
+        USER, current_user.id, await get_version(session, USER, current_user.id)
+    )
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    current_user = await get_user_by_id(current_user.id, session, profile="profile")
     user = dict()
     user["id"] = current_user.id
     user["name"] = current_user.username
@@ -95,21 +240,49 @@ async def get_info_about_me(
         following_user["name"] = following.username
         all_followings.append(following_user)
     user["followings"] = all_followings
+    user["counters"] = await get_counters(session, current_user.id)
     answer: Dict[str, Any] = dict()
     answer["user"] = user
     answer["result"] = True
+    return set_etag(JSONResponse(content=answer, status_code=200), etag)
+
+
+# Объявлен раньше /api/users/{user_id}, иначе "suggestions" примут за id
+@router.get("/api/users/suggestions", status_code=status.HTTP_200_OK)
+async def get_suggestions(
+    request: Request,
+    limit: Annotated[int, Query(ge=1)] = SUGGESTIONS_PAGE_SIZE,
+    current_user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """Accounts followed by the most of the accounts the user follows"""
+    # Больше suggestions_per_user кандидатов не хранится
+    limit = min(limit, request.app.state.settings.suggestions_per_user)
+    suggestions = await get_follow_suggestions(session, current_user.id, limit)
+    answer: Dict[str, Any] = dict()
+    answer["result"] = True
+    answer["users"] = [
+        {"id": user_id, "name": username, "mutuals": mutuals}
+        for user_id, username, mutuals in suggestions
+    ]
     return JSONResponse(content=answer, status_code=200)
 
 
-@app.get("/api/users/{user_id}", status_code=status.HTTP_200_OK)
+@router.get("/api/users/{user_id}", status_code=status.HTTP_200_OK)
 async def get_users_info_by_id(
     user_id: int,
     session: AsyncSession = Depends(async_get_db),
     current_user: Annotated[User, "User model obtained from the api key"] = Depends(
         authenticate_user
     ),
+    if_none_match: Optional[str] = Header(None),
 ):
-    user_ = await get_user_by_id(user_id=user_id, session=session)
+    etag = make_etag(USER, user_id, await get_version(session, USER, user_id))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    user_ = await get_user_by_id(user_id=user_id, session=session, profile="profile")
     user = dict()
     user["id"] = user_.id
     user["name"] = user_.username
@@ -129,15 +302,17 @@ async def get_users_info_by_id(
         following_user["name"] = following.username
         all_followings.append(following_user)
     user["followings"] = all_followings
+    user["counters"] = await get_counters(session, user_.id)
     answer: Dict[str, Any] = dict()
     answer["result"] = True
     answer["user"] = user
-    return JSONResponse(content=answer, status_code=200)
+    return set_etag(JSONResponse(content=answer, status_code=200), etag)
 
 
-@app.post(
+@router.post(
     "/users/{user_id}/follow",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("follow"))],
     response_model=DefaultSchema,
 )
 async def follow_user(
@@ -149,9 +324,7 @@ async def follow_user(
 ):
 
     user_to_follow = await get_user_by_id(user_id, session)
-    following_ability = await check_follow_user_ability(current_user, user_to_follow)
-    if following_ability:
-        user_to_follow.followers.append(current_user)
+    if await follow(session, current_user.id, user_to_follow.id):
         await session.commit()
     else:
         raise HTTPException(
@@ -161,9 +334,10 @@ async def follow_user(
     return {"result": True}
 
 
-@app.delete(
+@router.delete(
     "/users/{user_id}/follow",
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(rate_limit("follow"))],
     response_model=DefaultSchema,
 )
 async def unsubscribe_from_user(
@@ -175,23 +349,65 @@ async def unsubscribe_from_user(
 ):
     follower_deleted = await get_user_by_id(user_id, session)
 
-    if follower_deleted not in current_user.following:
+    if not await unfollow(session, current_user.id, follower_deleted.id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You are not following this user.",
         )
 
-    current_user.following.remove(follower_deleted)
     await session.commit()
     return {"result": True}
 
 
+@router.delete(
+    "/api/users/me", status_code=status.HTTP_200_OK, response_model=DefaultSchema
+)
+async def delete_my_account(
+    current_user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """
+    Close the account of the current user. The api key stops working at
+    once, tweets, likes, follows and files are deleted in the background.
+    """
+    await soft_delete_user(session, current_user.id)
+    await session.commit()
+    await purge_deleted_user.delay(user_id=current_user.id)
+    return {"result": True}
+
+
+@router.get("/api/users/me/mentions", status_code=status.HTTP_200_OK)
+async def get_my_mentions(
+    cursor: Optional[int] = None,
+    limit: Annotated[int, Query(ge=1, le=FEED_MAX_PAGE_SIZE)] = FEED_PAGE_SIZE,
+    current_user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    tweets, next_cursor = await get_mentioned_tweets(
+        session=session,
+        user_id=current_user.id,
+        limit=limit,
+        cursor=cursor,
+        options=load_options("feed"),
+    )
+    answer: Dict[str, Any] = dict()
+    answer["result"] = True
+    answer["tweets"] = serialize_tweets(tweets)
+    answer["next_cursor"] = next_cursor
+    return JSONResponse(content=answer, status_code=200)
+
+
 # ------------ 2. Tweet------------
 
 
-@app.post(
+@router.post(
     "/api/tweets",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("tweet"))],
     response_model=Union[TweetIn, TweetCreate],
 )
 async def create_tweet(
@@ -201,27 +417,37 @@ async def create_tweet(
     ),
     session: AsyncSession = Depends(async_get_db),
 ):
-    new_tweet = Tweet(
-        user_id=current_user.id,
-        tweet_data=tweet_in.tweet_data,
-    )
-    session.add(new_tweet)
-    await session.flush()
-    tweet_media_ids = tweet_in.tweet_media_ids
+    created = await create_tweets(session, current_user.id, [tweet_in])
+    await session.commit()
+    # Индексация и рассылка подписчикам выполняются в фоне
+    await enqueue_new_tweet_jobs(current_user, created)
 
-    if tweet_media_ids:
-        await associate_media_with_tweet(
-            session=session, media_ids=tweet_media_ids, tweet=new_tweet
-        )
+    return {"result": True, "tweet_id": created[0].tweet_id}
 
-    await session.commit()
 
-    return {"result": True, "tweet_id": new_tweet.id}
+@router.post(
+    "/api/tweets/batch",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("tweet"))],
+    response_model=TweetBatchOut,
+)
+async def create_tweets_batch(
+    batch: TweetBatchIn,
+    current_user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    created = await create_tweets(session, current_user.id, batch.tweets)
+    await session.commit()
+    await enqueue_new_tweet_jobs(current_user, created)
+    return {"result": True, "tweets": created}
 
 
-@app.delete(
+@router.delete(
     "/api/tweets/{tweet_id}",
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(rate_limit("tweet"))],
     response_model=DefaultSchema,
 )
 async def delete_tweet(
@@ -231,25 +457,28 @@ async def delete_tweet(
     ),
     session: AsyncSession = Depends(async_get_db),
 ):
-    tweet_to_delete = await get_tweet_by_id(tweet_id, session)
-    if tweet_to_delete.user_id != current_user.id:
+    deleted = await soft_delete_tweet(session, tweet_id, current_user.id)
+    if deleted is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tweet was not found!",
+        )
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Sorry, you can't delete tweets created by another user.",
         )
-    media_to_delete = await get_media_by_tweet_id(tweet_id, session)
-    for media in media_to_delete:
-        path_to_delete = MEDIA_PATH / media.media_path
-        await aiofiles_os.remove(path_to_delete)
-
-    await session.delete(tweet_to_delete)
     await session.commit()
-    return tweet_to_delete
+    # Лайки, медиа и файлы удаляются в фоне, уже после ответа
+    await purge_deleted_tweet.delay(tweet_id=tweet_id)
+    await unindex_deleted_tweets.delay(tweet_ids=[tweet_id])
+    return {"result": True}
 
 
-@app.post(
+@router.post(
     "/api/tweets/{tweet_id}/likes",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("like"))],
     response_model=DefaultSchema,
 )
 async def like_a_tweet(
@@ -261,20 +490,38 @@ async def like_a_tweet(
 ):
     tweet_to_like = await get_tweet_by_id(tweet_id=tweet_id, session=session)
     like = await get_like_by_id(
-        session=session, tweet_id=tweet_id, user_id=current_user.id
+        session=session,
+        tweet_id=tweet_id,
+        user_id=current_user.id,
+        tweet_create_date=tweet_to_like.create_date,
     )
     if not like:
         if tweet_to_like.user_id != current_user.id:
-            like_to_add = Like(user_id=current_user.id, tweet_id=tweet_to_like.id)
+            like_to_add = Like(
+                user_id=current_user.id,
+                tweet_id=tweet_to_like.id,
+                tweet_create_date=tweet_to_like.create_date,
+            )
             session.add(like_to_add)
+            await add_to_counters(session, {(tweet_to_like.user_id, "likes"): 1})
+            await add_likes_to_scores(session, {tweet_to_like.id: 1})
+            await log_tweet_changes(
+                session, LIKES, [(tweet_to_like.id, tweet_to_like.user_id)]
+            )
+            await bump_versions(session, feed=True)
             await session.commit()
+            await fan_out.delay(
+                author_id=tweet_to_like.user_id,
+                event=likes_event(tweet_id, current_user.id, current_user.username, 1),
+            )
 
     return dict()
 
 
-@app.delete(
+@router.delete(
     "/api/tweets/{tweet_id}/likes",
     status_code=status.HTTP_200_OK,
+    dependencies=[Depends(rate_limit("like"))],
     response_model=DefaultSchema,
 )
 async def delete_like_from_tweet(
@@ -287,11 +534,22 @@ async def delete_like_from_tweet(
     await session.commit()
     test_tweet = await get_tweet_by_id(tweet_id=tweet_id, session=session)
     like = await get_like_by_id(
-        session, tweet_id=test_tweet.id, user_id=current_user.id
+        session,
+        tweet_id=test_tweet.id,
+        user_id=current_user.id,
+        tweet_create_date=test_tweet.create_date,
     )
     if like:
         await session.delete(like)
+        await add_to_counters(session, {(test_tweet.user_id, "likes"): -1})
+        await add_likes_to_scores(session, {test_tweet.id: -1})
+        await log_tweet_changes(session, LIKES, [(test_tweet.id, test_tweet.user_id)])
+        await bump_versions(session, feed=True)
         await session.commit()
+        await fan_out.delay(
+            author_id=test_tweet.user_id,
+            event=likes_event(tweet_id, current_user.id, current_user.username, -1),
+        )
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -301,51 +559,94 @@ async def delete_like_from_tweet(
     return dict()
 
 
-@app.get("/api/tweets", status_code=status.HTTP_200_OK)
+@router.get("/api/tweets", status_code=status.HTTP_200_OK)
 async def get_tweets(
+    request: Request,
     current_user: Annotated[User, "User model obtained from the api key"] = Depends(
         authenticate_user
     ),
     session: AsyncSession = Depends(async_get_db),
+    order: Literal["new", "top"] = "new",
+    limit: Annotated[Optional[int], Query(ge=1, le=TOP_FEED_MAX_PAGE_SIZE)] = None,
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    since_id: Annotated[Optional[int], Query(ge=0)] = None,
+    watermark: Annotated[Optional[int], Query(ge=0)] = None,
 ):
-    all_tweets = await get_all_tweets(session=session)
-    all_following_tweets = []
-    if all_tweets is None:
-        all_tweets = "No tweets found"
+    """
+    The feed, newest first, the whole of it or the newest `limit` tweets.
+    With order=top, a page of `limit` tweets ranked by likes, recency and
+    the user's affinity to their authors; next_cursor in the answer asks
+    for the next page with ?cursor=.
+
+    The ETag is built from version stamps only, so a client whose copy is
+    current gets 304 without the feed being read.
+
+    Polling clients pass since_id (the newest tweet they have) and get all
+    newer tweets, `limit` does not apply, with the watermark of their
+    previous answer (the full feed has one too) to also get tweets that
+    were committed after it with a smaller id, and the like counts and
+    deletions of older tweets (see database.changes). A tweet can then
+    arrive twice, clients keep the last copy.
+    """
+    if order == "new" and since_id is not None and watermark is None:
+        # Без водяного знака пропали бы твиты с меньшим id, закоммиченные
+        # после предыдущего ответа
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="since_id needs the watermark of the previous answer",
+        )
+    if order == "new" and watermark is not None:
+        changes = await get_tweet_changes(session, watermark)
+        # Твиты с id меньше since_id, закоммиченные позже него, приходят
+        # из журнала изменений
+        feed = await get_feed_items(
+            session, since_id=since_id, include_ids=changes.created
+        )
+        return Response(
+            content=encode_feed(feed, changes.as_dict()),
+            media_type="application/json",
+        )
+    if order == "new" and limit is not None and limit > FEED_MAX_PAGE_SIZE:
+        # Страница order=top строится из ограниченного числа кандидатов,
+        # хронологическая лента ограничена как остальные списки
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"limit of order=new is at most {FEED_MAX_PAGE_SIZE}",
+        )
+    feed_version = await get_version(session, FEED)
+    if order == "top":
+        limit = limit or TOP_FEED_PAGE_SIZE
+        # Ранжирование зависит и от подписок и лайков самого пользователя
+        user_version = await get_version(session, USER, current_user.id)
+        etag = make_etag("top", limit, cursor or "", feed_version, user_version)
+    elif limit is not None:
+        etag = make_etag(FEED, limit, feed_version)
     else:
-        for tweet in all_tweets:
-            single_tweet = dict()
-            single_tweet["id"] = tweet.id
-            single_tweet["content"] = tweet.tweet_data
-            single_tweet_media = []
-            for media in tweet.media:
-                single_tweet_media.append(media.media_path)
-            single_tweet["attachments"] = single_tweet_media
-            single_tweet_author = dict()
-
-            single_tweet_author["id"] = tweet.user_id
-            tweet_author = await get_user_by_id(tweet.user_id, session)
-            single_tweet_author["name"] = tweet_author.username
-            single_tweet["author"] = single_tweet_author
-
-            single_tweet_likes = []
-            for like in tweet.likes:
-                single_like = dict()
-                single_like["user_id"] = like.user_id
-                tweet_author = await get_user_by_id(like.user_id, session)
-                single_like["name"] = tweet_author.username
-                single_tweet_likes.append(single_like)
-            single_tweet["likes"] = single_tweet_likes
-
-            all_following_tweets.append(single_tweet)
-        all_tweets = all_following_tweets
-    answer = dict()
-    answer["result"] = True
-    answer["tweets"] = all_tweets
-    return JSONResponse(content=answer, status_code=200)
+        etag = make_etag(FEED, feed_version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    if order == "top":
+        tweet_ids, next_cursor = await get_top_tweet_ids(
+            session,
+            current_user.id,
+            limit,
+            cursor,
+            follow_boost=request.app.state.settings.top_feed_follow_boost,
+        )
+        feed = await get_feed_items(session, tweet_ids)
+        content = encode_feed(feed, {"next_cursor": next_cursor})
+    else:
+        # Водяной знак читается до ленты. После 304 у клиента остаётся
+        # прежний, более ранний знак: изменения придут повторно, не пропадут
+        current = await get_watermark(session)
+        feed = await get_feed_items(session, limit=limit)
+        content = encode_feed(feed, {"watermark": current})
+    response = Response(content=content, media_type="application/json")
+    return set_etag(response, etag)
 
 
-@app.get(
+@router.get(
     "/api/tweets/{user_id}",
     status_code=status.HTTP_200_OK,
     response_model=TweetOut,
@@ -356,17 +657,216 @@ async def get_following_tweets(
         authenticate_user
     ),
     session: AsyncSession = Depends(async_get_db),
+    since_id: Annotated[Optional[int], Query(ge=0)] = None,
+    watermark: Annotated[Optional[int], Query(ge=0)] = None,
+):
+    if since_id is not None and watermark is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="since_id needs the watermark of the previous answer",
+        )
+    if watermark is None:
+        current = await get_watermark(session)
+        all_tweets = await get_all_following_tweets(session=session, user_id=user_id)
+        return {"tweets": all_tweets, "watermark": current}
+    # Инкрементальный ответ: изменения только твитов авторов этой ленты
+    changes = await get_tweet_changes(
+        session, watermark, author_ids=home_feed_authors(user_id)
+    )
+    all_tweets = await get_all_following_tweets(
+        session=session,
+        user_id=user_id,
+        since_id=since_id,
+        include_ids=changes.created,
+    )
+    answer: Dict[str, Any] = dict()
+    answer["result"] = True
+    answer["tweets"] = serialize_tweets(all_tweets)
+    answer.update(changes.as_dict())
+    return JSONResponse(content=answer, status_code=200)
+
+
+@router.get("/api/search", status_code=status.HTTP_200_OK)
+async def search(
+    q: Annotated[str, Query(min_length=1, max_length=256)],
+    cursor: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=SEARCH_MAX_PAGE_SIZE)] = SEARCH_PAGE_SIZE,
+    current_user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    tweets, next_cursor = await search_tweets(
+        session=session,
+        q=q,
+        limit=limit,
+        cursor=cursor,
+        options=load_options("feed"),
+    )
+    answer: Dict[str, Any] = dict()
+    answer["result"] = True
+    answer["tweets"] = serialize_tweets(tweets)
+    answer["next_cursor"] = next_cursor
+    return JSONResponse(content=answer, status_code=200)
+
+
+@router.get("/api/tags/trending", status_code=status.HTTP_200_OK)
+async def get_trending_tags(
+    limit: Annotated[int, Query(ge=1, le=FEED_MAX_PAGE_SIZE)] = TRENDING_SIZE,
+    current_user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
 ):
-    all_tweets = await get_all_following_tweets(session=session, current_user=user_id)
+    await trending_tags.ensure_loaded(session)
+    answer: Dict[str, Any] = dict()
+    answer["result"] = True
+    answer["tags"] = [
+        {"tag": tag, "count": count} for tag, count in trending_tags.top(limit)
+    ]
+    return JSONResponse(content=answer, status_code=200)
+
+
+@router.get("/api/tags/{tag}", status_code=status.HTTP_200_OK)
+async def get_tag_tweets(
+    tag: str,
+    cursor: Optional[int] = None,
+    limit: Annotated[int, Query(ge=1, le=FEED_MAX_PAGE_SIZE)] = FEED_PAGE_SIZE,
+    current_user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    tweets, next_cursor = await get_tweets_by_tag(
+        session=session,
+        tag=tag.lstrip("#"),
+        limit=limit,
+        cursor=cursor,
+        options=load_options("feed"),
+    )
+    answer: Dict[str, Any] = dict()
+    answer["result"] = True
+    answer["tweets"] = serialize_tweets(tweets)
+    answer["next_cursor"] = next_cursor
+    return JSONResponse(content=answer, status_code=200)
+
+
+# ------------ 2.1 Stream ------------
+
+
+@router.websocket("/api/stream")
+async def stream_feed(
+    websocket: WebSocket,
+    session: AsyncSession = Depends(async_get_db),
+):
+    """
+    Push new tweets and like-count changes of followed users (and of the
+    user themselves). The api key is taken from the "api-key" header or,
+    for browsers, from the "api_key" query parameter.
+    """
+    api_key = websocket.headers.get("api-key") or websocket.query_params.get("api_key")
+    user = await get_user_by_api_key(api_key, session) if api_key else None
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    topics = await get_following_ids(session, user.id)
+    topics.append(user.id)
+    # Соединение с БД не держим всё время жизни сокета
+    await session.commit()
+
+    await websocket.accept()
+    subscription = feed_hub.subscribe(topics)
+
+    async def send_events():
+        while True:
+            await websocket.send_json(await subscription.get())
+
+    sender = asyncio.create_task(send_events())
+    try:
+        while True:
+            # Входящие сообщения (ping) игнорируются, ждём отключения клиента
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        feed_hub.unsubscribe(subscription)
+
+
+# ------------ 2.2 Export ------------
 
-    return {"tweets": all_tweets}
+ExportFormat = Annotated[str, Query(alias="format", pattern="^(ndjson|json)$")]
+
+
+@router.get("/api/users/me/export", status_code=status.HTTP_200_OK)
+async def export_my_tweets(
+    export_format: ExportFormat = "ndjson",
+    current_user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """Stream all tweets of the current user, oldest first"""
+    return export_response(
+        stream_tweets(session, user_id=current_user.id), export_format, "tweets"
+    )
+
+
+@router.get("/api/admin/tweets/export", status_code=status.HTTP_200_OK)
+async def export_all_tweets(
+    export_format: ExportFormat = "ndjson",
+    admin: Annotated[User, "User with an api key from ADMIN_API_KEYS"] = Depends(
+        authenticate_admin
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """Stream every tweet of every user, oldest first"""
+    return export_response(stream_tweets(session), export_format, "all_tweets")
+
+
+# ------------ 2.3 Profiles ------------
+
+
+@router.get("/api/admin/profiles", status_code=status.HTTP_200_OK)
+async def get_profiles(
+    request: Request,
+    admin: Annotated[User, "User with an api key from ADMIN_API_KEYS"] = Depends(
+        authenticate_admin
+    ),
+):
+    """Ids of the stored request profiles, newest first"""
+    profiles = await run_in_threadpool(
+        list_profiles, request.app.state.settings.profiles_path
+    )
+    return {"result": True, "profiles": profiles}
+
+
+@router.get("/api/admin/profiles/{profile_id}", status_code=status.HTTP_200_OK)
+async def download_profile(
+    request: Request,
+    profile_id: str,
+    admin: Annotated[User, "User with an api key from ADMIN_API_KEYS"] = Depends(
+        authenticate_admin
+    ),
+):
+    """Collapsed stacks of a profiled request, for flamegraph.pl or speedscope"""
+    path = profile_path(profile_id, request.app.state.settings.profiles_path)
+    if path is None or not path.exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile was not found!",
+        )
+    return FileResponse(path, media_type="text/plain", filename=path.name)
 
 
 # ------------ 3. Media ------------
 
 
-@app.post(
-    "/api/medias", status_code=status.HTTP_201_CREATED, response_model=MediaUpload
+@router.post(
+    "/api/medias",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("upload"))],
+    response_model=MediaUpload,
 )
 async def upload_media(
     file: UploadFile,
@@ -380,23 +880,159 @@ async def upload_media(
         new_media = Media(media_path=file)
         session.add(new_media)
         await session.commit()
+        await make_thumbnail.delay(media_path=file)
 
         return new_media
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
 
 
+def _upload_state(upload: UploadSession) -> Dict[str, Any]:
+    return {
+        "result": True,
+        "upload_id": upload.id,
+        "filename": upload.filename,
+        "size": upload.size,
+        "offset": upload.received,
+        "expires_at": upload.expires_at.isoformat(),
+        "media_id": upload.media_id,
+    }
+
+
+@router.post(
+    "/api/uploads",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("upload"))],
+)
+async def create_upload(
+    request: Request,
+    upload_in: UploadSessionIn,
+    user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """
+    Start a resumable upload of upload_in.size bytes. The file is sent with
+    PUT /api/uploads/{upload_id}?offset=N chunks and turned into a media
+    with POST /api/uploads/{upload_id}/finalize.
+    """
+    max_size = request.app.state.settings.upload_max_size
+    if upload_in.size > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"The upload is limited to {max_size} bytes",
+        )
+    upload = await create_upload_session(
+        session, user.id, upload_in.filename, upload_in.size
+    )
+    await create_part_file(upload.id)
+    await session.commit()
+    return _upload_state(upload)
+
+
+@router.get("/api/uploads/{upload_id}", status_code=status.HTTP_200_OK)
+async def get_upload(
+    upload_id: str,
+    user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """State of the upload: the offset to resume from"""
+    upload = await get_upload_session(session, upload_id, user.id)
+    return _upload_state(upload)
+
+
+@router.put("/api/uploads/{upload_id}", status_code=status.HTTP_200_OK)
+async def put_upload_chunk(
+    upload_id: str,
+    offset: Annotated[int, Query(ge=0)],
+    request: Request,
+    user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """
+    Append the request body at offset, which must be the current offset of
+    the upload. The body is streamed into the file without buffering and
+    without holding a database connection: the session is leased to this
+    request for UPLOAD_LEASE_SECONDS.
+    """
+    upload, token = await lease_upload_session(session, upload_id, user.id, offset)
+    await session.commit()
+    try:
+        written = await write_chunk(
+            upload.id, offset, request.stream(), upload.size - offset
+        )
+    except ChunkTooLarge as exc:
+        await release_upload_lease(session, upload.id, token)
+        await session.commit()
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc)
+        )
+    except Exception:
+        # Оборванную часть клиент пришлёт снова с того же offset
+        await release_upload_lease(session, upload.id, token)
+        await session.commit()
+        raise
+    upload = await commit_upload_chunk(session, upload.id, token, offset, written)
+    await session.commit()
+    return _upload_state(upload)
+
+
+@router.post(
+    "/api/uploads/{upload_id}/finalize",
+    status_code=status.HTTP_201_CREATED,
+    response_model=MediaUpload,
+)
+async def finalize_upload(
+    upload_id: str,
+    user: Annotated[User, "User model obtained from the api key"] = Depends(
+        authenticate_user
+    ),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """Turn a completely received upload into a media, repeatable"""
+    upload = await get_upload_session(session, upload_id, user.id, lock=True)
+    if upload.media_id is not None:
+        return {"id": upload.media_id}
+    if upload.received != upload.size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Received {upload.received} of {upload.size} bytes",
+            headers={"Upload-Offset": str(upload.received)},
+        )
+    media_path = await finish_part_file(upload.id, upload.filename)
+    try:
+        new_media = Media(media_path=media_path)
+        session.add(new_media)
+        await session.flush()
+        upload.media_id = new_media.id
+        await session.commit()
+    except Exception:
+        # Без строки Media файл никому не принадлежит: он снова становится
+        # частью загрузки, повторный finalize её найдёт
+        await restore_part_file(upload.id, media_path)
+        raise
+    await make_thumbnail.delay(media_path=media_path)
+    return new_media
+
+
 # ------------ 4. SPA CATCH-ALL ------------
-# ДОЛЖЕН идти ПОСЛЕ app.mount("/static")
+# ДОЛЖЕН идти последним: create_app монтирует /static раньше роутера
 
 
-@app.get("/{full_path:path}")
-async def serve_spa(full_path: str):
+@router.get("/{full_path:path}")
+async def serve_spa(full_path: str, if_none_match: Optional[str] = Header(None)):
     # catch-all отдаёт SPA index.html только если путь **не начинается с /static или /api**
     if full_path.startswith(("server", "static")):
         return JSONResponse(status_code=404, content={"detail": "Not Found"})
-    return FileResponse(STATIC_DIR / "index.html")
+    return spa_index.response(if_none_match)
 
 
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="127.0.0.1", port=8000, reload=True)
+    from serve import main
+
+    main()
@@ -0,0 +1,60 @@
+"""
+Bandwidth and latency of compressing GET /api/tweets pages.
+
+For typical page sizes and every available encoding (utils.compression)
+prints the body size, the compression ratio, the time to compress one
+page and the time to send it over a link of LINK_MBITS, with and without
+compression. Pages below COMPRESSION_MIN_SIZE are not compressed by the
+middleware, pages from COMPRESSION_THREADPOOL_SIZE are compressed in the
+thread pool. Run from the project root:
+    python -m benchmarks.feed_compression
+"""
+
+import time
+from typing import Callable
+
+from benchmarks.feed_memory import after, make_rows
+from utils.compression import COMPRESSORS, compress
+from utils.setting import COMPRESSION_LEVELS
+
+PAGE_SIZES = (10, 50, 200, 1000, 10_000)
+# Мобильная сеть по умолчанию
+LINK_MBITS = 20
+REPEAT = 20
+
+
+def best_time(func: Callable, repeat: int = REPEAT) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def transfer_ms(size: int, mbits: float = LINK_MBITS) -> float:
+    return size * 8 / (mbits * 1_000_000) * 1000
+
+
+def main():
+    print(f"link {LINK_MBITS} Mbit/s, levels {COMPRESSION_LEVELS}")
+    for page_size in PAGE_SIZES:
+        body = after(make_rows(page_size))
+        print(
+            f"{page_size:>6} tweets: {len(body) / 1024:9.1f} KiB identity, "
+            f"send {transfer_ms(len(body)):8.2f} ms"
+        )
+        for encoding in COMPRESSORS:
+            compressed = compress(body, encoding)
+            seconds = best_time(lambda: compress(body, encoding))
+            print(
+                f"{encoding:>13}: {len(compressed) / 1024:9.1f} KiB "
+                f"x{len(body) / len(compressed):5.1f}, "
+                f"compress {seconds * 1000:7.2f} ms, "
+                f"send {transfer_ms(len(compressed)):8.2f} ms, "
+                f"total {seconds * 1000 + transfer_ms(len(compressed)):8.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
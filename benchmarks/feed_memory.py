@@ -0,0 +1,118 @@
+"""
+Peak memory of serializing one 10k-tweet page of GET /api/tweets.
+
+before: ORM objects -> dicts (utils.feed.serialize_tweets) -> JSONResponse
+after:  SELECT tuples -> FeedItem -> utils.feed.encode_feed
+
+Loading the ORM objects themselves is not measured, only the work done on
+already fetched data, so the real saving is larger. Run from the project
+root:
+    python -m benchmarks.feed_memory
+"""
+
+import gc
+import tracemalloc
+from typing import Callable, List, Tuple
+
+from fastapi.responses import JSONResponse
+
+from database.models import Like, Media, Tweet, User
+from database.utils import FeedItem
+from utils.feed import encode_feed, serialize_tweets
+
+PAGE_SIZE = 10_000
+
+
+def make_rows(size: int):
+    """Rows as returned by the three queries of get_feed_items"""
+    tweets = [
+        (
+            tweet_id,
+            f"Tweet number {tweet_id} #benchmark",
+            tweet_id % 50,
+            f"user{tweet_id % 50}",
+        )
+        for tweet_id in range(size, 0, -1)
+    ]
+    media = [(tweet_id, f"{tweet_id}.png") for tweet_id in range(1, size + 1, 3)]
+    likes = [
+        (tweet_id, user_id, f"user{user_id}")
+        for tweet_id in range(1, size + 1, 2)
+        for user_id in range(3)
+    ]
+    return tweets, media, likes
+
+
+def make_orm_tweets(rows) -> List[Tweet]:
+    tweet_rows, media_rows, like_rows = rows
+    users = {}
+
+    def user(user_id: int, name: str) -> User:
+        if user_id not in users:
+            users[user_id] = User(id=user_id, username=name, api_key="")
+        return users[user_id]
+
+    tweets = {}
+    for tweet_id, content, author_id, author_name in tweet_rows:
+        tweets[tweet_id] = Tweet(
+            id=tweet_id,
+            tweet_data=content,
+            user_id=author_id,
+            user=user(author_id, author_name),
+            media=[],
+            likes=[],
+        )
+    for tweet_id, path in media_rows:
+        tweets[tweet_id].media.append(Media(media_path=path, tweet_id=tweet_id))
+    for tweet_id, user_id, name in like_rows:
+        tweets[tweet_id].likes.append(
+            Like(user_id=user_id, tweet_id=tweet_id, user=user(user_id, name))
+        )
+    return list(tweets.values())
+
+
+def before(tweets: List[Tweet]) -> bytes:
+    content = {"result": True, "tweets": serialize_tweets(tweets)}
+    return JSONResponse(content=content).body
+
+
+def after(rows) -> bytes:
+    tweet_rows, media_rows, like_rows = rows
+    items = [FeedItem(*row) for row in tweet_rows]
+    by_id = {item.id: item for item in items}
+    for tweet_id, path in media_rows:
+        item = by_id[tweet_id]
+        if item.attachments is None:
+            item.attachments = []
+        item.attachments.append(path)
+    for tweet_id, user_id, name in like_rows:
+        item = by_id[tweet_id]
+        if item.likes is None:
+            item.likes = []
+        item.likes.append((user_id, name))
+    return encode_feed(items)
+
+
+def measure(func: Callable, arg) -> Tuple[int, int]:
+    """(peak bytes allocated while running, size of the body)"""
+    gc.collect()
+    tracemalloc.start()
+    body = func(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, len(body)
+
+
+def main():
+    rows = make_rows(PAGE_SIZE)
+    tweets = make_orm_tweets(rows)
+    for name, func, arg in (("before", before, tweets), ("after", after, rows)):
+        peak, size = measure(func, arg)
+        print(
+            f"{name:>6}: peak {peak / 2**20:6.2f} MiB, "
+            f"{peak / PAGE_SIZE:7.0f} B/tweet, body {size / 2**20:.2f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Python-side cost of one call of the hot queries of database.utils.
+
+before: select() with loader options built on every call
+after:  statements built once, values passed as bind parameters
+The feed compares ORM objects with loader options against the plain
+tuples of get_feed_items.
+
+The queries run against an in-memory SQLite database, so the time is
+mostly SQLAlchemy work (building the statement, its cache key, ORM
+loading) and not the database. Run from the project root:
+    python -m benchmarks.query_overhead
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from database.models import Base, Like, Tweet, User
+from database.utils import (
+    get_feed_items,
+    get_like_by_id,
+    get_user_by_api_key,
+    get_user_by_id,
+    load_options,
+)
+
+CALLS = 2000
+
+
+async def before_user_by_api_key(session: AsyncSession, api_key: str):
+    query = (
+        select(User)
+        .where(User.api_key == api_key, User.deleted_at.is_(None))
+        .options(*load_options("auth"))
+    )
+    return (await session.execute(query)).scalar_one_or_none()
+
+
+async def before_user_by_id(session: AsyncSession, user_id: int):
+    query = (
+        select(User)
+        .where(User.id == user_id, User.deleted_at.is_(None))
+        .options(*load_options("auth"))
+    )
+    return (await session.execute(query)).scalars().one_or_none()
+
+
+async def before_like_by_id(session: AsyncSession, tweet_id: int, user_id: int):
+    query = select(Like).where(Like.user_id == user_id, Like.tweet_id == tweet_id)
+    return (await session.execute(query)).scalar_one_or_none()
+
+
+async def before_feed(session: AsyncSession):
+    query = (
+        select(Tweet)
+        .where(Tweet.deleted_at.is_(None))
+        .options(*load_options("feed"))
+        .order_by(desc(Tweet.create_date), desc(Tweet.id))
+    )
+    return (await session.execute(query)).scalars().all()
+
+
+async def per_call(session: AsyncSession, call: Callable[[], Awaitable]) -> float:
+    """Microseconds per call, after a warm-up call"""
+    await call()
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        await call()
+        session.expunge_all()
+    return (time.perf_counter() - start) / CALLS * 1_000_000
+
+
+async def main():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        user = User(api_key="benchmark", username="benchmark")
+        session.add(user)
+        await session.flush()
+        tweet = Tweet(tweet_data="benchmark", user_id=user.id)
+        session.add(tweet)
+        await session.flush()
+        session.add(Like(user_id=user.id, tweet_id=tweet.id))
+        await session.commit()
+        user_id, tweet_id = user.id, tweet.id
+
+        cases = (
+            (
+                "get_user_by_api_key",
+                lambda: before_user_by_api_key(session, "benchmark"),
+                lambda: get_user_by_api_key("benchmark", session),
+            ),
+            (
+                "get_user_by_id",
+                lambda: before_user_by_id(session, user_id),
+                lambda: get_user_by_id(user_id, session),
+            ),
+            (
+                "get_like_by_id",
+                lambda: before_like_by_id(session, tweet_id, user_id),
+                lambda: get_like_by_id(session, tweet_id, user_id),
+            ),
+            (
+                "get_feed_items",
+                lambda: before_feed(session),
+                lambda: get_feed_items(session),
+            ),
+        )
+        for name, before, after in cases:
+            before_us = await per_call(session, before)
+            after_us = await per_call(session, after)
+            print(
+                f"{name:>20}: before {before_us:7.1f} us, "
+                f"after {after_us:7.1f} us, x{before_us / after_us:.2f}"
+            )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,206 @@
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import BigInteger, Text, cast, delete, func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.setting import TWEET_CHANGES_LIMIT
+
+from .database import get_database_settings
+from .models import Tweet, change_versions, tweet_changes, tweet_scores
+from .versions import get_version
+
+CREATED = "created"
+LIKES = "likes"
+DELETED = "deleted"
+# Граница удалённой части журнала, хранится в change_versions
+TRIMMED = "tweet-changes-trim"
+
+# Строка журнала становится видна при коммите своей транзакции, а порядок
+# коммитов не совпадает ни с id строк, ни со временем их записи. Все
+# транзакции с xid меньше xmin текущего снимка уже завершены, поэтому
+# строки ниже этой границы больше не появятся и её можно отдать клиенту
+# водяным знаком
+CURRENT_XID = cast(cast(func.pg_current_xact_id(), Text), BigInteger)
+SNAPSHOT_XMIN = cast(
+    cast(func.pg_snapshot_xmin(func.pg_current_snapshot()), Text), BigInteger
+)
+
+
+@dataclass
+class TweetChanges:
+    """
+    Changes since a client's watermark. Created tweets are not part of
+    as_dict(): the caller sends them with the new tweets.
+    """
+
+    watermark: int
+    created: List[int] = field(default_factory=list)
+    likes: Dict[int, int] = field(default_factory=dict)
+    deleted: List[int] = field(default_factory=list)
+    resync: bool = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "watermark": self.watermark,
+            "resync": self.resync,
+            "changes": {
+                "likes": [
+                    {"id": tweet_id, "likes": likes}
+                    for tweet_id, likes in self.likes.items()
+                ],
+                "deleted": self.deleted,
+            },
+        }
+
+
+async def log_tweet_changes(
+    session: AsyncSession, kind: str, tweets: Iterable[Tuple[int, int]]
+):
+    """Log (tweet id, author id) changes in the current transaction"""
+    rows = [
+        {"tweet_id": tweet_id, "user_id": user_id, "kind": kind}
+        for tweet_id, user_id in sorted(set(tweets))
+    ]
+    if rows:
+        await session.execute(tweet_changes.insert().values(xid=CURRENT_XID), rows)
+
+
+async def log_deleted_tweets_of_user(session: AsyncSession, user_id: int):
+    """Log the deletion of every live tweet of the user, before marking them"""
+    await session.execute(
+        tweet_changes.insert().from_select(
+            ["tweet_id", "user_id", "kind", "xid"],
+            select(Tweet.id, Tweet.user_id, literal(DELETED), CURRENT_XID).where(
+                Tweet.user_id == user_id, Tweet.deleted_at.is_(None)
+            ),
+        )
+    )
+
+
+async def get_watermark(session: AsyncSession) -> int:
+    """
+    The watermark to send with a full feed. Read before the feed: every
+    transaction below it has committed, so the feed read afterwards has
+    its tweets, the later ones are reported as changes after it.
+    """
+    return await session.scalar(select(SNAPSHOT_XMIN))
+
+
+async def get_tweet_changes(
+    session: AsyncSession,
+    watermark: Optional[int],
+    author_ids=None,
+    limit: int = TWEET_CHANGES_LIMIT,
+) -> TweetChanges:
+    """
+    New tweets, like counts and deletions logged after the watermark,
+    optionally only for tweets of author_ids (a list or a subquery).
+    Without a watermark only the current one is returned. When the client
+    is too far behind (more than limit changes, or the log was trimmed
+    past its watermark) the result asks it to refetch the feed instead.
+
+    The watermark is a transaction id: the client has the changes of every
+    transaction below it. Changes are read up to the xmin of the current
+    snapshot, so a change of a transaction that is still running, however
+    long, is reported by a later request, once it has committed.
+    """
+    xmin = await get_watermark(session)
+    if watermark is None:
+        return TweetChanges(watermark=xmin)
+    if watermark < await get_version(session, TRIMMED):
+        return TweetChanges(watermark=max(xmin, watermark), resync=True)
+    if watermark >= xmin:
+        return TweetChanges(watermark=watermark)
+
+    query = (
+        select(tweet_changes.c.tweet_id, tweet_changes.c.kind)
+        .where(tweet_changes.c.xid >= watermark, tweet_changes.c.xid < xmin)
+        .order_by(tweet_changes.c.id)
+        .limit(limit + 1)
+    )
+    if author_ids is not None:
+        query = query.where(tweet_changes.c.user_id.in_(author_ids))
+    rows = (await session.execute(query)).all()
+    if len(rows) > limit:
+        return TweetChanges(watermark=xmin, resync=True)
+
+    deleted = list(
+        dict.fromkeys(tweet_id for tweet_id, kind in rows if kind == DELETED)
+    )
+    created = [
+        tweet_id
+        for tweet_id in dict.fromkeys(
+            tweet_id for tweet_id, kind in rows if kind == CREATED
+        )
+        if tweet_id not in deleted
+    ]
+    liked = {tweet_id for tweet_id, kind in rows if kind == LIKES} - set(deleted)
+    likes: Dict[int, int] = dict()
+    if liked:
+        query = await session.execute(
+            select(tweet_scores.c.tweet_id, tweet_scores.c.likes)
+            .where(tweet_scores.c.tweet_id.in_(liked))
+            .order_by(tweet_scores.c.tweet_id)
+        )
+        likes = dict(query.all())
+    return TweetChanges(watermark=xmin, created=created, likes=likes, deleted=deleted)
+
+
+async def trim_tweet_changes(
+    session: AsyncSession,
+    retention_seconds: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> int:
+    """
+    Delete log rows older than retention_seconds in chunks and remember
+    the transaction after the last deleted one, so clients behind it are
+    told to resync.
+
+    Returns:
+        int: The number of deleted rows.
+    """
+    settings = get_database_settings()
+    if retention_seconds is None:
+        retention_seconds = settings.tweet_changes_retention
+    batch_size = batch_size or settings.purge_batch_size
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    deleted = 0
+    while True:
+        chunk = (
+            select(tweet_changes.c.id)
+            .where(
+                tweet_changes.c.create_date
+                < func.now() - timedelta(seconds=retention_seconds)
+            )
+            .order_by(tweet_changes.c.id)
+            .limit(batch_size)
+        )
+        result = await session.execute(
+            delete(tweet_changes)
+            .where(tweet_changes.c.id.in_(chunk))
+            .returning(tweet_changes.c.xid)
+        )
+        xids = list(result.scalars())
+        # Строки журнала, записанные до появления xid, его не имеют
+        trimmed = [xid for xid in xids if xid is not None]
+        if trimmed:
+            insert = dialect.insert(change_versions).values(
+                scope=TRIMMED, scope_id=0, shard=0, version=max(trimmed) + 1
+            )
+            await session.execute(
+                insert.on_conflict_do_update(
+                    index_elements=["scope", "scope_id", "shard"],
+                    set_={
+                        "version": func.greatest(
+                            change_versions.c.version, insert.excluded.version
+                        )
+                    },
+                )
+            )
+        await session.commit()
+        deleted += len(xids)
+        if len(xids) < batch_size:
+            return deleted
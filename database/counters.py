@@ -0,0 +1,137 @@
+import random
+from typing import Dict, Mapping, Optional, Tuple
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import get_database_settings
+from .models import Like, Tweet, user_counters, user_to_user
+from .versions import bump_versions
+
+COUNTERS = ("followers", "following", "tweets", "likes")
+
+# Ключ pg_advisory_xact_lock: сверка не должна идти в двух процессах сразу
+RECONCILE_LOCK_KEY = 0x75736572
+
+Deltas = Mapping[Tuple[int, str], int]
+
+
+def _upsert_adding(session: AsyncSession, statement=None):
+    """INSERT into user_counters that adds to the value of an existing shard"""
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    insert = dialect.insert(user_counters)
+    if statement is not None:
+        insert = insert.from_select(["user_id", "name", "shard", "value"], statement)
+    return insert.on_conflict_do_update(
+        index_elements=["user_id", "name", "shard"],
+        set_={"value": user_counters.c.value + insert.excluded.value},
+    )
+
+
+async def add_to_counters(
+    session: AsyncSession, deltas: Deltas, shards: Optional[int] = None
+):
+    """
+    Add (user id, counter name) -> delta in the current transaction.
+
+    Every delta goes to a random shard row (one of counter_shards of the
+    settings by default), so concurrent likes or follows of one popular
+    user rarely wait for the same row lock.
+    """
+    if shards is None:
+        shards = get_database_settings().counter_shards
+    rows = [
+        {
+            "user_id": user_id,
+            "name": name,
+            "shard": random.randrange(shards),
+            "value": delta,
+        }
+        for (user_id, name), delta in deltas.items()
+        if delta
+    ]
+    if not rows:
+        return
+    # Одинаковый порядок блокировок в разных транзакциях
+    rows.sort(key=lambda row: (row["user_id"], row["name"], row["shard"]))
+    await session.execute(_upsert_adding(session), rows)
+    # Счётчики входят в профиль, поэтому меняют и его версию (ETag)
+    await bump_versions(session, user_ids={row["user_id"] for row in rows})
+
+
+async def get_counters(session: AsyncSession, user_id: int) -> Dict[str, int]:
+    query = await session.execute(
+        select(user_counters.c.name, func.sum(user_counters.c.value))
+        .where(user_counters.c.user_id == user_id)
+        .group_by(user_counters.c.name)
+    )
+    counters = dict.fromkeys(COUNTERS, 0)
+    counters.update((name, int(value)) for name, value in query)
+    return counters
+
+
+def _true_counts():
+    """
+    Exact (user_id, value) of every counter, computed from the tables.
+    Soft-deleted tweets no longer count, their likes do until the purge
+    deletes them.
+    """
+    return {
+        "followers": select(
+            user_to_user.c.following_id.label("user_id"), func.count().label("value")
+        ).group_by(user_to_user.c.following_id),
+        "following": select(
+            user_to_user.c.follower_id.label("user_id"), func.count().label("value")
+        ).group_by(user_to_user.c.follower_id),
+        "tweets": select(Tweet.user_id.label("user_id"), func.count().label("value"))
+        .where(Tweet.deleted_at.is_(None))
+        .group_by(Tweet.user_id),
+        "likes": select(Tweet.user_id.label("user_id"), func.count().label("value"))
+        .join(Like, Like.tweet_id == Tweet.id)
+        .group_by(Tweet.user_id),
+    }
+
+
+async def reconcile_counters(session: AsyncSession) -> int:
+    """
+    Correct counter drift against user_to_user, tweets and likes.
+
+    For every counter a single INSERT ... SELECT compares the exact counts
+    with the sums of the shards and adds the difference to shard 0. Both
+    sides are read from the same statement snapshot, so increments that
+    commit meanwhile are not counted twice. The caller commits.
+
+    Returns:
+        int: The number of corrected counters.
+    """
+    if session.bind.dialect.name == "postgresql":
+        await session.execute(select(func.pg_advisory_xact_lock(RECONCILE_LOCK_KEY)))
+    corrected = 0
+    for name, true_counts in _true_counts().items():
+        truth = true_counts.subquery()
+        current = (
+            select(
+                user_counters.c.user_id,
+                func.sum(user_counters.c.value).label("value"),
+            )
+            .where(user_counters.c.name == name)
+            .group_by(user_counters.c.user_id)
+            .subquery()
+        )
+        difference = func.coalesce(truth.c.value, 0) - func.coalesce(current.c.value, 0)
+        differences = (
+            select(
+                func.coalesce(truth.c.user_id, current.c.user_id),
+                literal(name),
+                literal(0),
+                difference,
+            )
+            .select_from(
+                truth.join(current, truth.c.user_id == current.c.user_id, full=True)
+            )
+            .where(difference != 0)
+        )
+        result = await session.execute(_upsert_adding(session, differences))
+        corrected += result.rowcount
+    return corrected
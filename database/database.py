@@ -1,13 +1,16 @@
-import os
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
-from dotenv import load_dotenv
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import (
+    AsyncAttrs,
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 
-load_dotenv("app.env")  # для локальной разработки
+from utils.setting import Settings, get_settings
 
 
 class Base(AsyncAttrs, DeclarativeBase):
@@ -16,19 +19,60 @@ class Base(AsyncAttrs, DeclarativeBase):
         return f"<{self.__class__.__name__} {fields_str}>"
 
 
-DATABASE_URL = (
-    f'postgresql+asyncpg://{os.environ.get("POSTGRES_USER")}:'  # <--- здесь
-    f'{os.environ.get("POSTGRES_PASSWORD")}@{os.environ.get("DB_HOST")}'
-    f':{os.environ.get("DB_PORT")}/{os.environ.get("POSTGRES_DB")}'  # <--- здесь
-)
+# Движок создаётся при старте приложения (app.create_app) или при первом
+# обращении, а не при импорте: импорт не загружает драйвер и не читает
+# окружение, а тесты и воркеры подставляют свои настройки
+_engine: Optional[AsyncEngine] = None
+_sessionmaker: Optional[async_sessionmaker] = None
+_settings: Optional[Settings] = None
+
+
+def configure_database(settings: Settings) -> AsyncEngine:
+    """
+    Create the engine and the session maker from the settings. The
+    database functions take their defaults (counter shards, batch sizes,
+    retention...) from the same settings, see get_database_settings().
+    """
+    global _engine, _sessionmaker, _settings
+    _settings = settings
+    _engine = create_async_engine(
+        settings.database_url,
+        echo=settings.database_echo,
+        connect_args={"prepared_statement_cache_size": settings.statement_cache_size},
+    )
+    _sessionmaker = async_sessionmaker(
+        _engine, class_=AsyncSession, expire_on_commit=False
+    )
+    return _engine
+
+
+def get_engine() -> AsyncEngine:
+    """The engine, created from get_settings() if nothing configured it"""
+    if _engine is None:
+        configure_database(get_settings())
+    return _engine
+
+
+def get_database_settings() -> Settings:
+    """The settings the engine was configured with"""
+    get_engine()
+    return _settings
+
+
+def async_session() -> AsyncSession:
+    """A new session of the application engine"""
+    get_engine()
+    return _sessionmaker()
+
 
-print(DATABASE_URL + "+++++++++++++++++++++++++++++++++++++++")
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
-session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+async def dispose_database():
+    """Close the pooled connections, the engine stays usable"""
+    if _engine is not None:
+        await _engine.dispose()
 
 
 async def async_get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with session() as db:
+    async with async_session() as db:
         try:
             yield db
             await db.commit()
@@ -2,17 +2,24 @@ import asyncio
 
 from sqlalchemy.exc import IntegrityError
 
-from .database import Base, engine, session
+from .database import Base, async_session, get_engine
+from .migrations import upgrade_schema
 from .models import Like, Media, Tweet, User, user_to_user
+from .partitions import ensure_partitions
 
 
 async def create_db_models():
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # Новые столбцы и индексы существующих таблиц
+        await conn.run_sync(upgrade_schema)
+    # Секции текущего месяца должны появиться раньше первого твита
+    async with async_session() as db:
+        await ensure_partitions(db)
 
 
 async def seed():
-    async with session() as db:
+    async with async_session() as db:
         try:
             # --- USERS ---
             u1 = User(username="testov", api_key="test")
@@ -71,8 +78,12 @@ async def seed():
             await db.refresh(t3)
 
             # --- LIKES ---
-            like1 = Like(user_id=u1.id, tweet_id=t1.id)
-            like2 = Like(user_id=u1.id, tweet_id=t2.id)
+            like1 = Like(
+                user_id=u1.id, tweet_id=t1.id, tweet_create_date=t1.create_date
+            )
+            like2 = Like(
+                user_id=u1.id, tweet_id=t2.id, tweet_create_date=t2.create_date
+            )
 
             db.add_all([like1, like2])
             await db.commit()
@@ -0,0 +1,87 @@
+"""
+PostgreSQL advisory locks shared by the worker processes of the app.
+
+Every uvicorn worker runs the lifespan of its own application. Schema
+creation and seeding take advisory_lock(SCHEMA_LOCK_KEY), so the workers
+run them one after another instead of racing in CREATE TABLE. Periodic
+jobs are scheduled by a single process: run_as_leader() keeps trying to
+take SCHEDULER_LOCK_KEY and runs the schedules while it holds it. The
+lock belongs to a database connection, so when the leader dies another
+worker takes over at its next attempt.
+
+On other databases (SQLite) there is a single process and the locks are
+always granted.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .database import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Ключи pg_advisory_lock, общие для всех процессов приложения
+SCHEMA_LOCK_KEY = 7_301_001
+SCHEDULER_LOCK_KEY = 7_301_002
+
+
+def _is_postgres(conn: AsyncConnection) -> bool:
+    return conn.dialect.name == "postgresql"
+
+
+@asynccontextmanager
+async def advisory_lock(key: int) -> AsyncIterator[None]:
+    """Wait for the lock and hold it inside the block"""
+    async with get_engine().connect() as conn:
+        if not _is_postgres(conn):
+            yield
+            return
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key})
+        await conn.commit()
+        try:
+            yield
+        finally:
+            # Блокировка сеанса иначе осталась бы на соединении в пуле
+            await conn.invalidate()
+
+
+async def run_as_leader(
+    key: int,
+    on_elected: Callable[[], None],
+    on_deposed: Callable[[], None],
+    retry: float,
+):
+    """
+    Call on_elected once this process holds the lock and on_deposed when
+    it loses it (its connection fails or the task is cancelled). Another
+    attempt is made every retry seconds. Runs until cancelled.
+    """
+    while True:
+        try:
+            async with get_engine().connect() as conn:
+                elected = not _is_postgres(conn) or await conn.scalar(
+                    text("SELECT pg_try_advisory_lock(:key)"), {"key": key}
+                )
+                await conn.commit()
+                if elected:
+                    logger.info("Elected to run the periodic jobs")
+                    on_elected()
+                    try:
+                        while True:
+                            await asyncio.sleep(retry)
+                            # Блокировка жива, пока живо соединение
+                            await conn.execute(text("SELECT 1"))
+                            await conn.commit()
+                    finally:
+                        on_deposed()
+                        await conn.invalidate()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Lost the connection holding lock %s", key)
+        await asyncio.sleep(retry)
@@ -0,0 +1,98 @@
+"""
+Schema changes for databases created by an older version of the app.
+
+Base.metadata.create_all() only creates missing tables: columns and
+indexes added to the models of an existing table (tweets.deleted_at,
+users.deleted_at, likes.tweet_create_date, media.create_date...) never
+reach a database that lives on a persistent volume. upgrade_schema()
+compares the models with the database and adds what is missing, so it
+is safe to run on every startup. Columns are only added, never altered
+or dropped. Foreign keys whose ON DELETE differs from the models (the
+cascades account deletion relies on) are dropped and added again.
+"""
+
+import logging
+from typing import Any, Dict, List
+
+from sqlalchemy import ForeignKeyConstraint, Table, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
+
+from .database import Base
+
+logger = logging.getLogger(__name__)
+
+# Заполнение добавленного столбца у уже существующих строк
+BACKFILL: Dict[str, str] = {
+    "likes.tweet_create_date": (
+        "UPDATE likes SET tweet_create_date = tweets.create_date "
+        "FROM tweets WHERE tweets.id = likes.tweet_id"
+    ),
+}
+
+
+def _on_delete(action: Any) -> str:
+    return (action or "NO ACTION").upper()
+
+
+def _model_foreign_key(table: Table, reflected: Dict[str, Any]):
+    """The foreign key of the models the reflected one stands for"""
+    for constraint in table.foreign_key_constraints:
+        if (
+            constraint.referred_table.name == reflected["referred_table"]
+            and constraint.column_keys == reflected["constrained_columns"]
+        ):
+            return constraint
+    return None
+
+
+def _recreate_foreign_key(
+    conn: Connection, table: Table, name: str, constraint: ForeignKeyConstraint
+):
+    columns = ", ".join(constraint.column_keys)
+    referred = ", ".join(element.column.name for element in constraint.elements)
+    conn.execute(
+        text(
+            f"ALTER TABLE {table.name} DROP CONSTRAINT {name}, "
+            f"ADD CONSTRAINT {name} FOREIGN KEY ({columns}) "
+            f"REFERENCES {constraint.referred_table.name} ({referred}) "
+            f"ON DELETE {_on_delete(constraint.ondelete)}"
+        )
+    )
+    logger.info("Recreated foreign key %s.%s", table.name, name)
+
+
+def upgrade_schema(conn: Connection) -> List[str]:
+    """
+    Adds the missing columns and indexes of the existing tables and
+    recreates foreign keys whose ON DELETE differs from the models, for
+    conn.run_sync() after create_all(). Returns the added columns as
+    table.column.
+    """
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            spec = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {spec}"))
+            name = f"{table.name}.{column.name}"
+            if name in BACKFILL:
+                conn.execute(text(BACKFILL[name]))
+            logger.info("Added column %s", name)
+            added.append(name)
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+        for reflected in inspector.get_foreign_keys(table.name):
+            constraint = _model_foreign_key(table, reflected)
+            if constraint is None:
+                continue
+            on_delete = _on_delete(reflected["options"].get("ondelete"))
+            if on_delete != _on_delete(constraint.ondelete):
+                _recreate_foreign_key(conn, table, reflected["name"], constraint)
+    return added
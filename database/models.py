@@ -1,17 +1,65 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from sqlalchemy import Column, ForeignKey, Integer, String, Table, func
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Index,
+    Integer,
+    Sequence,
+    SmallInteger,
+    String,
+    Table,
+    event,
+    func,
+    text,
+)
+from sqlalchemy.orm import Mapped, backref, foreign, mapped_column, relationship
+
+from utils.setting import SEARCH_TS_CONFIG, TWEETS_PARTITIONED
 
 from .database import Base
 
+
+# При секционировании (TWEETS_PARTITIONED) первичный ключ tweets - (id,
+# create_date), а уникального индекса только по id нет. Ссылаться на твит
+# внешним ключом могут лишь likes (по обоим столбцам), для остальных таблиц
+# строки удаляет database.purge.
+def _tweet_fk() -> tuple:
+    if TWEETS_PARTITIONED:
+        return ()
+    return (ForeignKey("tweets.id", ondelete="CASCADE"),)
+
+
+def _partition_by(column: str) -> dict:
+    if TWEETS_PARTITIONED:
+        return {"postgresql_partition_by": f"RANGE ({column})"}
+    return {}
+
+
 # User
 user_to_user = Table(
     "user_to_user",
     Base.metadata,
-    Column("follower_id", Integer, ForeignKey("users.id"), primary_key=True),
-    Column("following_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column(
+        "follower_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "following_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    # Подписчики пользователя; подписки покрывает первичный ключ
+    Index("ix_user_to_user_following_id", "following_id"),
 )
 
 
@@ -21,12 +69,24 @@ class User(Base):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, index=True)
     api_key: Mapped[str] = mapped_column(String(255))
     username: Mapped[str] = mapped_column(String(255), unique=True, index=True)
+    # Удалённый аккаунт сразу перестаёт проходить авторизацию, его данные
+    # удаляет фоновая задача (database.purge.purge_user)
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(default=None)
 
+    # Связи не загружаются неявно: каждый запрос указывает нужные
+    # через database.utils.load_options(), иначе обращение вызовет ошибку.
+    # Зависимые строки удаляет база (ON DELETE CASCADE), а не ORM
     tweets: Mapped[List["Tweet"]] = relationship(
-        backref="user", cascade="all, delete-orphan"
+        backref=backref("user", lazy="raise"),
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="raise",
     )
     likes: Mapped[List["Like"]] = relationship(
-        backref="user", cascade="all, delete-orphan"
+        backref=backref("user", lazy="raise"),
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="raise",
     )
 
     following: Mapped[List["None"]] = relationship(
@@ -34,8 +94,9 @@ class User(Base):
         secondary=user_to_user,
         primaryjoin=lambda: User.id == user_to_user.c.follower_id,
         secondaryjoin=lambda: User.id == user_to_user.c.following_id,
-        backref="followers",
-        lazy="selectin",
+        backref=backref("followers", lazy="raise", passive_deletes=True),
+        passive_deletes=True,
+        lazy="raise",
     )
 
     def __repr__(self):
@@ -51,11 +112,52 @@ class Tweet(Base):
     __tablename__ = "tweets"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, index=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
-    create_date: Mapped[datetime] = mapped_column(server_default=func.now())
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), index=True
+    )
+    create_date: Mapped[datetime] = mapped_column(
+        server_default=func.now(), primary_key=TWEETS_PARTITIONED
+    )
     tweet_data: Mapped[str] = mapped_column(String(2500))
-    media: Mapped[List["Media"]] = relationship(backref="tweets", cascade="all, delete")
-    likes: Mapped[List["Like"]] = relationship(backref="tweets", cascade="all, delete")
+    # Удалённый твит сначала только помечается, строки лайков, медиа и
+    # файлы удаляет фоновая задача (database.purge)
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(default=None)
+    # Лайки и медиа удаляются базой (ON DELETE CASCADE), ORM их не загружает
+    media: Mapped[List["Media"]] = relationship(
+        primaryjoin=lambda: Tweet.id == foreign(Media.tweet_id),
+        backref=backref("tweets", lazy="raise"),
+        cascade="all, delete",
+        passive_deletes=True,
+        lazy="raise",
+    )
+    likes: Mapped[List["Like"]] = relationship(
+        primaryjoin=lambda: Tweet.id == foreign(Like.tweet_id),
+        backref=backref("tweets", lazy="raise"),
+        cascade="all, delete",
+        passive_deletes=True,
+        lazy="raise",
+    )
+
+    __table_args__ = (
+        # Ленты читают только неудалённые твиты, индекс их и покрывает
+        Index(
+            "ix_tweets_live_create_date",
+            "create_date",
+            "id",
+            postgresql_where=text("deleted_at IS NULL"),
+            sqlite_where=text("deleted_at IS NULL"),
+        ),
+        # Очередь на очистку: обычно пустая, поэтому индекс почти ничего не весит
+        Index(
+            "ix_tweets_deleted_at",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+            sqlite_where=text("deleted_at IS NOT NULL"),
+        ),
+        _partition_by("create_date"),
+    )
+    # Для ORM твит определяется только id, даже если ключ таблицы составной
+    __mapper_args__ = {"primary_key": [id]}
 
     def __repr__(self):
         return self._repr(
@@ -66,13 +168,66 @@ class Tweet(Base):
         )
 
 
+# Индексы для поиска по твитам: GIN по tsvector и триграммный для запасного
+# поиска по неполным словам. Создаются только в PostgreSQL, триграммный -
+# только если расширение pg_trgm доступно на сервере.
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL(
+        "DO $$ BEGIN CREATE EXTENSION IF NOT EXISTS pg_trgm; "
+        "EXCEPTION WHEN OTHERS THEN RAISE NOTICE 'pg_trgm is not available'; "
+        "END $$"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    Tweet.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_tweets_tweet_data_fts ON tweets "
+        f"USING gin (to_tsvector('{SEARCH_TS_CONFIG}'::regconfig, tweet_data))"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    Tweet.__table__,
+    "after_create",
+    DDL(
+        "DO $$ BEGIN "
+        "IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN "
+        "CREATE INDEX IF NOT EXISTS ix_tweets_tweet_data_trgm ON tweets "
+        "USING gin (tweet_data gin_trgm_ops); "
+        "END IF; END $$"
+    ).execute_if(dialect="postgresql"),
+)
+
+
 # Like models *
 class Like(Base):
     __tablename__ = "likes"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, index=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
-    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id"), nullable=False)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    tweet_id: Mapped[int] = mapped_column(*_tweet_fk(), nullable=False, index=True)
+    # Дата твита: ключ секционирования likes, лайк лежит в секции своего твита
+    tweet_create_date: Mapped[Optional[datetime]] = mapped_column(
+        primary_key=TWEETS_PARTITIONED, default=None
+    )
+
+    __table_args__ = (
+        (
+            ForeignKeyConstraint(
+                ["tweet_id", "tweet_create_date"],
+                ["tweets.id", "tweets.create_date"],
+                ondelete="CASCADE",
+            ),
+            _partition_by("tweet_create_date"),
+        )
+        if TWEETS_PARTITIONED
+        else ()
+    )
+    __mapper_args__ = {"primary_key": [id]}
 
     def __repr__(self):
         return self._repr(
@@ -82,6 +237,20 @@ class Like(Base):
         )
 
 
+# Строки вне месячных секций (например, импорт старой истории) попадают в
+# секции по умолчанию; месячные секции создаёт database.partitions
+if TWEETS_PARTITIONED:
+    for _table in (Tweet.__table__, Like.__table__):
+        event.listen(
+            _table,
+            "after_create",
+            DDL(
+                "CREATE TABLE IF NOT EXISTS %(table)s_default "
+                "PARTITION OF %(table)s DEFAULT"
+            ).execute_if(dialect="postgresql"),
+        )
+
+
 # media
 
 
@@ -90,7 +259,18 @@ class Media(Base):
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, index=True)
 
     media_path: Mapped[str] = mapped_column(String(255))  # *
-    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id"), nullable=True)
+    tweet_id: Mapped[int] = mapped_column(*_tweet_fk(), nullable=True, index=True)
+    create_date: Mapped[datetime] = mapped_column(server_default=func.now())
+
+    __table_args__ = (
+        # Непривязанные загрузки для сборщика мусора (database.purge)
+        Index(
+            "ix_media_orphans_create_date",
+            "create_date",
+            postgresql_where=text("tweet_id IS NULL"),
+            sqlite_where=text("tweet_id IS NULL"),
+        ),
+    )
 
     def __repr__(self):
         return self._repr(
@@ -98,3 +278,166 @@ class Media(Base):
             media_path=self.media_path,
             tweet_id=self.tweet_id,
         )
+
+
+# Загрузка файла по частям: части дописываются в UPLOAD_PARTS_PATH/<id>.part,
+# после завершения файл переносится в MEDIA_PATH и создаётся Media
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), index=True
+    )
+    filename: Mapped[str] = mapped_column(String(255))
+    size: Mapped[int] = mapped_column(BigInteger)
+    received: Mapped[int] = mapped_column(BigInteger, default=0)
+    media_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("media.id", ondelete="SET NULL"), default=None
+    )
+    create_date: Mapped[datetime] = mapped_column(server_default=func.now())
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+    # Запрос, который сейчас принимает часть, и срок его аренды
+    # (database.uploads.lease_upload_session)
+    writer: Mapped[Optional[str]] = mapped_column(String(32), default=None)
+    lease_until: Mapped[Optional[datetime]] = mapped_column(default=None)
+
+    def __repr__(self):
+        return self._repr(
+            id=self.id,
+            user_id=self.user_id,
+            filename=self.filename,
+            size=self.size,
+            received=self.received,
+        )
+
+
+# Хэштеги и упоминания, извлекаются из текста твита при создании
+class Tag(Base):
+    __tablename__ = "tags"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(100), unique=True, index=True)
+
+    def __repr__(self):
+        return self._repr(id=self.id, name=self.name)
+
+
+tweet_tags = Table(
+    "tweet_tags",
+    Base.metadata,
+    Column("tweet_id", Integer, *_tweet_fk(), primary_key=True),
+    Column(
+        "tag_id",
+        Integer,
+        ForeignKey("tags.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Index("ix_tweet_tags_tag_id_tweet_id", "tag_id", "tweet_id"),
+)
+
+mentions = Table(
+    "mentions",
+    Base.metadata,
+    Column("tweet_id", Integer, *_tweet_fk(), primary_key=True),
+    Column(
+        "user_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Index("ix_mentions_user_id_tweet_id", "user_id", "tweet_id"),
+)
+
+
+# Счётчики пользователей (followers, following, tweets, likes), разбитые на
+# несколько строк-шардов: значение счётчика - сумма value по всем шардам
+user_counters = Table(
+    "user_counters",
+    Base.metadata,
+    Column(
+        "user_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column("name", String(20), primary_key=True),
+    Column("shard", SmallInteger, primary_key=True),
+    Column("value", BigInteger, nullable=False, server_default="0"),
+)
+
+
+# Оценки твитов для ленты ?order=top: score = freshness + log10(лайков),
+# freshness растёт со временем создания, поэтому старые оценки пересчитывать
+# не нужно. Строка удаляется вместе с пометкой твита удалённым
+tweet_scores = Table(
+    "tweet_scores",
+    Base.metadata,
+    Column("tweet_id", Integer, *_tweet_fk(), primary_key=True),
+    Column(
+        "user_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    ),
+    Column("likes", Integer, nullable=False, server_default="0"),
+    Column("freshness", Float, nullable=False),
+    Column("score", Float, nullable=False),
+    # Страница ленты - обратный проход по индексу
+    Index("ix_tweet_scores_score_tweet_id", "score", "tweet_id"),
+)
+
+
+# Кого читать: друзья друзей, которых пользователь ещё не читает, с числом
+# общих подписок. Таблица целиком пересчитывается фоновой задачей
+follow_suggestions = Table(
+    "follow_suggestions",
+    Base.metadata,
+    Column(
+        "user_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "candidate_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column("mutuals", Integer, nullable=False),
+    Index("ix_follow_suggestions_user_id_mutuals", "user_id", "mutuals"),
+)
+
+
+# Версии данных для ETag: scope "feed" (общая лента, scope_id 0) и "user"
+# (профиль пользователя). Номер версии берётся из последовательности, строка
+# обновляется в случайном шарде, а текущая версия - максимум по шардам
+change_versions_seq = Sequence("change_versions_seq", metadata=Base.metadata)
+
+change_versions = Table(
+    "change_versions",
+    Base.metadata,
+    Column("scope", String(20), primary_key=True),
+    Column("scope_id", Integer, primary_key=True),
+    Column("shard", SmallInteger, primary_key=True),
+    Column("version", BigInteger, nullable=False),
+)
+
+
+# Журнал изменений твитов для опрашивающих клиентов: новые твиты, изменения
+# числа лайков и удаления. xid - транзакция, записавшая строку, водяной знак
+# клиента - граница по xid (см. database.changes). Старые строки удаляет
+# фоновая задача
+tweet_changes = Table(
+    "tweet_changes",
+    Base.metadata,
+    Column("id", BigInteger, primary_key=True, autoincrement=True),
+    Column("tweet_id", Integer, nullable=False),
+    Column("user_id", Integer, nullable=False),
+    Column("kind", String(10), nullable=False),
+    Column("create_date", DateTime, nullable=False, server_default=func.now()),
+    Column("xid", BigInteger),
+    Index("ix_tweet_changes_xid", "xid"),
+    Index("ix_tweet_changes_create_date", "create_date"),
+)
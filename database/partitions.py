@@ -0,0 +1,169 @@
+"""
+Monthly range partitions of the tweets and likes tables.
+
+With TWEETS_PARTITIONED=1 (PostgreSQL only, applies to a newly created
+database) tweets are partitioned by create_date and likes by the date of
+the liked tweet, one partition per calendar month for both tables. Queries
+on recent tweets then only touch the newest partitions, and each month is
+vacuumed on its own, so their cost does not grow with the history. Old
+months can be detached into an archive schema, from where they can be
+dumped and dropped without touching the live tables.
+"""
+
+import logging
+import re
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.setting import TWEETS_PARTITIONED
+
+from .database import get_database_settings
+from .versions import bump_versions
+
+logger = logging.getLogger(__name__)
+
+# Секции likes отсоединяются раньше секций tweets, на которые они ссылаются
+PARTITIONED_TABLES = ("likes", "tweets")
+
+PARTITION_NAME_RE = re.compile(r"^(?P<table>\w+)_y(?P<year>\d{4})m(?P<month>\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    """likes, 2026-10-01 -> likes_y2026m10"""
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def parse_partition_name(name: str) -> Optional[Tuple[str, date]]:
+    """likes_y2026m10 -> (likes, 2026-10-01), None for other tables"""
+    match = PARTITION_NAME_RE.match(name)
+    if match is None:
+        return None
+    return match["table"], date(int(match["year"]), int(match["month"]), 1)
+
+
+def partitioning_enabled(session: AsyncSession) -> bool:
+    return TWEETS_PARTITIONED and session.bind.dialect.name == "postgresql"
+
+
+async def get_partitions(session: AsyncSession, table: str) -> List[str]:
+    """Names of the partitions currently attached to the table"""
+    query = await session.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table ORDER BY child.relname"
+        ),
+        {"table": table},
+    )
+    return list(query.scalars())
+
+
+async def ensure_partitions(
+    session: AsyncSession,
+    today: Optional[date] = None,
+    months_ahead: Optional[int] = None,
+) -> List[str]:
+    """
+    Create the partitions of the current month and of months_ahead next
+    months, so that new rows never land in the default partition. Runs
+    before the first tweet is inserted and then periodically.
+
+    Returns:
+        List[str]: The names of the created partitions.
+    """
+    if not partitioning_enabled(session):
+        return []
+    if months_ahead is None:
+        months_ahead = get_database_settings().partition_months_ahead
+    first = month_start(today or date.today())
+    created = []
+    for table in PARTITIONED_TABLES:
+        existing = set(await get_partitions(session, table))
+        for offset in range(months_ahead + 1):
+            start = add_months(first, offset)
+            name = partition_name(table, start)
+            if name in existing:
+                continue
+            await session.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{start}') TO ('{add_months(start, 1)}')"
+                )
+            )
+            created.append(name)
+    await session.commit()
+    return created
+
+
+async def archive_partitions(
+    session: AsyncSession,
+    before: date,
+    schema: Optional[str] = None,
+) -> List[str]:
+    """
+    Detach the monthly partitions of months that ended before `before` and
+    move them to the archive schema. Archived tweets and likes disappear
+    from the feeds and from the reconciled counters. The likes partition of
+    a month goes first, and its foreign key to tweets is dropped, so that
+    the tweets partition of the same month can be detached after it.
+
+    Returns:
+        List[str]: The names of the archived partitions.
+    """
+    if not partitioning_enabled(session):
+        return []
+    schema = schema or get_database_settings().partition_archive_schema
+    await session.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
+    archived = []
+    for table in PARTITIONED_TABLES:
+        for name in await get_partitions(session, table):
+            parsed = parse_partition_name(name)
+            if parsed is None or add_months(parsed[1], 1) > before:
+                continue
+            await session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            if table == "likes":
+                foreign_keys = await session.execute(
+                    text(
+                        "SELECT conname FROM pg_constraint "
+                        "WHERE conrelid = CAST(:name AS regclass) "
+                        "AND contype = 'f' AND confrelid = CAST('tweets' AS regclass)"
+                    ),
+                    {"name": name},
+                )
+                for constraint in foreign_keys.scalars().all():
+                    await session.execute(
+                        text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"')
+                    )
+            await session.execute(text(f"ALTER TABLE {name} SET SCHEMA {schema}"))
+            await bump_versions(session, feed=True)
+            await session.commit()
+            archived.append(name)
+    return archived
+
+
+async def maintain_partitions(
+    session: AsyncSession, retention_months: int, today: Optional[date] = None
+) -> Tuple[List[str], List[str]]:
+    """Create upcoming partitions and archive the expired ones"""
+    today = today or date.today()
+    created = await ensure_partitions(session, today)
+    archived = []
+    if retention_months > 0:
+        before = add_months(month_start(today), -retention_months)
+        archived = await archive_partitions(session, before)
+    if created or archived:
+        logger.info("Partitions created: %s, archived: %s", created, archived)
+    return created, archived
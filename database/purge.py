@@ -0,0 +1,406 @@
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, func, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.setting import TWEETS_PARTITIONED
+
+from .changes import (
+    DELETED,
+    LIKES,
+    log_deleted_tweets_of_user,
+    log_tweet_changes,
+)
+from .counters import add_to_counters
+from .database import get_database_settings
+from .models import (
+    Like,
+    Media,
+    Tweet,
+    User,
+    mentions,
+    tweet_scores,
+    tweet_tags,
+    user_to_user,
+)
+from .ranking import add_likes_to_scores, remove_tweet_scores
+from .versions import bump_versions
+
+logger = logging.getLogger(__name__)
+
+
+async def soft_delete_tweet(
+    session: AsyncSession, tweet_id: int, user_id: int
+) -> Optional[bool]:
+    """
+    Mark the user's tweet as deleted with a single UPDATE. Likes, media and
+    files stay until purge_tweet removes them in the background.
+
+    Returns:
+        Optional[bool]: True if the tweet was marked, False if it belongs
+        to another user, None if there is no such tweet.
+    """
+    result = await session.execute(
+        update(Tweet)
+        .where(
+            Tweet.id == tweet_id,
+            Tweet.user_id == user_id,
+            Tweet.deleted_at.is_(None),
+        )
+        .values(deleted_at=func.now())
+    )
+    if result.rowcount == 0:
+        author_id = await session.scalar(
+            select(Tweet.user_id).where(
+                Tweet.id == tweet_id, Tweet.deleted_at.is_(None)
+            )
+        )
+        return None if author_id is None else False
+    await add_to_counters(session, {(user_id, "tweets"): -1})
+    await remove_tweet_scores(session, tweet_scores.c.tweet_id == tweet_id)
+    await log_tweet_changes(session, DELETED, [(tweet_id, user_id)])
+    await bump_versions(session, feed=True)
+    return True
+
+
+async def purge_tweet(
+    session: AsyncSession,
+    tweet_id: int,
+    batch_size: Optional[int] = None,
+    on_media: Optional[Callable] = None,
+) -> int:
+    """
+    Delete a soft-deleted tweet for good. Likes and media rows are deleted
+    in chunks of batch_size, each chunk in its own short transaction, so a
+    viral tweet neither holds locks for long nor is loaded into memory.
+    The tweet row goes last, tags and mentions follow it by ON DELETE
+    CASCADE (partitioned tweets have no such foreign keys, their tags and
+    mentions are deleted explicitly).
+
+    Args:
+        on_media: Coroutine function called with the paths of every chunk
+            of deleted media rows, to remove the files.
+
+    Returns:
+        int: The number of deleted likes.
+    """
+    tweet = (
+        await session.execute(
+            select(Tweet.user_id, Tweet.create_date).where(
+                Tweet.id == tweet_id, Tweet.deleted_at.isnot(None)
+            )
+        )
+    ).first()
+    if tweet is None:
+        return 0
+    batch_size = batch_size or get_database_settings().purge_batch_size
+    author_id = tweet.user_id
+    tweet_likes = Like.tweet_id == tweet_id
+    if TWEETS_PARTITIONED:
+        tweet_likes = and_(tweet_likes, Like.tweet_create_date == tweet.create_date)
+    deleted_likes = 0
+    while True:
+        chunk = select(Like.id).where(tweet_likes).limit(batch_size)
+        result = await session.execute(
+            delete(Like).where(Like.id.in_(chunk)).returning(Like.id)
+        )
+        count = len(result.all())
+        await add_to_counters(session, {(author_id, "likes"): -count})
+        await session.commit()
+        deleted_likes += count
+        if count < batch_size:
+            break
+    while True:
+        chunk = select(Media.id).where(Media.tweet_id == tweet_id).limit(batch_size)
+        result = await session.execute(
+            delete(Media).where(Media.id.in_(chunk)).returning(Media.media_path)
+        )
+        paths: List[str] = list(result.scalars())
+        await session.commit()
+        if paths and on_media is not None:
+            await on_media(paths)
+        if len(paths) < batch_size:
+            break
+    if TWEETS_PARTITIONED:
+        await session.execute(
+            delete(tweet_tags).where(tweet_tags.c.tweet_id == tweet_id)
+        )
+        await session.execute(delete(mentions).where(mentions.c.tweet_id == tweet_id))
+    await session.execute(delete(Tweet).where(Tweet.id == tweet_id))
+    await session.commit()
+    return deleted_likes
+
+
+async def get_deleted_tweet_ids(session: AsyncSession, limit: int) -> List[int]:
+    """Soft-deleted tweets waiting for purge, read through the partial index"""
+    query = await session.execute(
+        select(Tweet.id)
+        .where(Tweet.deleted_at.isnot(None))
+        .order_by(Tweet.deleted_at)
+        .limit(limit)
+    )
+    return list(query.scalars())
+
+
+async def soft_delete_user(session: AsyncSession, user_id: int):
+    """Close the account: the api key stops working right away"""
+    await session.execute(
+        update(User)
+        .where(User.id == user_id, User.deleted_at.is_(None))
+        .values(deleted_at=func.now())
+    )
+    await bump_versions(session, user_ids=[user_id])
+
+
+async def _delete_chunks(
+    session: AsyncSession, make_statement, on_rows=None, on_committed=None
+) -> int:
+    """
+    Run a DELETE ... WHERE key IN (SELECT ... LIMIT n) RETURNING statement
+    until it deletes nothing, committing after every chunk.
+
+    on_rows is awaited with the returned rows in the transaction of the
+    chunk (counters and the like), on_committed only after the chunk is
+    committed (files and other side effects that cannot be rolled back).
+    """
+    deleted = 0
+    while True:
+        rows = (await session.execute(make_statement())).all()
+        if on_rows is not None and rows:
+            await on_rows(rows)
+        await session.commit()
+        if on_committed is not None and rows:
+            await on_committed(rows)
+        if not rows:
+            return deleted
+        deleted += len(rows)
+
+
+async def purge_user(
+    session: AsyncSession,
+    user_id: int,
+    batch_size: Optional[int] = None,
+    on_media: Optional[Callable] = None,
+    on_tweets: Optional[Callable] = None,
+) -> Dict[str, int]:
+    """
+    Delete a closed account and everything it owns.
+
+    Rows are deleted in chunks of batch_size, each in its own transaction,
+    and only ids come back to Python, so memory and lock time do not depend
+    on how many tweets, likes or followers the account has. Counters of
+    other users (their followers, following and likes) are corrected chunk
+    by chunk. The user row goes last, the remaining rows that reference it
+    follow by ON DELETE CASCADE.
+
+    Args:
+        on_media: Coroutine function called with the paths of every chunk
+            of deleted media rows once it is committed, to remove the files.
+        on_tweets: Coroutine function called with the ids of every chunk
+            of deleted tweets once it is committed.
+
+    Returns:
+        Dict[str, int]: The number of deleted rows per kind.
+    """
+    batch_size = batch_size or get_database_settings().purge_batch_size
+    deleted: Dict[str, int] = dict()
+    # Твиты пропадают из лент сразу, ещё до удаления строк
+    await log_deleted_tweets_of_user(session, user_id)
+    await session.execute(
+        update(Tweet)
+        .where(Tweet.user_id == user_id, Tweet.deleted_at.is_(None))
+        .values(deleted_at=func.now())
+    )
+    await remove_tweet_scores(session, tweet_scores.c.user_id == user_id)
+    await bump_versions(session, feed=True)
+    await session.commit()
+
+    edge = tuple_(user_to_user.c.follower_id, user_to_user.c.following_id)
+
+    async def edges_deleted(rows):
+        deltas: Counter = Counter()
+        for follower_id, following_id in rows:
+            if follower_id == user_id:
+                deltas[(following_id, "followers")] -= 1
+            else:
+                deltas[(follower_id, "following")] -= 1
+        await add_to_counters(session, deltas)
+
+    deleted["follows"] = await _delete_chunks(
+        session,
+        lambda: delete(user_to_user)
+        .where(
+            edge.in_(
+                select(user_to_user.c.follower_id, user_to_user.c.following_id)
+                .where(
+                    or_(
+                        user_to_user.c.follower_id == user_id,
+                        user_to_user.c.following_id == user_id,
+                    )
+                )
+                .limit(batch_size)
+            )
+        )
+        .returning(user_to_user.c.follower_id, user_to_user.c.following_id),
+        edges_deleted,
+    )
+
+    async def likes_deleted(rows):
+        deltas: Counter = Counter()
+        scores: Counter = Counter()
+        for author_id, tweet_id in rows:
+            deltas[(author_id, "likes")] -= 1
+            scores[tweet_id] -= 1
+        await add_to_counters(session, deltas)
+        await add_likes_to_scores(session, scores)
+        await log_tweet_changes(
+            session, LIKES, [(tweet_id, author_id) for author_id, tweet_id in rows]
+        )
+        await bump_versions(session, feed=True)
+
+    # Лайки пользователя на чужих твитах: уменьшаются счётчики их авторов
+    deleted["likes"] = await _delete_chunks(
+        session,
+        lambda: delete(Like)
+        .where(
+            Like.id.in_(
+                select(Like.id).where(Like.user_id == user_id).limit(batch_size)
+            ),
+            Tweet.id == Like.tweet_id,
+        )
+        .returning(Tweet.user_id, Like.tweet_id),
+        likes_deleted,
+    )
+
+    own_tweets = select(Tweet.id).where(Tweet.user_id == user_id)
+    deleted["received_likes"] = await _delete_chunks(
+        session,
+        lambda: delete(Like)
+        .where(
+            Like.id.in_(
+                select(Like.id).where(Like.tweet_id.in_(own_tweets)).limit(batch_size)
+            )
+        )
+        .returning(Like.id),
+    )
+
+    async def media_deleted(rows):
+        if on_media is not None:
+            await on_media([path for (path,) in rows])
+
+    deleted["media"] = await _delete_chunks(
+        session,
+        lambda: delete(Media)
+        .where(
+            Media.id.in_(
+                select(Media.id).where(Media.tweet_id.in_(own_tweets)).limit(batch_size)
+            )
+        )
+        .returning(Media.media_path),
+        on_committed=media_deleted,
+    )
+
+    if TWEETS_PARTITIONED:
+        for table in (tweet_tags, mentions):
+            await _delete_chunks(
+                session,
+                lambda: delete(table)
+                .where(
+                    table.c.tweet_id.in_(
+                        select(table.c.tweet_id)
+                        .where(table.c.tweet_id.in_(own_tweets))
+                        .limit(batch_size)
+                    )
+                )
+                .returning(table.c.tweet_id),
+            )
+
+    async def tweets_deleted(rows):
+        if on_tweets is not None:
+            await on_tweets([tweet_id for (tweet_id,) in rows])
+
+    deleted["tweets"] = await _delete_chunks(
+        session,
+        lambda: delete(Tweet)
+        .where(Tweet.id.in_(own_tweets.limit(batch_size)))
+        .returning(Tweet.id),
+        on_committed=tweets_deleted,
+    )
+
+    await session.execute(delete(User).where(User.id == user_id))
+    await session.commit()
+    return deleted
+
+
+async def get_deleted_user_ids(session: AsyncSession, limit: int) -> List[int]:
+    """Closed accounts waiting for purge"""
+    query = await session.execute(
+        select(User.id).where(User.deleted_at.isnot(None)).limit(limit)
+    )
+    return list(query.scalars())
+
+
+@dataclass
+class OrphanMediaStats:
+    """Progress of one orphan media collection"""
+
+    batches: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+
+
+async def collect_orphan_media(
+    session: AsyncSession,
+    grace_seconds: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    on_media: Optional[Callable] = None,
+) -> OrphanMediaStats:
+    """
+    Delete media rows that were never attached to a tweet within
+    grace_seconds of their upload, batch_size rows per transaction, read
+    through the partial orphans index. Rows locked by a concurrent attach
+    are skipped rather than waited for, so requests are never blocked.
+
+    Args:
+        on_media: Coroutine function called with the paths of every chunk
+            of deleted media rows once it is committed, to remove the files.
+    """
+    settings = get_database_settings()
+    if grace_seconds is None:
+        grace_seconds = settings.media_gc_grace_seconds
+    batch_size = batch_size or settings.media_gc_batch_size
+    stats = OrphanMediaStats()
+    started = time.monotonic()
+
+    async def media_deleted(rows):
+        stats.batches += 1
+        stats.rows += len(rows)
+        logger.debug("Orphan media: %s rows in %s batches", stats.rows, stats.batches)
+        if on_media is not None:
+            await on_media([path for (path,) in rows])
+
+    await _delete_chunks(
+        session,
+        lambda: delete(Media)
+        .where(
+            Media.id.in_(
+                select(Media.id)
+                .where(
+                    Media.tweet_id.is_(None),
+                    Media.create_date < func.now() - timedelta(seconds=grace_seconds),
+                )
+                .order_by(Media.create_date)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+        )
+        .returning(Media.media_path),
+        on_committed=media_deleted,
+    )
+    stats.seconds = time.monotonic() - started
+    return stats
@@ -0,0 +1,246 @@
+import base64
+import binascii
+import json
+import math
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import (
+    Float,
+    bindparam,
+    cast,
+    delete,
+    desc,
+    func,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.setting import TOP_FEED_AFFINITY_LIKES, TOP_FEED_CANDIDATES
+
+from .database import get_database_settings
+from .models import Like, Tweet, tweet_scores, user_to_user
+
+
+def _freshness(create_date):
+    decay = get_database_settings().top_feed_decay_seconds
+    return func.extract("epoch", create_date) / decay
+
+
+def _score(freshness, likes):
+    return freshness + func.log(cast(func.greatest(likes, 1), Float))
+
+
+async def add_tweet_scores(session: AsyncSession, tweet_ids: Sequence[int]):
+    """Score rows of new tweets, one INSERT ... SELECT for the whole batch"""
+    if not tweet_ids:
+        return
+    freshness = _freshness(Tweet.create_date)
+    await session.execute(
+        tweet_scores.insert().from_select(
+            ["tweet_id", "user_id", "freshness", "score"],
+            select(Tweet.id, Tweet.user_id, freshness, freshness).where(
+                Tweet.id.in_(tweet_ids)
+            ),
+        )
+    )
+
+
+async def add_likes_to_scores(session: AsyncSession, deltas: Mapping[int, int]):
+    """Apply tweet id -> change of the like count, in tweet id order"""
+    params = [
+        {"b_tweet_id": tweet_id, "b_delta": delta}
+        for tweet_id, delta in sorted(deltas.items())
+        if delta
+    ]
+    if not params:
+        return
+    likes = tweet_scores.c.likes + bindparam("b_delta")
+    await session.execute(
+        update(tweet_scores)
+        .where(tweet_scores.c.tweet_id == bindparam("b_tweet_id"))
+        .values(likes=likes, score=_score(tweet_scores.c.freshness, likes)),
+        params,
+    )
+
+
+async def remove_tweet_scores(session: AsyncSession, *where):
+    """Drop deleted tweets out of the ranked feed"""
+    await session.execute(delete(tweet_scores).where(*where))
+
+
+async def rebuild_tweet_scores(session: AsyncSession) -> int:
+    """
+    Recompute the scores of every live tweet from the likes table and drop
+    the rows of deleted tweets. Fills the table on an existing database and
+    corrects drift; only changed rows are written.
+
+    Returns:
+        int: The number of inserted or corrected rows.
+    """
+    likes = (
+        select(Like.tweet_id, func.count().label("likes"))
+        .group_by(Like.tweet_id)
+        .subquery()
+    )
+    count = func.coalesce(likes.c.likes, 0)
+    freshness = _freshness(Tweet.create_date)
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(tweet_scores).from_select(
+        ["tweet_id", "user_id", "likes", "freshness", "score"],
+        select(Tweet.id, Tweet.user_id, count, freshness, _score(freshness, count))
+        .outerjoin(likes, likes.c.tweet_id == Tweet.id)
+        .where(Tweet.deleted_at.is_(None)),
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["tweet_id"],
+        set_={
+            "likes": statement.excluded.likes,
+            "score": statement.excluded.score,
+        },
+        where=tweet_scores.c.likes != statement.excluded.likes,
+    )
+    result = await session.execute(statement)
+    await remove_tweet_scores(
+        session,
+        tweet_scores.c.tweet_id.in_(
+            select(Tweet.id).where(Tweet.deleted_at.isnot(None))
+        ),
+    )
+    return result.rowcount
+
+
+# (оценка с учётом близости к автору, id твита) последнего твита страницы
+TopCursor = Tuple[float, int]
+
+
+async def get_author_affinity(
+    session: AsyncSession,
+    viewer_id: int,
+    author_ids: Optional[Iterable[int]] = None,
+    follow_boost: Optional[float] = None,
+) -> Dict[int, float]:
+    """
+    Closeness of the viewer to every author: follow_boost for following
+    the author plus log10(1 + likes) over the viewer's recent likes. Never
+    negative. Without author_ids, every author the viewer is close to.
+    """
+    if follow_boost is None:
+        follow_boost = get_database_settings().top_feed_follow_boost
+    if author_ids is not None:
+        author_ids = list(author_ids)
+        if not author_ids:
+            return {}
+    affinity: Dict[int, float] = dict()
+    followed = select(user_to_user.c.following_id).where(
+        user_to_user.c.follower_id == viewer_id
+    )
+    if author_ids is not None:
+        followed = followed.where(user_to_user.c.following_id.in_(author_ids))
+    for author_id in await session.scalars(followed):
+        affinity[author_id] = max(follow_boost, 0.0)
+    recent_likes = (
+        select(Like.tweet_id)
+        .where(Like.user_id == viewer_id)
+        .order_by(desc(Like.id))
+        .limit(TOP_FEED_AFFINITY_LIKES)
+        .subquery()
+    )
+    liked = (
+        select(Tweet.user_id, func.count())
+        .join(recent_likes, recent_likes.c.tweet_id == Tweet.id)
+        .group_by(Tweet.user_id)
+    )
+    if author_ids is not None:
+        liked = liked.where(Tweet.user_id.in_(author_ids))
+    for author_id, count in await session.execute(liked):
+        affinity[author_id] = affinity.get(author_id, 0.0) + math.log10(1 + count)
+    affinity.pop(viewer_id, None)
+    return affinity
+
+
+def rank_key(row: Sequence, affinity: Mapping[int, float]) -> TopCursor:
+    """(tweet_id, user_id, score) row -> its place in the viewer's top feed"""
+    return row[2] + affinity.get(row[1], 0.0), row[0]
+
+
+def encode_top_cursor(cursor: TopCursor) -> str:
+    raw = json.dumps(list(cursor)).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_top_cursor(cursor: str) -> TopCursor:
+    try:
+        score, tweet_id = json.loads(base64.urlsafe_b64decode(cursor))
+        if math.isfinite(score):
+            return float(score), int(tweet_id)
+    except (ValueError, TypeError, binascii.Error):
+        pass
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid feed cursor.",
+    )
+
+
+async def get_top_tweet_ids(
+    session: AsyncSession,
+    viewer_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    follow_boost: Optional[float] = None,
+    candidates: int = TOP_FEED_CANDIDATES,
+) -> Tuple[List[int], Optional[str]]:
+    """
+    Ids of a top feed page: tweets ordered by score plus the viewer's
+    affinity to their author, after the cursor, and the opaque cursor of
+    the next page (None on the last page).
+
+    Tweets are read by a backward scan of the score index in batches of
+    limit * candidates. Affinity is never negative and never above its
+    maximum for this viewer, so a tweet with a lower score than the
+    cursor can never be ranked above it, and the scan stops as soon as
+    the unread tweets cannot make it into the page.
+    """
+    after = decode_top_cursor(cursor) if cursor is not None else None
+    affinity = await get_author_affinity(
+        session, viewer_id, follow_boost=follow_boost
+    )
+    bound = max(affinity.values(), default=0.0)
+    batch = limit * candidates
+    found: List[TopCursor] = []
+    last: Optional[Tuple[float, int]] = None
+    while True:
+        query = (
+            select(
+                tweet_scores.c.tweet_id, tweet_scores.c.user_id, tweet_scores.c.score
+            )
+            .order_by(desc(tweet_scores.c.score), desc(tweet_scores.c.tweet_id))
+            .limit(batch)
+        )
+        if after is not None:
+            # Твиты с оценкой выше курсора уже были на прошлых страницах
+            query = query.where(tweet_scores.c.score <= after[0])
+        if last is not None:
+            query = query.where(
+                tuple_(tweet_scores.c.score, tweet_scores.c.tweet_id) < last
+            )
+        rows = (await session.execute(query)).all()
+        for row in rows:
+            key = rank_key(row, affinity)
+            if after is None or key < after:
+                found.append(key)
+        found.sort(reverse=True)
+        del found[limit + 1 :]
+        if len(rows) < batch:
+            break
+        last = rows[-1].score, rows[-1].tweet_id
+        # Непрочитанные твиты ниже (last score + bound, last id)
+        if len(found) > limit and found[limit] >= (last[0] + bound, last[1]):
+            break
+    next_cursor = None
+    if len(found) > limit:
+        next_cursor = encode_top_cursor(found[limit - 1])
+    return [tweet_id for _, tweet_id in found[:limit]], next_cursor
@@ -0,0 +1,296 @@
+import base64
+import binascii
+import bisect
+import json
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, func, literal_column, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.setting import SEARCH_TS_CONFIG
+
+from .models import Tweet
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Конфигурация подставляется литералом: выражение в запросе должно
+# совпадать с выражением GIN индекса, иначе планировщик его не использует
+TS_CONFIG = literal_column(f"'{SEARCH_TS_CONFIG}'::regconfig")
+TS_VECTOR = func.to_tsvector(TS_CONFIG, Tweet.tweet_data)
+
+MODE_FTS = "fts"
+MODE_TRGM = "trgm"
+MODE_PREFIX = "prefix"
+MODE_INDEX = "index"
+MODES = (MODE_FTS, MODE_TRGM, MODE_PREFIX, MODE_INDEX)
+
+# Наличие pg_trgm проверяется один раз на процесс
+_trigram_available: Optional[bool] = None
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class InvertedIndex:
+    """
+    In-process inverted index used when the database is not PostgreSQL
+    (e.g. SQLite in local runs). Lookups only touch the postings of the
+    query tokens, so search cost does not grow with the number of tweets.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._documents: Dict[int, Tuple[str, ...]] = {}
+        self._vocabulary: List[str] = []
+
+    def clear(self):
+        self.loaded = False
+        self._postings.clear()
+        self._documents.clear()
+        self._vocabulary.clear()
+
+    def add(self, tweet_id: int, text: str):
+        if tweet_id in self._documents:
+            self.remove(tweet_id)
+        frequencies = Counter(tokenize(text))
+        self._documents[tweet_id] = tuple(frequencies)
+        for token, count in frequencies.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            postings[tweet_id] = count
+
+    def remove(self, tweet_id: int):
+        for token in self._documents.pop(tweet_id, ()):
+            postings = self._postings[token]
+            postings.pop(tweet_id, None)
+            if not postings:
+                del self._postings[token]
+                position = bisect.bisect_left(self._vocabulary, token)
+                del self._vocabulary[position]
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        """Fallback for partial words, analogous to the trigram search."""
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        tokens = []
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            tokens.append(token)
+        return tokens
+
+    def search(self, query: str) -> List[Tuple[float, int]]:
+        """Return (score, tweet_id) pairs ordered by score and id descending."""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        if not any(token in self._postings for token in tokens):
+            tokens = {
+                expanded for token in tokens for expanded in self._expand_prefix(token)
+            }
+
+        total = len(self._documents) or 1
+        scores: Dict[int, float] = {}
+        for token in tokens:
+            postings = self._postings.get(token, {})
+            idf = math.log(1 + total / len(postings)) if postings else 0.0
+            for tweet_id, count in postings.items():
+                scores[tweet_id] = scores.get(tweet_id, 0.0) + count * idf
+        return sorted(
+            ((score, tweet_id) for tweet_id, score in scores.items()),
+            reverse=True,
+        )
+
+    async def ensure_loaded(self, session: AsyncSession):
+        if self.loaded:
+            return
+        rows = await session.execute(
+            select(Tweet.id, Tweet.tweet_data).where(Tweet.deleted_at.is_(None))
+        )
+        for tweet_id, tweet_data in rows:
+            self.add(tweet_id, tweet_data)
+        self.loaded = True
+
+
+search_index = InvertedIndex()
+
+
+def index_tweet(tweet_id: int, text: str):
+    """Keep the in-process index up to date once it has been built."""
+    if search_index.loaded:
+        search_index.add(tweet_id, text)
+
+
+def unindex_tweet(tweet_id: int):
+    if search_index.loaded:
+        search_index.remove(tweet_id)
+
+
+def encode_cursor(mode: str, rank: float, tweet_id: int) -> str:
+    raw = json.dumps([mode, rank, tweet_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, float, int]:
+    try:
+        mode, rank, tweet_id = json.loads(base64.urlsafe_b64decode(cursor))
+        if mode in MODES:
+            return mode, float(rank), int(tweet_id)
+    except (ValueError, TypeError, binascii.Error):
+        pass
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid search cursor.",
+    )
+
+
+async def _ranked_page(
+    session: AsyncSession,
+    mode: str,
+    match,
+    rank,
+    limit: int,
+    after: Optional[Tuple[float, int]],
+    options: Sequence,
+) -> Tuple[List[Tweet], Optional[str]]:
+    query = select(Tweet, rank.label("rank")).where(match, Tweet.deleted_at.is_(None))
+    if after is not None:
+        after_rank, after_id = after
+        query = query.where(
+            or_(rank < after_rank, and_(rank == after_rank, Tweet.id < after_id))
+        )
+    query = (
+        query.options(*options).order_by(rank.desc(), Tweet.id.desc()).limit(limit + 1)
+    )
+    rows = (await session.execute(query)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last_tweet, last_rank = rows[limit - 1]
+        next_cursor = encode_cursor(mode, last_rank, last_tweet.id)
+    return [tweet for tweet, _ in rows[:limit]], next_cursor
+
+
+async def _has_trigram(session: AsyncSession) -> bool:
+    global _trigram_available
+    if _trigram_available is None:
+        query = await session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        )
+        _trigram_available = query.first() is not None
+    return _trigram_available
+
+
+async def _search_postgres(
+    session: AsyncSession,
+    q: str,
+    limit: int,
+    cursor: Optional[str],
+    options: Sequence,
+) -> Tuple[List[Tweet], Optional[str]]:
+    mode, after = MODE_FTS, None
+    if cursor is not None:
+        mode, after_rank, after_id = decode_cursor(cursor)
+        after = (after_rank, after_id)
+
+    if mode == MODE_FTS:
+        ts_query = func.websearch_to_tsquery(TS_CONFIG, q)
+        tweets, next_cursor = await _ranked_page(
+            session,
+            MODE_FTS,
+            TS_VECTOR.op("@@")(ts_query),
+            func.ts_rank_cd(TS_VECTOR, ts_query),
+            limit,
+            after,
+            options,
+        )
+        # Полнотекстовый поиск ничего не нашёл - пробуем по триграммам
+        if tweets or after is not None:
+            return tweets, next_cursor
+
+    if await _has_trigram(session):
+        return await _ranked_page(
+            session,
+            MODE_TRGM,
+            Tweet.tweet_data.op("%>")(q),
+            func.word_similarity(q, Tweet.tweet_data),
+            limit,
+            after if mode == MODE_TRGM else None,
+            options,
+        )
+
+    # Без pg_trgm ищем по префиксам слов, это тоже использует GIN индекс
+    prefix_query = " & ".join(f"{token}:*" for token in tokenize(q))
+    if not prefix_query:
+        return [], None
+    ts_query = func.to_tsquery(TS_CONFIG, prefix_query)
+    return await _ranked_page(
+        session,
+        MODE_PREFIX,
+        TS_VECTOR.op("@@")(ts_query),
+        func.ts_rank_cd(TS_VECTOR, ts_query),
+        limit,
+        after if mode == MODE_PREFIX else None,
+        options,
+    )
+
+
+async def _search_in_process(
+    session: AsyncSession,
+    q: str,
+    limit: int,
+    cursor: Optional[str],
+    options: Sequence,
+) -> Tuple[List[Tweet], Optional[str]]:
+    await search_index.ensure_loaded(session)
+    hits = search_index.search(q)
+    if cursor is not None:
+        _, after_rank, after_id = decode_cursor(cursor)
+        position = bisect.bisect_right(
+            hits,
+            (-after_rank, -after_id),
+            key=lambda hit: (-hit[0], -hit[1]),
+        )
+        hits = hits[position:]
+    page = hits[:limit]
+    if not page:
+        return [], None
+
+    ids = [tweet_id for _, tweet_id in page]
+    query = await session.execute(
+        select(Tweet)
+        .where(Tweet.id.in_(ids), Tweet.deleted_at.is_(None))
+        .options(*options)
+    )
+    by_id = {tweet.id: tweet for tweet in query.scalars()}
+    tweets = [by_id[tweet_id] for tweet_id in ids if tweet_id in by_id]
+
+    next_cursor = None
+    if len(hits) > limit:
+        last_score, last_id = page[-1]
+        next_cursor = encode_cursor(MODE_INDEX, last_score, last_id)
+    return tweets, next_cursor
+
+
+async def search_tweets(
+    session: AsyncSession,
+    q: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    options: Sequence = (),
+) -> Tuple[List[Tweet], Optional[str]]:
+    """
+    Full-text search over tweets ranked by relevance.
+
+    Returns the requested page of tweets and an opaque cursor for the next
+    page (None when there are no more results).
+    """
+    if session.bind.dialect.name == "postgresql":
+        return await _search_postgres(session, q, limit, cursor, options)
+    return await _search_in_process(session, q, limit, cursor, options)
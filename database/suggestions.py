@@ -0,0 +1,97 @@
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, delete, desc, exists, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import get_database_settings
+from .models import User, follow_suggestions, user_to_user
+
+# Ключ pg_advisory_xact_lock: пересчёт не должен идти в двух процессах сразу
+REBUILD_LOCK_KEY = 0x666F6673
+
+
+async def rebuild_follow_suggestions(
+    session: AsyncSession, per_user: Optional[int] = None
+) -> int:
+    """
+    Recompute the whole follow_suggestions table with one DELETE and one
+    INSERT ... SELECT: every user gets the per_user accounts followed by
+    the most of the accounts they follow, excluding themselves, accounts
+    they already follow and closed accounts. Readers keep seeing the old
+    rows until the caller commits.
+
+    Returns:
+        int: The number of stored suggestions.
+    """
+    if per_user is None:
+        per_user = get_database_settings().suggestions_per_user
+    if session.bind.dialect.name == "postgresql":
+        await session.execute(select(func.pg_advisory_xact_lock(REBUILD_LOCK_KEY)))
+    first = user_to_user.alias("first")
+    second = user_to_user.alias("second")
+    followed = user_to_user.alias("followed")
+    candidates = (
+        select(
+            first.c.follower_id.label("user_id"),
+            second.c.following_id.label("candidate_id"),
+            func.count().label("mutuals"),
+        )
+        .join(second, second.c.follower_id == first.c.following_id)
+        .join(User, User.id == second.c.following_id)
+        .where(
+            second.c.following_id != first.c.follower_id,
+            User.deleted_at.is_(None),
+            ~exists().where(
+                followed.c.follower_id == first.c.follower_id,
+                followed.c.following_id == second.c.following_id,
+            ),
+        )
+        .group_by(first.c.follower_id, second.c.following_id)
+        .subquery()
+    )
+    ranked = select(
+        candidates,
+        func.row_number()
+        .over(
+            partition_by=candidates.c.user_id,
+            order_by=(desc(candidates.c.mutuals), candidates.c.candidate_id),
+        )
+        .label("position"),
+    ).subquery()
+    await session.execute(delete(follow_suggestions))
+    result = await session.execute(
+        follow_suggestions.insert().from_select(
+            ["user_id", "candidate_id", "mutuals"],
+            select(ranked.c.user_id, ranked.c.candidate_id, ranked.c.mutuals).where(
+                ranked.c.position <= per_user
+            ),
+        )
+    )
+    return result.rowcount
+
+
+async def get_follow_suggestions(
+    session: AsyncSession, user_id: int, limit: int
+) -> List[Tuple[int, str, int]]:
+    """
+    (id, username, mutual follows) of the best suggestions for the user,
+    read through the (user_id, mutuals) index. Accounts followed or closed
+    since the last rebuild are skipped.
+    """
+    query = await session.execute(
+        select(User.id, User.username, follow_suggestions.c.mutuals)
+        .join(User, User.id == follow_suggestions.c.candidate_id)
+        .where(
+            follow_suggestions.c.user_id == user_id,
+            User.deleted_at.is_(None),
+            ~exists().where(
+                and_(
+                    user_to_user.c.follower_id == user_id,
+                    user_to_user.c.following_id == follow_suggestions.c.candidate_id,
+                )
+            ),
+        )
+        .order_by(desc(follow_suggestions.c.mutuals), follow_suggestions.c.candidate_id)
+        .limit(limit)
+    )
+    return [tuple(row) for row in query]
@@ -0,0 +1,145 @@
+from datetime import timedelta
+from itertools import chain
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import desc, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.text import extract_hashtags, extract_mentions
+
+from .models import Tag, Tweet, User, mentions, tweet_tags
+
+
+def insert_ignore(session: AsyncSession, table):
+    """INSERT ... ON CONFLICT DO NOTHING for the current dialect"""
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return sqlite.insert(table).on_conflict_do_nothing()
+
+
+async def save_tags_and_mentions(
+    session: AsyncSession, tweets: Sequence[Tuple[int, str]]
+) -> Dict[int, List[str]]:
+    """
+    Parse hashtags and @mentions out of the tweet texts and store them in
+    the tags, tweet_tags and mentions tables. The number of statements does
+    not depend on the number of tweets.
+
+    Args:
+        tweets: (tweet id, tweet text) of already flushed tweets.
+
+    Returns:
+        Dict[int, List[str]]: The normalized hashtags of every tweet.
+    """
+    tweet_tags_by_id = {tweet_id: extract_hashtags(text) for tweet_id, text in tweets}
+    all_tags = list(dict.fromkeys(chain.from_iterable(tweet_tags_by_id.values())))
+    if all_tags:
+        await session.execute(
+            insert_ignore(session, Tag), [{"name": tag} for tag in all_tags]
+        )
+        query = await session.execute(
+            select(Tag.name, Tag.id).where(Tag.name.in_(all_tags))
+        )
+        tag_ids = dict(query.all())
+        await session.execute(
+            insert(tweet_tags),
+            [
+                {"tweet_id": tweet_id, "tag_id": tag_ids[tag]}
+                for tweet_id, tags in tweet_tags_by_id.items()
+                for tag in tags
+            ],
+        )
+
+    mentioned = {tweet_id: extract_mentions(text) for tweet_id, text in tweets}
+    all_usernames = list(dict.fromkeys(chain.from_iterable(mentioned.values())))
+    if all_usernames:
+        query = await session.execute(
+            select(User.username, User.id).where(
+                User.username.in_(all_usernames), User.deleted_at.is_(None)
+            )
+        )
+        user_ids = dict(query.all())
+        rows = [
+            {"tweet_id": tweet_id, "user_id": user_ids[username]}
+            for tweet_id, usernames in mentioned.items()
+            for username in usernames
+            if username in user_ids
+        ]
+        if rows:
+            await session.execute(insert(mentions), rows)
+    return tweet_tags_by_id
+
+
+async def _tweets_page(
+    session: AsyncSession,
+    query,
+    tweet_id_column,
+    limit: int,
+    cursor: Optional[int],
+    options: Sequence,
+) -> Tuple[List[Tweet], Optional[int]]:
+    """Keyset pagination over tweet ids, newest first"""
+    query = query.where(Tweet.deleted_at.is_(None))
+    if cursor is not None:
+        query = query.where(tweet_id_column < cursor)
+    query = query.order_by(desc(tweet_id_column)).limit(limit + 1).options(*options)
+    tweets = (await session.scalars(query)).all()
+    next_cursor = tweets[limit - 1].id if len(tweets) > limit else None
+    return list(tweets[:limit]), next_cursor
+
+
+async def get_tweets_by_tag(
+    session: AsyncSession,
+    tag: str,
+    limit: int,
+    cursor: Optional[int] = None,
+    options: Sequence = (),
+) -> Tuple[List[Tweet], Optional[int]]:
+    """Tweets with the hashtag, read through the (tag_id, tweet_id) index"""
+    tag_id = select(Tag.id).where(Tag.name == tag.lower()).scalar_subquery()
+    query = (
+        select(Tweet)
+        .join(tweet_tags, tweet_tags.c.tweet_id == Tweet.id)
+        .where(tweet_tags.c.tag_id == tag_id)
+    )
+    return await _tweets_page(
+        session, query, tweet_tags.c.tweet_id, limit, cursor, options
+    )
+
+
+async def get_mentioned_tweets(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[int] = None,
+    options: Sequence = (),
+) -> Tuple[List[Tweet], Optional[int]]:
+    """Tweets mentioning the user, read through the (user_id, tweet_id) index"""
+    query = (
+        select(Tweet)
+        .join(mentions, mentions.c.tweet_id == Tweet.id)
+        .where(mentions.c.user_id == user_id)
+    )
+    return await _tweets_page(
+        session, query, mentions.c.tweet_id, limit, cursor, options
+    )
+
+
+async def get_recent_tag_usage(
+    session: AsyncSession, window_seconds: int
+) -> List[Tuple[str, float]]:
+    """(tag, age in seconds) for every tag usage inside the trending window"""
+    if session.bind.dialect.name == "postgresql":
+        age = func.extract("epoch", func.now() - Tweet.create_date)
+        since = func.now() - timedelta(seconds=window_seconds)
+    else:
+        age = func.strftime("%s", "now") - func.strftime("%s", Tweet.create_date)
+        since = func.datetime("now", f"-{window_seconds} seconds")
+    query = await session.execute(
+        select(Tag.name, age)
+        .join(tweet_tags, tweet_tags.c.tag_id == Tag.id)
+        .join(Tweet, Tweet.id == tweet_tags.c.tweet_id)
+        .where(Tweet.create_date >= since, Tweet.deleted_at.is_(None))
+    )
+    return [(name, float(seconds)) for name, seconds in query]
@@ -0,0 +1,194 @@
+import secrets
+from datetime import timedelta
+from typing import List, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import get_database_settings
+from .models import UploadSession
+
+
+def _expires_at():
+    ttl = get_database_settings().upload_session_ttl
+    return func.now() + timedelta(seconds=ttl)
+
+
+def _not_leased():
+    return or_(UploadSession.writer.is_(None), UploadSession.lease_until <= func.now())
+
+
+async def create_upload_session(
+    session: AsyncSession, user_id: int, filename: str, size: int
+) -> UploadSession:
+    upload = UploadSession(
+        id=secrets.token_urlsafe(24),
+        user_id=user_id,
+        filename=filename,
+        size=size,
+        received=0,
+        expires_at=_expires_at(),
+    )
+    session.add(upload)
+    await session.flush()
+    await session.refresh(upload)
+    return upload
+
+
+async def get_upload_session(
+    session: AsyncSession, upload_id: str, user_id: int, lock: bool = False
+) -> UploadSession:
+    """
+    The user's upload session. With lock=True the row stays locked until
+    the transaction ends, so two requests never finalize the same session.
+
+    Raises:
+        HTTPException: 404 if there is no such live session of the user,
+        409 if another request holds the lock.
+    """
+    query = select(UploadSession).where(
+        UploadSession.id == upload_id,
+        UploadSession.user_id == user_id,
+        UploadSession.expires_at > func.now(),
+    )
+    if lock:
+        query = query.with_for_update(nowait=True)
+    try:
+        upload = (await session.execute(query)).scalar_one_or_none()
+    except DBAPIError:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Another request is writing this upload.",
+        )
+    if upload is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session was not found!",
+        )
+    return upload
+
+
+async def lease_upload_session(
+    session: AsyncSession, upload_id: str, user_id: int, offset: int
+) -> Tuple[UploadSession, str]:
+    """
+    Lease the user's upload session to write the chunk at offset. The
+    lease is a token in the row, not a row lock: once the caller commits,
+    the chunk is streamed without holding a lock or a connection, and is
+    counted with commit_upload_chunk().
+
+    Returns:
+        The session and the writer token of the lease.
+
+    Raises:
+        HTTPException: 404 if there is no such live session of the user,
+        409 if offset is not the offset of the upload or another request
+        holds the lease.
+    """
+    token = secrets.token_hex(16)
+    lease = get_database_settings().upload_lease_seconds
+    query = (
+        update(UploadSession)
+        .where(
+            UploadSession.id == upload_id,
+            UploadSession.user_id == user_id,
+            UploadSession.expires_at > func.now(),
+            UploadSession.media_id.is_(None),
+            UploadSession.received == offset,
+            _not_leased(),
+        )
+        .values(
+            writer=token,
+            lease_until=func.now() + timedelta(seconds=lease),
+            expires_at=_expires_at(),
+        )
+        .returning(UploadSession)
+        .execution_options(populate_existing=True)
+    )
+    upload = (await session.scalars(query)).one_or_none()
+    if upload is not None:
+        return upload, token
+    upload = await get_upload_session(session, upload_id, user_id)
+    if upload.media_id is not None or offset != upload.received:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Expected offset {upload.received}",
+            headers={"Upload-Offset": str(upload.received)},
+        )
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Another request is writing this upload.",
+    )
+
+
+async def commit_upload_chunk(
+    session: AsyncSession, upload_id: str, token: str, offset: int, written: int
+) -> UploadSession:
+    """
+    Count a received chunk and release the lease. The offset only moves if
+    the request still holds its lease and the offset is still the one the
+    chunk was written at.
+
+    Raises:
+        HTTPException: 409 if the lease expired and went to another request.
+    """
+    query = (
+        update(UploadSession)
+        .where(
+            UploadSession.id == upload_id,
+            UploadSession.writer == token,
+            UploadSession.received == offset,
+        )
+        .values(
+            received=offset + written,
+            writer=None,
+            lease_until=None,
+            expires_at=_expires_at(),
+        )
+        .returning(UploadSession)
+        .execution_options(populate_existing=True)
+    )
+    upload = (await session.scalars(query)).one_or_none()
+    if upload is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The upload lease expired, resend the chunk.",
+        )
+    return upload
+
+
+async def release_upload_lease(session: AsyncSession, upload_id: str, token: str):
+    """Give the lease up without counting the chunk"""
+    await session.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload_id, UploadSession.writer == token)
+        .values(writer=None, lease_until=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def delete_expired_upload_sessions(
+    session: AsyncSession, limit: int
+) -> List[str]:
+    """
+    Delete up to limit expired sessions and return their ids. Sessions
+    locked by a finalizing request or leased by a chunk in progress are
+    skipped, so their files can be removed once the deletion commits.
+    """
+    expired = (
+        select(UploadSession.id)
+        .where(UploadSession.expires_at <= func.now(), _not_leased())
+        .order_by(UploadSession.expires_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    query = await session.execute(
+        delete(UploadSession)
+        .where(UploadSession.id.in_(expired))
+        .returning(UploadSession.id)
+        .execution_options(synchronize_session=False)
+    )
+    return list(query.scalars())
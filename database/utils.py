@@ -1,16 +1,123 @@
-from typing import List
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
 
 from fastapi import Depends, HTTPException, status
-from sqlalchemy import and_, desc, or_, select
+from sqlalchemy import (
+    Integer,
+    any_,
+    bindparam,
+    case,
+    delete,
+    desc,
+    insert,
+    literal,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from .database import async_get_db, engine
-from .models import Base, Like, Media, Tweet, User
+from schemas.tweet_sch import TweetIn
+from utils.setting import EXPORT_BATCH_SIZE, TWEETS_PARTITIONED
+
+from .changes import CREATED, log_tweet_changes
+from .counters import add_to_counters
+from .database import async_get_db, get_engine
+from .models import Base, Like, Media, Tweet, User, user_to_user
+from .ranking import add_tweet_scores
+from .tags import insert_ignore, save_tags_and_mentions
+from .versions import bump_versions
+
+
+@dataclass
+class CreatedTweet:
+    """Result of create_tweets for one tweet of the batch"""
+
+    tweet_id: int
+    tweet_data: str
+    media_paths: List[str] = field(default_factory=list)
+    media_ids: List[int] = field(default_factory=list)
+    skipped_media_ids: List[int] = field(default_factory=list)
+    tags: List[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class FeedItem:
+    """
+    One tweet of the feed, filled straight from SELECT rows.
+
+    Tweets without media or likes keep None instead of empty lists, so a
+    page of plain tweets costs one small object per tweet.
+    """
+
+    id: int
+    content: str
+    author_id: int
+    author_name: str
+    attachments: Optional[List[str]] = None
+    likes: Optional[List[Tuple[int, str]]] = None
+
+
+@lru_cache(maxsize=None)
+def _load_profiles():
+    # Функция, а не константа: backref-атрибуты (Tweet.user, Like.user,
+    # User.followers) появляются только после настройки мапперов.
+    # Опции не меняются, поэтому собираются один раз
+    return {
+        # Пользователь из api-key: только сама строка users
+        "auth": (),
+        # Профиль: подписки и подписчики
+        "profile": (selectinload(User.following), selectinload(User.followers)),
+        # Твиты для utils.feed.serialize_tweet: автор, лайки с их авторами, медиа
+        "feed": (
+            selectinload(Tweet.user),
+            selectinload(Tweet.likes).selectinload(Like.user),
+            selectinload(Tweet.media),
+        ),
+    }
+
+
+def load_options(profile: str) -> Tuple:
+    """
+    Loader options of a named query profile. Relationships are declared
+    with lazy="raise", so a query loads exactly the graph its profile names.
+    """
+    return _load_profiles()[profile]
+
+
+# Частые запросы собираются один раз, значения передаются bind-параметрами
+# при выполнении. Повторная сборка select() с опциями загрузки стоит дороже
+# самого запроса, а с готовым объектом SQLAlchemy сразу находит его
+# скомпилированную форму в кэше, а asyncpg - подготовленный оператор
+# (DB_STATEMENT_CACHE_SIZE)
+
+
+@lru_cache(maxsize=None)
+def _user_query(column: str, profile: str):
+    """A live user by api_key or id, with the loader options of the profile"""
+    return (
+        select(User)
+        .where(getattr(User, column) == bindparam(column), User.deleted_at.is_(None))
+        .options(*load_options(profile))
+    )
+
+
+@lru_cache(maxsize=None)
+def _like_query(in_partition: bool):
+    query = select(Like).where(
+        Like.user_id == bindparam("user_id"), Like.tweet_id == bindparam("tweet_id")
+    )
+    if in_partition:
+        query = query.where(Like.tweet_create_date == bindparam("tweet_create_date"))
+    return query
 
 
 async def init_models():
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
 
@@ -27,28 +134,17 @@ async def create_test_user_if_not_exist(session_: AsyncSession):
 async def get_user_by_api_key(
     api_key: str, session: AsyncSession = Depends(async_get_db)
 ):
-    query = (
-        select(User)
-        .where(User.api_key == api_key)
-        .options(
-            selectinload(User.following),
-            selectinload(User.followers),
-        )
-    )
-    user = await session.execute(query)
+    user = await session.execute(_user_query("api_key", "auth"), {"api_key": api_key})
 
     return user.scalar_one_or_none()
 
 
-async def get_user_by_id(user_id: int, session: AsyncSession = Depends(async_get_db)):
-    query = await session.execute(
-        select(User)
-        .where(User.id == user_id)
-        .options(
-            selectinload(User.following),
-            selectinload(User.followers),
-        )
-    )
+async def get_user_by_id(
+    user_id: int,
+    session: AsyncSession = Depends(async_get_db),
+    profile: str = "auth",
+):
+    query = await session.execute(_user_query("id", profile), {"id": user_id})
     user = query.scalars().one_or_none()
     if not user:
         raise HTTPException(
@@ -58,62 +154,145 @@ async def get_user_by_id(user_id: int, session: AsyncSession = Depends(async_get
     return user
 
 
-async def check_follow_user_ability(
-    current_user: User,
-    user_being_followed: User,
-) -> bool:
-    """Check if the following requests matches all the criteria"""
+async def get_following_ids(session: AsyncSession, user_id: int) -> List[int]:
+    """Ids of the users followed by the user, without loading User objects"""
+    query = await session.execute(
+        select(user_to_user.c.following_id).where(user_to_user.c.follower_id == user_id)
+    )
+    return list(query.scalars())
+
+
+async def follow(session: AsyncSession, follower_id: int, following_id: int) -> bool:
+    """
+    Add a user_to_user row without loading either user's followings.
 
-    if user_being_followed.id == current_user.id:
+    Returns:
+        bool: False if the follower already followed that user.
+    """
+    if follower_id == following_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Unable to follow yourself",
         )
-
-    elif user_being_followed in current_user.following:
+    result = await session.execute(
+        insert_ignore(session, user_to_user).values(
+            follower_id=follower_id, following_id=following_id
+        )
+    )
+    if result.rowcount == 0:
         return False
+    await add_to_counters(
+        session, {(follower_id, "following"): 1, (following_id, "followers"): 1}
+    )
     return True
 
 
-async def associate_media_with_tweet(
-    tweet: Tweet,
-    media_ids: List[int],
-    session: AsyncSession = Depends(async_get_db),
-):
+async def unfollow(session: AsyncSession, follower_id: int, following_id: int) -> bool:
     """
-    Associate one or more Media objects with a Tweet.
+    Delete a user_to_user row.
 
-    Args:
-        session (Session): The SQLAlchemy session.
-        tweet (Tweet): The Tweet object to associate with Media.
-        media_ids (List[int]): List of media IDs to associate with the Tweet.
+    Returns:
+        bool: False if the follower did not follow that user.
     """
-    media_query = await session.execute(select(Media).filter(Media.id.in_(media_ids)))
-
-    media_objects = media_query.scalars()
+    result = await session.execute(
+        delete(user_to_user).where(
+            user_to_user.c.follower_id == follower_id,
+            user_to_user.c.following_id == following_id,
+        )
+    )
+    if result.rowcount == 0:
+        return False
+    await add_to_counters(
+        session, {(follower_id, "following"): -1, (following_id, "followers"): -1}
+    )
+    return True
 
-    for media in media_objects:
-        if not media.tweet_id:
-            media.tweet_id = tweet.id
 
-    session.add_all(media_objects)
+def id_in(column, ids: Sequence[int], session: AsyncSession):
+    """
+    `column = ANY(:ids)` on PostgreSQL: a single array parameter keeps the
+    statement text the same for any number of ids. Other dialects use IN.
+    """
+    if session.bind.dialect.name == "postgresql":
+        return column == any_(literal(list(ids), ARRAY(Integer)))
+    return column.in_(ids)
 
 
-async def get_media_by_tweet_id(
-    tweet_id: int, session: AsyncSession = Depends(async_get_db)
-):
+async def attach_media(
+    session: AsyncSession, media_to_tweet: Dict[int, int]
+) -> Dict[int, Tuple[int, str]]:
     """
-    Get all Media objects associate with Tweet.
+    Attach media to tweets with a single UPDATE statement.
 
     Args:
         session (Session): The SQLAlchemy session.
-        tweet_id (int): The Tweet object id.
+        media_to_tweet (Dict[int, int]): Tweet id for every media id.
+
+    Returns:
+        Dict[int, Tuple[int, str]]: (tweet id, media path) for every media
+        that was attached. Media that do not exist or already belong to a
+        tweet are left untouched and are missing from the result.
+    """
+    if not media_to_tweet:
+        return dict()
+    query = await session.execute(
+        update(Media)
+        .where(
+            id_in(Media.id, list(media_to_tweet), session),
+            Media.tweet_id.is_(None),
+        )
+        .values(tweet_id=case(media_to_tweet, value=Media.id))
+        .returning(Media.id, Media.tweet_id, Media.media_path)
+        .execution_options(synchronize_session=False)
+    )
+    return {media_id: (tweet_id, path) for media_id, tweet_id, path in query}
+
+
+async def create_tweets(
+    session: AsyncSession, user_id: int, tweets: Sequence[TweetIn]
+) -> List[CreatedTweet]:
     """
-    media_query = await session.execute(
-        select(Media).filter(Media.tweet_id == tweet_id)
+    Create tweets of one author in a few set-based statements: one
+    INSERT ... RETURNING for the tweets, one UPDATE for all of their media
+    and one round of inserts for hashtags and mentions, whatever the size
+    of the batch. The caller commits.
+
+    A media id listed by several tweets of the batch goes to the first one.
+    """
+    query = await session.execute(
+        insert(Tweet).returning(Tweet.id, sort_by_parameter_order=True),
+        [{"user_id": user_id, "tweet_data": tweet.tweet_data} for tweet in tweets],
+    )
+    created = [
+        CreatedTweet(tweet_id=tweet_id, tweet_data=tweet.tweet_data)
+        for tweet_id, tweet in zip(query.scalars(), tweets)
+    ]
+
+    media_to_tweet: Dict[int, int] = dict()
+    for new_tweet, tweet in zip(created, tweets):
+        for media_id in tweet.tweet_media_ids or []:
+            media_to_tweet.setdefault(media_id, new_tweet.tweet_id)
+    attached = await attach_media(session, media_to_tweet)
+    await add_to_counters(session, {(user_id, "tweets"): len(created)})
+    await add_tweet_scores(session, [new_tweet.tweet_id for new_tweet in created])
+    await log_tweet_changes(
+        session, CREATED, [(new_tweet.tweet_id, user_id) for new_tweet in created]
     )
-    media_objects = media_query.scalars().all()
-    return media_objects
+    await bump_versions(session, feed=True)
+
+    tags = await save_tags_and_mentions(
+        session, [(new_tweet.tweet_id, new_tweet.tweet_data) for new_tweet in created]
+    )
+    for new_tweet, tweet in zip(created, tweets):
+        for media_id in dict.fromkeys(tweet.tweet_media_ids or []):
+            tweet_id, path = attached.get(media_id, (None, None))
+            if tweet_id == new_tweet.tweet_id:
+                new_tweet.media_ids.append(media_id)
+                new_tweet.media_paths.append(path)
+            else:
+                new_tweet.skipped_media_ids.append(media_id)
+        new_tweet.tags = tags.get(new_tweet.tweet_id, [])
+    return created
 
 
 async def get_tweet_by_id(
@@ -139,7 +318,7 @@ async def get_tweet_by_id(
     """
     tweet = await session.get(Tweet, tweet_id)
 
-    if not tweet:
+    if not tweet or tweet.deleted_at is not None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Tweet was not found!",
@@ -147,42 +326,151 @@ async def get_tweet_by_id(
     return tweet
 
 
-async def get_all_following_tweets(session: AsyncSession, current_user: User):
-    query = await session.execute(
+def home_feed_authors(user_id: int):
+    """The user and the accounts they follow, as a subquery"""
+    return (
+        select(user_to_user.c.following_id)
+        .where(user_to_user.c.follower_id == user_id)
+        .union_all(select(literal(user_id)))
+    )
+
+
+def _newer_than(since_id: int, include_ids: Sequence[int]):
+    """Tweets after since_id, and the given older ones committed late"""
+    older = [tweet_id for tweet_id in include_ids if tweet_id < since_id]
+    if older:
+        return or_(Tweet.id > since_id, Tweet.id.in_(older))
+    return Tweet.id > since_id
+
+
+async def get_all_following_tweets(
+    session: AsyncSession,
+    user_id: int,
+    since_id: Optional[int] = None,
+    include_ids: Sequence[int] = (),
+):
+    query = (
         select(Tweet)
         .where(
-            or_(
-                Tweet.user_id.in_(uuid.id for uuid in current_user.following),
-                Tweet.user_id == current_user.id,
-            )
+            Tweet.user_id.in_(home_feed_authors(user_id)),
+            Tweet.deleted_at.is_(None),
         )
-        .options(
-            selectinload(Tweet.user),
-            selectinload(Tweet.likes),
-            selectinload(Tweet.media),
+        .options(*load_options("feed"))
+        .order_by(desc(Tweet.create_date), desc(Tweet.id))
+    )
+    if since_id is not None:
+        query = query.where(_newer_than(since_id, include_ids))
+    return (await session.scalars(query)).all()
+
+
+async def get_feed_items(
+    session: AsyncSession,
+    tweet_ids: Optional[Sequence[int]] = None,
+    since_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    include_ids: Sequence[int] = (),
+) -> List[FeedItem]:
+    """
+    The feed as FeedItem rows, newest first (at most limit of them), or the
+    given tweets in the given order. With since_id only tweets with a
+    greater id are read, plus the include_ids ones.
+    Tweets, attachments and likes are read as plain tuples with three
+    queries, without building ORM objects.
+    """
+    query = (
+        select(
+            Tweet.id, Tweet.tweet_data, Tweet.user_id, User.username, Tweet.create_date
         )
-        .order_by(desc(Tweet.create_date))
+        .join(User, User.id == Tweet.user_id)
+        .where(Tweet.deleted_at.is_(None))
     )
+    if since_id is not None:
+        query = query.where(_newer_than(since_id, include_ids))
+    if tweet_ids is None:
+        query = query.order_by(desc(Tweet.create_date), desc(Tweet.id))
+        if limit is not None:
+            query = query.limit(limit)
+    elif not tweet_ids:
+        return []
+    else:
+        query = query.where(id_in(Tweet.id, tweet_ids, session))
+    rows = (await session.execute(query)).all()
+    if tweet_ids is not None:
+        position = {tweet_id: index for index, tweet_id in enumerate(tweet_ids)}
+        rows.sort(key=lambda row: position[row.id])
+    items = [FeedItem(*row[:4]) for row in rows]
+    if not items:
+        return items
+    by_id = {item.id: item for item in items}
+    tweet_ids = list(by_id)
 
-    return query.scalars().all()
-
-
-async def get_all_tweets(session: AsyncSession):
     query = await session.execute(
+        select(Media.tweet_id, Media.media_path)
+        .where(id_in(Media.tweet_id, tweet_ids, session))
+        .order_by(Media.id)
+    )
+    for tweet_id, media_path in query:
+        item = by_id[tweet_id]
+        if item.attachments is None:
+            item.attachments = []
+        item.attachments.append(media_path)
+
+    likes = (
+        select(Like.tweet_id, Like.user_id, User.username)
+        .join(User, User.id == Like.user_id)
+        .where(id_in(Like.tweet_id, tweet_ids, session))
+        .order_by(Like.id)
+    )
+    if TWEETS_PARTITIONED:
+        # Отсекает секции лайков старше самого старого твита ленты
+        oldest = min(row.create_date for row in rows)
+        likes = likes.where(Like.tweet_create_date >= oldest)
+    query = await session.execute(likes)
+    for tweet_id, user_id, username in query:
+        item = by_id[tweet_id]
+        if item.likes is None:
+            item.likes = []
+        item.likes.append((user_id, username))
+    return items
+
+
+async def stream_tweets(
+    session: AsyncSession,
+    user_id: Optional[int] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> AsyncIterator[Tweet]:
+    """
+    Iterate over the tweets (of one user or all of them), oldest first,
+    through a server-side cursor. Only one batch of rows is held in memory.
+    """
+    query = (
         select(Tweet)
-        .options(
-            selectinload(Tweet.user),
-            selectinload(Tweet.likes),
-            selectinload(Tweet.media),
-        )
-        .order_by(desc(Tweet.create_date))
+        .where(Tweet.deleted_at.is_(None))
+        .options(*load_options("feed"))
+        .order_by(Tweet.id)
+        .execution_options(yield_per=batch_size)
     )
-    return query.scalars().all()
+    if user_id is not None:
+        query = query.where(Tweet.user_id == user_id)
+    result = await session.stream_scalars(query)
+    async for tweet in result:
+        yield tweet
 
 
-async def get_like_by_id(session: AsyncSession, tweet_id: int, user_id: int):
-    """Get a like by user_id and tweet_id, or return None if not found"""
-    query = await session.execute(
-        select(Like).where(and_(Like.user_id == user_id, Like.tweet_id == tweet_id))
-    )
+async def get_like_by_id(
+    session: AsyncSession,
+    tweet_id: int,
+    user_id: int,
+    tweet_create_date: Optional[datetime] = None,
+):
+    """
+    Get a like by user_id and tweet_id, or return None if not found.
+    With partitioned likes, the date of the tweet limits the lookup to the
+    partition of its month.
+    """
+    params = {"user_id": user_id, "tweet_id": tweet_id}
+    in_partition = TWEETS_PARTITIONED and tweet_create_date is not None
+    if in_partition:
+        params["tweet_create_date"] = tweet_create_date
+    query = await session.execute(_like_query(in_partition), params)
     return query.scalar_one_or_none()
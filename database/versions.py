@@ -0,0 +1,61 @@
+import random
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import get_database_settings
+from .models import change_versions, change_versions_seq
+
+FEED = "feed"
+USER = "user"
+
+
+async def bump_versions(
+    session: AsyncSession,
+    feed: bool = False,
+    user_ids: Iterable[int] = (),
+    shards: Optional[int] = None,
+):
+    """
+    Give the feed and/or the profiles of the users a new version in the
+    current transaction. Like the user counters, every write goes to a
+    random shard row, so concurrent writers rarely wait for each other.
+    """
+    if shards is None:
+        shards = get_database_settings().counter_shards
+    keys = [(USER, user_id) for user_id in sorted(set(user_ids))]
+    if feed:
+        keys.insert(0, (FEED, 0))
+    if not keys:
+        return
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    insert = dialect.insert(change_versions).values(
+        [
+            {
+                "scope": scope,
+                "scope_id": scope_id,
+                "shard": random.randrange(shards),
+                "version": change_versions_seq.next_value(),
+            }
+            for scope, scope_id in keys
+        ]
+    )
+    await session.execute(
+        insert.on_conflict_do_update(
+            index_elements=["scope", "scope_id", "shard"],
+            set_={"version": insert.excluded.version},
+        )
+    )
+
+
+async def get_version(session: AsyncSession, scope: str, scope_id: int = 0) -> int:
+    """The current version: an index-only read of the scope's shard rows"""
+    version = await session.scalar(
+        select(func.max(change_versions.c.version)).where(
+            change_versions.c.scope == scope,
+            change_versions.c.scope_id == scope_id,
+        )
+    )
+    return version or 0
@@ -1,4 +1,6 @@
-from pydantic import BaseModel, Field
+from pathlib import Path
+
+from pydantic import BaseModel, Field, field_validator
 
 from .base_sch import ConfigDict, DefaultSchema
 
@@ -10,3 +12,15 @@ class MediaUpload(DefaultSchema):
 
 class Media(BaseModel):
     media_path: str
+
+
+class UploadSessionIn(BaseModel):
+    filename: str = Field(min_length=1, max_length=255)
+    size: int = Field(gt=0)
+
+    @field_validator("filename")
+    @classmethod
+    def plain_name(cls, filename: str) -> str:
+        if filename in (".", "..") or Path(filename).name != filename:
+            raise ValueError("filename must not contain a path")
+        return filename
@@ -3,6 +3,7 @@ from typing import List, Optional
 from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 
 from database.models import Like as LikeModel
+from utils.setting import TWEET_BATCH_MAX_SIZE
 
 from .base_sch import DefaultSchema
 from .media_sch import Media
@@ -34,6 +35,20 @@ class TweetCreate(DefaultSchema):
     tweet_id: int
 
 
+class TweetBatchIn(BaseModel):
+    tweets: List[TweetIn] = Field(min_length=1, max_length=TWEET_BATCH_MAX_SIZE)
+
+
+class TweetBatchItem(BaseModel):
+    tweet_id: int
+    media_ids: List[int]
+    skipped_media_ids: List[int]
+
+
+class TweetBatchOut(DefaultSchema):
+    tweets: List[TweetBatchItem]
+
+
 class Tweet(BaseModel):
     model_config = ConfigDict(
         from_attributes=True,
@@ -53,3 +68,5 @@ class Tweet(BaseModel):
 
 class TweetOut(DefaultSchema):
     tweets: List[Tweet]
+    # Для следующего запроса с since_id, см. database.changes
+    watermark: int
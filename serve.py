@@ -0,0 +1,84 @@
+"""
+Production entry point.
+
+Runs the app with several uvicorn worker processes (one per available CPU
+by default), uvloop and httptools. Rate limits and stream events are only
+shared between workers through Redis, so with RATE_LIMIT_BACKEND or
+PUBSUB_BACKEND left at memory a single worker is started:
+    python serve.py
+For development with autoreload (single process):
+    python serve.py --reload
+"""
+
+import argparse
+import logging
+from typing import Any, Dict
+
+import uvicorn
+
+from utils.setting import Settings, get_settings
+
+logger = logging.getLogger("serve")
+
+
+def worker_count(requested: int, settings: Settings) -> int:
+    """The requested number of workers if their state can be shared, else 1"""
+    local = [
+        name
+        for name, backend in (
+            ("RATE_LIMIT_BACKEND", settings.rate_limit_backend),
+            ("PUBSUB_BACKEND", settings.pubsub_backend),
+        )
+        if backend != "redis"
+    ]
+    if requested > 1 and local:
+        logger.warning(
+            "%s not set to redis, the state of the workers would diverge: "
+            "starting 1 worker instead of %s",
+            ", ".join(local),
+            requested,
+        )
+        return 1
+    return max(requested, 1)
+
+
+def build_config(settings: Settings, reload: bool = False) -> Dict[str, Any]:
+    config: Dict[str, Any] = dict(
+        host=settings.server_host,
+        port=settings.server_port,
+        loop="uvloop",
+        http="httptools",
+        timeout_keep_alive=settings.keep_alive_timeout,
+        timeout_graceful_shutdown=settings.graceful_shutdown_timeout,
+        access_log=settings.access_log,
+    )
+    if reload:
+        config.update(reload=True, loop="auto", http="auto", access_log=True)
+        return config
+    config.update(workers=worker_count(settings.web_concurrency, settings))
+    if settings.max_requests > 0:
+        # Упавший или отработавший лимит воркер uvicorn перезапускает сам
+        config.update(limit_max_requests=settings.max_requests)
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--reload", action="store_true", help="single process with autoreload"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:  %(message)s")
+    # app.env читается здесь, воркеры читают его снова в create_app()
+    config = build_config(get_settings(), reload=args.reload)
+    logger.info(
+        "Starting: %s",
+        ", ".join(f"{key}={value}" for key, value in sorted(config.items())),
+    )
+    # Каждый воркер собирает своё приложение при старте
+    uvicorn.run("app:create_app", factory=True, **config)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import os
 from collections.abc import AsyncGenerator
+from dataclasses import replace
 from pathlib import Path
-from typing import Dict, Mapping
+from typing import Dict, Iterable, Mapping
 
 import httpx
 import pytest
@@ -10,12 +11,17 @@ from dotenv import load_dotenv
 from faker import Faker
 from fastapi import FastAPI
 from httpx import AsyncClient
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
-from app import app
+from app import create_app
 from database.database import Base
 from database.database import async_get_db as get_db_session
-from database.models import Tweet, User
+from database.database import configure_database, dispose_database
+from database.models import Like, Tweet, User
+from database.partitions import ensure_partitions
+from utils.setting import Settings
+from utils.tasks import task_queue
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 ENV_PATH = BASE_DIR / "app_test.env"
@@ -31,6 +37,15 @@ print("DB_HOST:", os.getenv("DB_HOST"))
 TEST_USERNAME = os.environ.get("USERNAME")
 TEST_API_KEY = os.environ.get("API_KEY")
 TEST_SERVER_PORT = os.environ.get("SERVER_PORT")
+TEST_SETTINGS = Settings(
+    database_url=(
+        f'postgresql+asyncpg://{os.environ.get("DB_USERNAME")}:'
+        f'{os.environ.get("DB_PASSWORD")}@'
+        f'{os.environ.get("DB_HOST")}'
+        f':5432/{os.environ.get("DB_NAME")}'
+    ),
+    database_echo=True,
+)
 
 unauthorized_structure_response: Dict = {
     "result": False,
@@ -39,20 +54,34 @@ unauthorized_structure_response: Dict = {
 }
 
 
+async def add_likes(session: AsyncSession, tweet_id: int, user_ids: Iterable[int]):
+    """Likes of the users on the tweet, with the date of its partition"""
+    create_date = await session.scalar(
+        select(Tweet.create_date).where(Tweet.id == tweet_id)
+    )
+    session.add_all(
+        Like(user_id=user_id, tweet_id=tweet_id, tweet_create_date=create_date)
+        for user_id in user_ids
+    )
+
+
+def override_settings(app: FastAPI, monkeypatch, **changes):
+    """Change the settings the handlers of the app read, for one test"""
+    monkeypatch.setattr(app.state, "settings", replace(app.state.settings, **changes))
+
+
 @pytest_asyncio.fixture()
 async def db_session() -> AsyncGenerator[AsyncSession, None]:
-    DATABASE_URL = (
-        f'postgresql+asyncpg://{os.environ.get("DB_USERNAME")}:'
-        f'{os.environ.get("DB_PASSWORD")}@'
-        f'{os.environ.get("DB_HOST")}'
-        f':5432/{os.environ.get("DB_NAME")}'
-    )
-    engine = create_async_engine(DATABASE_URL, echo=True)
+    engine = create_async_engine(TEST_SETTINGS.database_url, echo=True)
     async_session = async_sessionmaker(engine, expire_on_commit=False)
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
+        # CASCADE: база могла остаться от прогона с другой схемой твитов
+        # (TWEETS_PARTITIONED), её внешних ключей нет в метаданных
+        for table in reversed(Base.metadata.sorted_tables):
+            await conn.execute(text(f"DROP TABLE IF EXISTS {table.name} CASCADE"))
         await conn.run_sync(Base.metadata.create_all)
     async with async_session() as session:
+        await ensure_partitions(session)
         test_user = User(api_key=TEST_API_KEY, username=TEST_USERNAME)
         session.add(test_user)
         fake_users = [
@@ -64,11 +93,42 @@ async def db_session() -> AsyncGenerator[AsyncSession, None]:
         await session.close()
 
 
+@pytest.fixture(autouse=True)
+def reset_rate_limits(application: FastAPI):
+    """Requests of previous tests must not count towards the limits"""
+    application.state.rate_limiter.store.clear()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def app_engine():
+    """
+    httpx does not run the lifespan of the app, so the engine and the task
+    queue used by background jobs are configured for the test database here.
+    """
+    configure_database(TEST_SETTINGS)
+    task_queue.configure(TEST_SETTINGS)
+
+
+@pytest.fixture(scope="session")
+def application() -> FastAPI:
+    return create_app(TEST_SETTINGS)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def dispose_app_engine():
+    """
+    Background jobs use the application engine directly. Its pooled
+    connections belong to the event loop of the test that opened them.
+    """
+    yield
+    await dispose_database()
+
+
 @pytest.fixture()
-def test_app(db_session: AsyncSession) -> FastAPI:
+def test_app(application: FastAPI, db_session: AsyncSession) -> FastAPI:
     """Create a test app with overridden dependencies."""
-    app.dependency_overrides[get_db_session] = lambda: db_session
-    return app
+    application.dependency_overrides[get_db_session] = lambda: db_session
+    return application
 
 
 @pytest_asyncio.fixture()
@@ -0,0 +1,128 @@
+import tracemalloc
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.counters import get_counters, reconcile_counters
+from database.models import Like, Media, Tweet, User, user_to_user
+from database.purge import purge_user, soft_delete_user
+from utils.tasks import task_queue
+
+TWEETS = 3000
+
+
+async def count(session: AsyncSession, table, *where) -> int:
+    return await session.scalar(select(func.count()).select_from(table).where(*where))
+
+
+async def make_synthetic_account(session: AsyncSession):
+    """User 2 with TWEETS tweets, 3 * TWEETS likes on them and follows"""
+    await session.commit()
+    for statement in (
+        "INSERT INTO tweets (user_id, tweet_data) "
+        f"SELECT user_id, 'tweet ' || n FROM generate_series(1, {TWEETS}) n, "
+        "(VALUES (2), (3)) users (user_id)",
+        "INSERT INTO likes (user_id, tweet_id, tweet_create_date) "
+        "SELECT users.user_id, tweets.id, tweets.create_date "
+        "FROM tweets, (VALUES (1), (3), (4)) users (user_id) "
+        "WHERE tweets.user_id = 2",
+        "INSERT INTO likes (user_id, tweet_id, tweet_create_date) "
+        "SELECT 2, id, create_date FROM tweets WHERE user_id = 3",
+        "INSERT INTO media (media_path, tweet_id) SELECT id || '.png', id "
+        "FROM tweets WHERE user_id = 2 AND id % 3 = 0",
+        "INSERT INTO user_to_user (follower_id, following_id) VALUES "
+        "(2, 1), (2, 3), (2, 4), (1, 2), (3, 2), (4, 2), (3, 4)",
+    ):
+        await session.execute(text(statement))
+    await session.commit()
+    await reconcile_counters(session)
+    await session.commit()
+
+
+@pytest.mark.asyncio
+class TestAccountDeletion:
+    async def test_purge_large_account(self, db_session: AsyncSession):
+        await make_synthetic_account(db_session)
+        assert await count(db_session, Like) == 4 * TWEETS
+
+        removed_files = []
+
+        async def on_media(paths):
+            removed_files.extend(paths)
+
+        await soft_delete_user(db_session, 2)
+        await db_session.commit()
+        tracemalloc.start()
+        deleted = await purge_user(db_session, 2, batch_size=500, on_media=on_media)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert deleted == {
+            "follows": 6,
+            "likes": TWEETS,
+            "received_likes": 3 * TWEETS,
+            "media": TWEETS // 3,
+            "tweets": TWEETS,
+        }
+        # Память не зависит от размера аккаунта: в Python только куски id
+        assert peak < 4 * 2**20
+        assert len(removed_files) == TWEETS // 3
+        assert await count(db_session, User, User.id == 2) == 0
+        assert await count(db_session, Tweet) == TWEETS
+        assert await count(db_session, Like) == 0
+        assert await count(db_session, Media) == 0
+        assert await count(db_session, user_to_user) == 1
+
+        # Счётчики других пользователей поправлены по ходу удаления
+        assert await reconcile_counters(db_session) == 0
+        assert await get_counters(db_session, 3) == {
+            "followers": 0,
+            "following": 1,
+            "tweets": TWEETS,
+            "likes": 0,
+        }
+
+    async def test_files_survive_failed_commit(
+        self, db_session: AsyncSession, monkeypatch
+    ):
+        tweet = Tweet(user_id=2, tweet_data="with media")
+        db_session.add(tweet)
+        await db_session.flush()
+        db_session.add(Media(media_path="photo.png", tweet_id=tweet.id))
+        await soft_delete_user(db_session, 2)
+        await db_session.commit()
+
+        removed = []
+
+        async def on_media(paths):
+            removed.extend(paths)
+
+        real_commit = db_session.commit
+
+        async def commit():
+            # Падает коммит, который удалил бы строку media
+            if await count(db_session, Media) == 0:
+                raise ConnectionError("connection lost")
+            await real_commit()
+
+        monkeypatch.setattr(db_session, "commit", commit)
+        with pytest.raises(ConnectionError):
+            await purge_user(db_session, 2, on_media=on_media)
+        monkeypatch.undo()
+        await db_session.rollback()
+        assert removed == []
+        assert await count(db_session, Media) == 1
+
+    async def test_delete_my_account(self, client: AsyncClient, db_session):
+        await client.post("/tweets", json={"tweet_data": "last words"})
+
+        response = await client.delete("/users/me")
+        assert response.status_code == 200
+        assert response.json() == {"result": True}
+        assert (await client.get("/users/me")).status_code == 401
+
+        await task_queue.join()
+        assert await count(db_session, User, User.id == 1) == 0
+        assert await count(db_session, Tweet) == 0
@@ -0,0 +1,65 @@
+import io
+
+import pytest
+from httpx import AsyncClient
+
+
+async def upload(client: AsyncClient, name: str) -> int:
+    file = (name, io.BytesIO(b"data"), "text/plain")
+    response = await client.post("/medias", files={"file": file})
+    return response.json()["media_id"]
+
+
+@pytest.mark.asyncio
+class TestBatchAPI:
+    async def test_create_tweets_batch(self, client: AsyncClient):
+        first_media = await upload(client, "batch.txt")
+        second_media = await upload(client, "batch.txt")
+
+        response = await client.post(
+            "/tweets/batch",
+            json={
+                "tweets": [
+                    {"tweet_data": "first #batch", "tweet_media_ids": [first_media]},
+                    {"tweet_data": "second"},
+                    {
+                        "tweet_data": "third",
+                        "tweet_media_ids": [first_media, second_media, 999],
+                    },
+                ]
+            },
+        )
+        data = response.json()
+        assert response.status_code == 201
+        assert data["result"] is True
+        assert data["tweets"] == [
+            {"tweet_id": 1, "media_ids": [first_media], "skipped_media_ids": []},
+            {"tweet_id": 2, "media_ids": [], "skipped_media_ids": []},
+            {
+                "tweet_id": 3,
+                "media_ids": [second_media],
+                "skipped_media_ids": [first_media, 999],
+            },
+        ]
+
+        response = await client.get("/tweets")
+        tweets = {tweet["id"]: tweet for tweet in response.json()["tweets"]}
+        assert len(tweets[1]["attachments"]) == 1
+        assert len(tweets[3]["attachments"]) == 1
+
+        response = await client.get("/tags/batch")
+        assert [tweet["id"] for tweet in response.json()["tweets"]] == [1]
+
+    async def test_empty_batch_is_rejected(self, client: AsyncClient):
+        response = await client.post("/tweets/batch", json={"tweets": []})
+        assert response.status_code == 422
+
+    async def test_create_tweet_with_media(self, client: AsyncClient):
+        media_id = await upload(client, "single.txt")
+        response = await client.post(
+            "/tweets", json={"tweet_data": "with media", "tweet_media_ids": [media_id]}
+        )
+        assert response.status_code == 201
+
+        response = await client.get("/tweets")
+        assert len(response.json()["tweets"][0]["attachments"]) == 1
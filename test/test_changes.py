@@ -0,0 +1,96 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from database.changes import trim_tweet_changes
+from database.utils import create_tweets
+from schemas.tweet_sch import TweetIn
+
+from .conftest import TEST_SETTINGS
+
+OTHER_USER = {"api-key": "fake_api_key1"}
+
+
+@pytest.mark.asyncio
+class TestIncrementalFeed:
+    async def post_tweet(self, client: AsyncClient, text: str, headers=None) -> int:
+        response = await client.post(
+            "/tweets", json={"tweet_data": text}, headers=headers
+        )
+        return response.json()["tweet_id"]
+
+    async def test_since_id_and_changes(
+        self, client: AsyncClient, db_session: AsyncSession
+    ):
+        await db_session.commit()
+        liked = await self.post_tweet(client, "liked", OTHER_USER)
+        deleted = await self.post_tweet(client, "deleted")
+        response = await client.get("/tweets")
+        body = response.json()
+        assert [tweet["id"] for tweet in body["tweets"]] == [deleted, liked]
+        watermark = body["watermark"]
+
+        assert (await client.post(f"/tweets/{liked}/likes")).status_code == 201
+        await client.delete(f"/tweets/{deleted}")
+        new = await self.post_tweet(client, "new", OTHER_USER)
+
+        response = await client.get(
+            "/tweets", params={"since_id": deleted, "watermark": watermark}
+        )
+        body = response.json()
+        assert [tweet["id"] for tweet in body["tweets"]] == [new]
+        assert body["changes"] == {
+            "likes": [{"id": liked, "likes": 1}],
+            "deleted": [deleted],
+        }
+        assert body["resync"] is False
+        assert body["watermark"] > watermark
+
+        # Журнал после клиента очищен: клиент должен перечитать ленту
+        assert await trim_tweet_changes(db_session, retention_seconds=-60) == 5
+        response = await client.get("/tweets", params={"watermark": watermark})
+        assert response.json()["resync"] is True
+
+    async def test_home_feed_changes(self, client: AsyncClient):
+        liked = await self.post_tweet(client, "not followed", OTHER_USER)
+        response = await client.get("/tweets/1")
+        watermark = response.json()["watermark"]
+        await client.post(f"/tweets/{liked}/likes")
+
+        response = await client.get("/tweets/1", params={"watermark": watermark})
+        assert response.json()["changes"]["likes"] == []
+        await client.post("http://localhost/users/2/follow")
+        response = await client.get(
+            "/tweets/1", params={"since_id": liked, "watermark": watermark}
+        )
+        body = response.json()
+        assert body["tweets"] == []
+        assert body["changes"]["likes"] == [{"id": liked, "likes": 1}]
+
+    async def test_late_commit_is_not_skipped(
+        self, client: AsyncClient, db_session: AsyncSession
+    ):
+        await db_session.commit()
+        engine = create_async_engine(TEST_SETTINGS.database_url)
+        async with AsyncSession(engine) as long_session:
+            # Твит получил id раньше, а закоммичен позже следующего
+            late = await create_tweets(long_session, 2, [TweetIn(tweet_data="late")])
+            new = await self.post_tweet(client, "new")
+            # Полная лента: водяной знак не выше открытой транзакции
+            response = await client.get("/tweets")
+            body = response.json()
+            assert [tweet["id"] for tweet in body["tweets"]] == [new]
+            await long_session.commit()
+        await engine.dispose()
+
+        response = await client.get(
+            "/tweets", params={"since_id": new, "watermark": body["watermark"]}
+        )
+        assert [tweet["id"] for tweet in response.json()["tweets"]] == [
+            late[0].tweet_id
+        ]
+
+    @pytest.mark.parametrize("url", ["/tweets", "/tweets/1"])
+    async def test_since_id_needs_watermark(self, client: AsyncClient, url: str):
+        response = await client.get(url, params={"since_id": 1})
+        assert response.status_code == 422
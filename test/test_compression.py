@@ -0,0 +1,165 @@
+import asyncio
+import gzip
+import zlib
+
+import brotli
+import httpx
+import pytest
+import zstandard
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from utils.compression import (
+    COMPRESSORS,
+    CompressionMiddleware,
+    choose_encoding,
+    compress,
+)
+
+FEED = b'{"result":true,"tweets":[' + b'{"id":1,"content":"hi"},' * 200 + b"]}"
+
+DECOMPRESSORS = {
+    "gzip": gzip.decompress,
+    "br": brotli.decompress,
+    # Потоковый zstd не пишет размер в заголовок кадра
+    "zstd": lambda body: zstandard.ZstdDecompressor().decompressobj().decompress(body),
+}
+
+
+async def stream_feed(request):
+    async def chunks():
+        for _ in range(3):
+            yield FEED
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+async def get(path: str, **headers) -> httpx.Response:
+    app = Starlette(
+        routes=[
+            Route(
+                "/feed",
+                lambda request: Response(
+                    FEED, media_type="application/json", headers={"etag": '"1-2"'}
+                ),
+            ),
+            Route(
+                "/small", lambda request: Response(b"{}", media_type="application/json")
+            ),
+            Route("/image", lambda request: Response(FEED, media_type="image/png")),
+            Route(
+                "/encoded",
+                lambda request: Response(
+                    gzip.compress(FEED),
+                    media_type="application/json",
+                    headers={"content-encoding": "gzip"},
+                ),
+            ),
+            Route("/stream", stream_feed),
+        ]
+    )
+    app.add_middleware(CompressionMiddleware, minimum_size=1024, threadpool_size=4096)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        return await c.get(path, headers=headers)
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, br", ["br", "gzip"]) == "br"
+    assert choose_encoding("gzip, br;q=0", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("identity", ["br", "gzip"]) is None
+    assert choose_encoding("") is None
+    assert choose_encoding("gzip, br, zstd") == "zstd"
+
+
+@pytest.mark.parametrize("encoding", list(COMPRESSORS))
+def test_compress_round_trip(encoding: str):
+    body = compress(FEED, encoding)
+    assert len(body) < len(FEED)
+    assert DECOMPRESSORS[encoding](body) == FEED
+
+
+@pytest.mark.asyncio
+class TestCompressionMiddleware:
+    async def test_large_body_is_compressed(self):
+        response = await get("/feed", **{"accept-encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(FEED)
+        assert response.headers["etag"] == 'W/"1-2"'
+        assert response.content == FEED
+
+    async def test_identity(self):
+        response = await get("/feed", **{"accept-encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["etag"] == '"1-2"'
+        assert response.content == FEED
+
+    async def test_small_body_is_not_compressed(self):
+        response = await get("/small", **{"accept-encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+        assert response.content == b"{}"
+
+    async def test_incompressible_type_is_skipped(self):
+        response = await get("/image", **{"accept-encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+    async def test_encoded_response_is_not_compressed_again(self):
+        response = await get("/encoded", **{"accept-encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.content == FEED
+
+    async def test_stream_is_compressed_chunk_by_chunk(self):
+        chunks = []
+
+        app = CompressionMiddleware(
+            Starlette(routes=[Route("/stream", stream_feed)]),
+            minimum_size=1024,
+            threadpool_size=64 * 1024,
+        )
+
+        requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            # Клиент не отключается, пока поток не закончится
+            await asyncio.Event().wait()
+
+        async def send(message):
+            chunks.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/stream",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"accept-encoding", b"gzip")],
+        }
+        await app(scope, receive, send)
+        headers = dict(chunks[0]["headers"])
+        assert headers[b"content-encoding"] == b"gzip"
+        assert b"content-length" not in headers
+        bodies = [message["body"] for message in chunks[1:]]
+        decompressor = zlib.decompressobj(31)
+        # Каждая часть разжимается сразу, не дожидаясь конца потока
+        assert decompressor.decompress(bodies[0]) == FEED
+        assert decompressor.decompress(b"".join(bodies[1:])) == FEED * 2
+        assert decompressor.eof
+
+    @pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+    async def test_stream_over_http(self, encoding: str):
+        response = await get("/stream", **{"accept-encoding": encoding})
+        assert response.headers["content-encoding"] == encoding
+        assert response.content == FEED * 3
+
+
+@pytest.mark.asyncio
+async def test_api_feed_is_compressed(client: httpx.AsyncClient):
+    for number in range(20):
+        await client.post("/tweets", json={"tweet_data": f"tweet number {number}"})
+    response = await client.get("/tweets", headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["result"] is True
@@ -0,0 +1,75 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.counters import add_to_counters, get_counters, reconcile_counters
+from database.models import user_counters
+from utils.tasks import task_queue
+
+from .conftest import add_likes
+
+FOLLOW_URL = "http://localhost/users/{}/follow"
+
+
+async def counters(client: AsyncClient, user_id: int):
+    response = await client.get(f"/users/{user_id}")
+    return response.json()["user"]["counters"]
+
+
+@pytest.mark.asyncio
+class TestCounters:
+    async def test_counters_follow_writes(
+        self, client: AsyncClient, db_session: AsyncSession
+    ):
+        await client.post(FOLLOW_URL.format(2))
+        await client.post(FOLLOW_URL.format(2))
+        await client.post(FOLLOW_URL.format(3))
+        tweet_ids = [
+            (await client.post("/tweets", json={"tweet_data": text})).json()["tweet_id"]
+            for text in ("one", "two")
+        ]
+        await add_likes(db_session, tweet_ids[0], [2])
+        await add_to_counters(db_session, {(1, "likes"): 1})
+        await db_session.commit()
+
+        me = (await client.get("/users/me")).json()["user"]["counters"]
+        assert me == {"followers": 0, "following": 2, "tweets": 2, "likes": 1}
+        assert (await counters(client, 2))["followers"] == 1
+
+        await client.delete(f"/tweets/{tweet_ids[0]}")
+        await client.delete(FOLLOW_URL.format(3))
+        # Лайки удалённого твита вычитает фоновая очистка
+        await task_queue.join()
+        me = await counters(client, 1)
+        assert me == {"followers": 0, "following": 1, "tweets": 1, "likes": 0}
+        assert await reconcile_counters(db_session) == 0
+
+    async def test_reconcile_fixes_drift(self, db_session: AsyncSession):
+        await db_session.commit()
+        await add_to_counters(db_session, {(2, "tweets"): 5, (3, "followers"): -1})
+        await db_session.execute(
+            insert(user_counters), [{"user_id": 2, "name": "likes", "shard": 3}]
+        )
+        await db_session.commit()
+
+        assert await reconcile_counters(db_session) == 2
+        await db_session.commit()
+        assert await get_counters(db_session, 2) == dict.fromkeys(
+            ("followers", "following", "tweets", "likes"), 0
+        )
+        assert (await get_counters(db_session, 3))["followers"] == 0
+        assert await reconcile_counters(db_session) == 0
+
+    async def test_increments_spread_over_shards(self, db_session: AsyncSession):
+        await db_session.commit()
+        for _ in range(50):
+            await add_to_counters(db_session, {(2, "followers"): 1})
+        await db_session.commit()
+        shards = (
+            await db_session.scalars(
+                select(user_counters.c.shard).where(user_counters.c.user_id == 2)
+            )
+        ).all()
+        assert len(shards) > 1
+        assert (await get_counters(db_session, 2))["followers"] == 50
@@ -0,0 +1,55 @@
+import pytest
+from httpx import AsyncClient
+
+from utils.etag import etag_matches
+
+
+def test_etag_matches():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
+
+
+@pytest.mark.asyncio
+class TestConditionalGet:
+    async def revalidate(self, client: AsyncClient, url: str, etag: str):
+        return await client.get(url, headers={"if-none-match": etag})
+
+    async def test_feed(self, client: AsyncClient):
+        response = await client.get("/tweets")
+        etag = response.headers["etag"]
+        response = await self.revalidate(client, "/tweets", etag)
+        assert response.status_code == 304
+        assert response.content == b""
+
+        tweet_id = (await client.post("/tweets", json={"tweet_data": "hi"})).json()[
+            "tweet_id"
+        ]
+        response = await self.revalidate(client, "/tweets", etag)
+        assert response.status_code == 200
+        assert response.json()["tweets"][0]["id"] == tweet_id
+        assert response.headers["etag"] != etag
+
+        top = await client.get("/tweets", params={"order": "top"})
+        assert top.headers["etag"] != response.headers["etag"]
+        await client.post("http://localhost/users/2/follow")
+        response = await client.get(
+            "/tweets",
+            params={"order": "top"},
+            headers={"if-none-match": top.headers["etag"]},
+        )
+        assert response.status_code == 200
+
+    async def test_profile(self, client: AsyncClient):
+        etag = (await client.get("/users/2")).headers["etag"]
+        await client.post("http://localhost/users/3/follow")
+        assert (await self.revalidate(client, "/users/2", etag)).status_code == 304
+
+        await client.post("http://localhost/users/2/follow")
+        response = await self.revalidate(client, "/users/2", etag)
+        assert response.status_code == 200
+        assert response.json()["user"]["counters"]["followers"] == 1
+
+        me = (await client.get("/users/me")).headers["etag"]
+        assert (await self.revalidate(client, "/users/me", me)).status_code == 304
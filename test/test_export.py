@@ -0,0 +1,77 @@
+import json
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import utils.export
+from utils.export import encode_export
+
+from .conftest import add_likes, override_settings
+
+
+async def post_tweets(client: AsyncClient, texts):
+    return [
+        (await client.post("/tweets", json={"tweet_data": text})).json()["tweet_id"]
+        for text in texts
+    ]
+
+
+@pytest.mark.asyncio
+class TestExportAPI:
+    async def test_export_ndjson(
+        self, client: AsyncClient, db_session: AsyncSession, create_random_tweets
+    ):
+        tweet_ids = await post_tweets(client, ["first", "second", "третий"])
+        await add_likes(db_session, tweet_ids[0], [2])
+        await db_session.commit()
+
+        response = await client.get("/users/me/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "attachment" in response.headers["content-disposition"]
+        items = [json.loads(line) for line in response.text.splitlines()]
+        assert [item["id"] for item in items] == tweet_ids
+        assert [item["content"] for item in items] == ["first", "second", "третий"]
+        assert {item["author"]["id"] for item in items} == {1}
+        assert items[0]["likes"] == [{"user_id": 2, "name": "fake_user1"}]
+        assert items[0]["created_at"]
+
+    async def test_export_json_array(self, client: AsyncClient):
+        response = await client.get("/users/me/export", params={"format": "json"})
+        assert response.status_code == 200
+        assert response.json() == []
+
+        tweet_ids = await post_tweets(client, ["one", "two"])
+        response = await client.get("/users/me/export", params={"format": "json"})
+        assert [item["id"] for item in response.json()] == tweet_ids
+
+    async def test_export_wrong_format(self, client: AsyncClient):
+        response = await client.get("/users/me/export", params={"format": "xml"})
+        assert response.status_code == 422
+
+    async def test_admin_export(
+        self, client: AsyncClient, test_app, create_random_tweets, monkeypatch
+    ):
+        response = await client.get("/admin/tweets/export")
+        assert response.status_code == 403
+
+        override_settings(test_app, monkeypatch, admin_api_keys=frozenset({"test"}))
+        response = await client.get("/admin/tweets/export")
+        assert response.status_code == 200
+        authors = {
+            json.loads(line)["author"]["id"] for line in response.text.splitlines()
+        }
+        assert authors == {2, 3, 4, 5}
+
+
+@pytest.mark.asyncio
+async def test_encode_export_chunks(monkeypatch):
+    async def tweets():
+        for number in range(10):
+            yield number
+
+    monkeypatch.setattr(utils.export, "export_item", lambda n: b'{"n":%d}' % n)
+    chunks = [chunk async for chunk in encode_export(tweets(), "json", 20)]
+    assert len(chunks) > 1
+    assert json.loads(b"".join(chunks)) == [{"n": number} for number in range(10)]
@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from database.migrations import upgrade_schema
+from database.models import Tweet
+from utils.setting import TWEETS_PARTITIONED
+
+from .conftest import TEST_SETTINGS, add_likes
+
+# Столбцы, которых нет в базе, созданной до их появления в моделях.
+# У секционированных лайков tweet_create_date - ключ секций, он есть всегда
+ADDED_COLUMNS = [
+    "users.deleted_at",
+    "tweets.deleted_at",
+    "media.create_date",
+] + ([] if TWEETS_PARTITIONED else ["likes.tweet_create_date"])
+
+
+def schema(conn):
+    inspector = inspect(conn)
+    return {
+        table: (
+            {column["name"] for column in inspector.get_columns(table)},
+            {index["name"] for index in inspector.get_indexes(table)},
+            {
+                (key["name"], key["options"].get("ondelete"))
+                for key in inspector.get_foreign_keys(table)
+            },
+        )
+        for table in ("users", "tweets", "likes", "media", "user_to_user")
+    }
+
+
+@pytest.mark.asyncio
+async def test_upgrade_adds_missing_columns(db_session: AsyncSession):
+    tweet = Tweet(user_id=1, tweet_data="old")
+    db_session.add(tweet)
+    await db_session.flush()
+    await add_likes(db_session, tweet.id, [1])
+    await db_session.commit()
+    await db_session.refresh(tweet)
+    # Сессия не должна держать блокировки таблиц
+    await db_session.commit()
+
+    engine = create_async_engine(TEST_SETTINGS.database_url)
+    async with engine.connect() as conn:
+        # Изменения схемы откатываются вместе с транзакцией
+        expected = await conn.run_sync(schema)
+        for name in ADDED_COLUMNS:
+            table, column = name.split(".")
+            await conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        await conn.execute(text("DROP INDEX ix_likes_user_id"))
+        # Внешние ключи баз, созданных до каскадного удаления аккаунтов
+        await conn.execute(
+            text(
+                "ALTER TABLE likes DROP CONSTRAINT likes_user_id_fkey, "
+                "ADD CONSTRAINT likes_user_id_fkey FOREIGN KEY (user_id) "
+                "REFERENCES users (id)"
+            )
+        )
+
+        added = await conn.run_sync(upgrade_schema)
+        assert sorted(added) == sorted(ADDED_COLUMNS)
+        assert await conn.run_sync(schema) == expected
+        tweet_create_date = await conn.scalar(
+            text("SELECT tweet_create_date FROM likes WHERE tweet_id = :id"),
+            {"id": tweet.id},
+        )
+        assert tweet_create_date == tweet.create_date
+        assert await conn.run_sync(upgrade_schema) == []
+        await conn.rollback()
+    await engine.dispose()
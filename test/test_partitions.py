@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Like, Tweet
+from database.partitions import (
+    add_months,
+    archive_partitions,
+    ensure_partitions,
+    get_partitions,
+    parse_partition_name,
+    partition_name,
+)
+from utils.setting import BASE_DIR, TWEETS_PARTITIONED
+
+# Тесты, которые пишут твиты и лайки, ещё раз с секционированными таблицами
+PARTITIONED_SUITE = [
+    "test/test_partitions.py",
+    "test/test_tweet.py",
+    "test/test_purge.py",
+    "test/test_export.py",
+    "test/test_counters.py",
+    "test/test_account_deletion.py",
+    "test/test_migrations.py",
+    "test/test_changes.py",
+    "test/test_ranking.py",
+]
+
+
+def test_month_arithmetic():
+    assert add_months(date(2026, 11, 1), 1) == date(2026, 12, 1)
+    assert add_months(date(2026, 12, 1), 1) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -13) == date(2024, 12, 1)
+
+
+def test_partition_names():
+    assert partition_name("tweets", date(2026, 3, 1)) == "tweets_y2026m03"
+    assert parse_partition_name("likes_y2026m03") == ("likes", date(2026, 3, 1))
+    assert parse_partition_name("likes_default") is None
+
+
+@pytest.mark.asyncio
+async def test_unpartitioned_tables_are_left_alone(db_session: AsyncSession):
+    if TWEETS_PARTITIONED:
+        pytest.skip("TWEETS_PARTITIONED is set")
+    assert await ensure_partitions(db_session) == []
+    assert await archive_partitions(db_session, date.today()) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not TWEETS_PARTITIONED, reason="TWEETS_PARTITIONED=1 only")
+async def test_old_partitions_are_archived(db_session: AsyncSession):
+    today = date.today()
+    old = add_months(today.replace(day=1), -3)
+    await ensure_partitions(db_session, today=old, months_ahead=0)
+    assert partition_name("tweets", old) in await get_partitions(db_session, "tweets")
+    await db_session.commit()
+
+    old_tweet = Tweet(
+        user_id=2, tweet_data="old", create_date=datetime(old.year, old.month, 5)
+    )
+    new_tweet = Tweet(user_id=2, tweet_data="new")
+    db_session.add_all([old_tweet, new_tweet])
+    await db_session.flush()
+    db_session.add_all(
+        [
+            Like(user_id=3, tweet_id=tweet.id, tweet_create_date=tweet.create_date)
+            for tweet in (old_tweet, new_tweet)
+        ]
+    )
+    await db_session.commit()
+
+    try:
+        archived = await archive_partitions(
+            db_session, add_months(today.replace(day=1), -1), schema="test_archive"
+        )
+        assert archived == [partition_name("likes", old), partition_name("tweets", old)]
+        assert await db_session.scalar(select(func.count()).select_from(Tweet)) == 1
+        assert await db_session.scalar(select(func.count()).select_from(Like)) == 1
+        archived_tweets = await db_session.scalar(
+            text(f"SELECT count(*) FROM test_archive.{partition_name('tweets', old)}")
+        )
+        assert archived_tweets == 1
+    finally:
+        await db_session.execute(text("DROP SCHEMA IF EXISTS test_archive CASCADE"))
+        await db_session.commit()
+
+
+def test_suite_passes_with_partitioned_tweets():
+    if TWEETS_PARTITIONED:
+        pytest.skip("the suite already runs with TWEETS_PARTITIONED=1")
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"]
+        + PARTITIONED_SUITE,
+        cwd=BASE_DIR,
+        env={**os.environ, "TWEETS_PARTITIONED": "1"},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout[-5000:]
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from utils.profiler import (
+    PROFILE_ID_HEADER,
+    ProfilerMiddleware,
+    list_profiles,
+    new_profile_id,
+    profile_path,
+    save_profile,
+)
+
+from .conftest import override_settings
+
+
+async def slow_endpoint(request):
+    await asyncio.sleep(0.05)
+    # Занимает цикл событий, пока поток профилировщика не получит GIL
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    return JSONResponse({"result": True})
+
+
+async def get(directory: Path, sample_rate: float = 0.0, **headers):
+    app = Starlette(routes=[Route("/api/tweets", slow_endpoint)])
+    app.add_middleware(
+        ProfilerMiddleware,
+        admin_api_keys=frozenset({"test"}),
+        sample_rate=sample_rate,
+        interval=0.001,
+        directory=directory,
+        keep=10,
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        return await c.get("/api/tweets", headers=headers)
+
+
+def test_profile_path_rejects_other_names(tmp_path: Path):
+    assert profile_path("../../etc/passwd", tmp_path) is None
+    assert profile_path("20261019T101500-get-api-tweets-1a2b3c4d", tmp_path) == (
+        tmp_path / "20261019T101500-get-api-tweets-1a2b3c4d.folded"
+    )
+
+
+@pytest.mark.asyncio
+class TestProfilerMiddleware:
+    async def test_admin_request_is_profiled(self, tmp_path: Path):
+        response = await get(tmp_path, **{"x-profile": "1", "api-key": "test"})
+        assert response.json() == {"result": True}
+        profile_id = response.headers[PROFILE_ID_HEADER]
+        assert list_profiles(tmp_path) == [profile_id]
+
+        lines = profile_path(profile_id, tmp_path).read_text().splitlines()
+        stacks = dict(line.rsplit(" ", 1) for line in lines)
+        assert all(int(count) > 0 for count in stacks.values())
+        # Время и на исполнение, и на ожидание внутри обработчика
+        assert any(
+            "slow_endpoint" in stack and "<waiting>" in stack for stack in stacks
+        )
+        assert any(
+            "slow_endpoint" in stack and "<waiting>" not in stack for stack in stacks
+        )
+
+    async def test_other_requests_are_not_profiled(self, tmp_path: Path):
+        response = await get(tmp_path, **{"x-profile": "1", "api-key": "test2"})
+        assert PROFILE_ID_HEADER not in response.headers
+        response = await get(tmp_path)
+        assert PROFILE_ID_HEADER not in response.headers
+        assert list_profiles(tmp_path) == []
+
+    async def test_sampled_request_is_profiled(self, tmp_path: Path):
+        response = await get(tmp_path, sample_rate=1.0)
+        assert response.headers[PROFILE_ID_HEADER] in list_profiles(tmp_path)
+
+
+def test_oldest_profiles_are_dropped(tmp_path: Path):
+    for day in range(3):
+        save_profile([], f"2026101{day}T101500-get-root-1a2b3c4d", tmp_path, 2)
+    assert list_profiles(tmp_path) == [
+        "20261012T101500-get-root-1a2b3c4d",
+        "20261011T101500-get-root-1a2b3c4d",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_download_profile(
+    client: httpx.AsyncClient, test_app, monkeypatch, tmp_path
+):
+    override_settings(test_app, monkeypatch, profiles_path=tmp_path)
+    profile_id = new_profile_id("GET", "/api/tweets")
+    save_profile(["main (app.py:1) 3\n"], profile_id, tmp_path, 10)
+    response = await client.get(f"/admin/profiles/{profile_id}")
+    assert response.status_code == 403
+
+    override_settings(test_app, monkeypatch, admin_api_keys=frozenset({"test"}))
+    response = await client.get("/admin/profiles")
+    assert response.json()["profiles"] == [profile_id]
+    response = await client.get(f"/admin/profiles/{profile_id}")
+    assert response.status_code == 200
+    assert response.text == "main (app.py:1) 3\n"
+    response = await client.get("/admin/profiles/unknown")
+    assert response.status_code == 404
@@ -0,0 +1,136 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Like, Media, Tweet
+from database.purge import collect_orphan_media, purge_tweet, soft_delete_tweet
+from utils import for_file, jobs
+from utils.tasks import task_queue
+
+from .conftest import add_likes
+
+
+async def count(session: AsyncSession, model, *where) -> int:
+    return await session.scalar(select(func.count()).select_from(model).where(*where))
+
+
+@pytest.mark.asyncio
+class TestSoftDelete:
+    async def test_deleted_tweet_is_hidden_then_purged(
+        self, client: AsyncClient, db_session: AsyncSession, tmp_path, monkeypatch
+    ):
+        # Загрузки прошлых тестов в uploads/ не меняют имя файла
+        monkeypatch.setattr(for_file, "MEDIA_PATH", tmp_path)
+        monkeypatch.setattr(jobs, "MEDIA_PATH", tmp_path)
+        file = ("photo.txt", io.BytesIO(b"data"), "text/plain")
+        media_id = (await client.post("/medias", files={"file": file})).json()[
+            "media_id"
+        ]
+        response = await client.post(
+            "/tweets", json={"tweet_data": "bye", "tweet_media_ids": [media_id]}
+        )
+        tweet_id = response.json()["tweet_id"]
+        assert (tmp_path / "photo.txt").exists()
+        await add_likes(db_session, tweet_id, (2, 3))
+        await db_session.commit()
+
+        response = await client.delete(f"/tweets/{tweet_id}")
+        assert response.status_code == 200
+        assert response.json() == {"result": True}
+        assert (await client.get("/tweets")).json()["tweets"] == []
+        assert (await client.post(f"/tweets/{tweet_id}/likes")).status_code == 404
+        assert (await client.delete(f"/tweets/{tweet_id}")).status_code == 404
+
+        await task_queue.join()
+        assert await count(db_session, Tweet, Tweet.id == tweet_id) == 0
+        assert await count(db_session, Like) == 0
+        assert await count(db_session, Media) == 0
+        assert not (tmp_path / "photo.txt").exists()
+
+    async def test_purge_in_chunks(self, db_session: AsyncSession):
+        tweet = Tweet(user_id=2, tweet_data="viral")
+        db_session.add(tweet)
+        await db_session.flush()
+        await add_likes(db_session, tweet.id, [1] * 5)
+        db_session.add_all(
+            [
+                Media(media_path=f"{number}.png", tweet_id=tweet.id)
+                for number in range(3)
+            ]
+        )
+        await db_session.commit()
+
+        assert await soft_delete_tweet(db_session, tweet.id, user_id=1) is False
+        assert await soft_delete_tweet(db_session, tweet.id, user_id=2) is True
+        await db_session.commit()
+
+        removed = []
+
+        async def on_media(paths):
+            removed.append(paths)
+
+        assert await purge_tweet(db_session, tweet.id, 2, on_media) == 5
+        assert [len(paths) for paths in removed] == [2, 1]
+        assert await count(db_session, Tweet) == 0
+        assert await count(db_session, Like) == 0
+        assert await soft_delete_tweet(db_session, tweet.id, user_id=2) is None
+
+    async def test_orphan_media_are_collected(self, db_session: AsyncSession):
+        tweet = Tweet(user_id=2, tweet_data="with media")
+        db_session.add(tweet)
+        await db_session.flush()
+        old = datetime.now() - timedelta(days=2)
+        db_session.add_all(
+            [
+                Media(media_path=f"old{number}.png", create_date=old)
+                for number in range(3)
+            ]
+            + [
+                Media(media_path="fresh.png"),
+                Media(media_path="attached.png", tweet_id=tweet.id, create_date=old),
+            ]
+        )
+        await db_session.commit()
+
+        removed = []
+
+        async def on_media(paths):
+            removed.append(paths)
+
+        stats = await collect_orphan_media(
+            db_session, grace_seconds=3600, batch_size=2, on_media=on_media
+        )
+        assert (stats.rows, stats.batches) == (3, 2)
+        assert sorted(sum(removed, [])) == ["old0.png", "old1.png", "old2.png"]
+        paths = await db_session.scalars(select(Media.media_path).order_by(Media.id))
+        assert list(paths) == ["fresh.png", "attached.png"]
+
+    async def test_files_survive_failed_commit(
+        self, db_session: AsyncSession, monkeypatch
+    ):
+        old = datetime.now() - timedelta(days=2)
+        db_session.add(Media(media_path="old.png", create_date=old))
+        await db_session.commit()
+
+        removed = []
+
+        async def on_media(paths):
+            removed.append(paths)
+
+        async def commit():
+            raise ConnectionError("connection lost")
+
+        monkeypatch.setattr(db_session, "commit", commit)
+        with pytest.raises(ConnectionError):
+            await collect_orphan_media(
+                db_session, grace_seconds=3600, on_media=on_media
+            )
+        monkeypatch.undo()
+        await db_session.rollback()
+        # Строка осталась, значит и файл должен остаться
+        assert removed == []
+        assert await count(db_session, Media) == 1
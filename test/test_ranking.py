@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Tweet, tweet_scores
+from database.ranking import (
+    add_likes_to_scores,
+    decode_top_cursor,
+    encode_top_cursor,
+    rank_key,
+    rebuild_tweet_scores,
+)
+from utils.setting import FEED_MAX_PAGE_SIZE
+
+from .conftest import override_settings
+
+
+def test_rank_key_adds_author_affinity():
+    rows = [(1, 10, 5.0), (2, 20, 4.5), (3, 30, 4.0)]
+    assert sorted(rows, key=lambda row: rank_key(row, {}), reverse=True) == rows
+    assert rank_key(rows[2], {30: 2.0}) == (6.0, 3)
+
+
+def test_top_cursor_round_trip():
+    cursor = (39377.123456789012, 42)
+    assert decode_top_cursor(encode_top_cursor(cursor)) == cursor
+
+
+@pytest.mark.asyncio
+class TestTopFeed:
+    async def top_ids(self, client: AsyncClient):
+        response = await client.get("/tweets", params={"order": "top"})
+        assert response.status_code == 200
+        return [tweet["id"] for tweet in response.json()["tweets"]]
+
+    async def test_top_feed(
+        self, client: AsyncClient, db_session: AsyncSession, test_app, monkeypatch
+    ):
+        now = datetime.utcnow()
+        older = Tweet(user_id=2, tweet_data="old", create_date=now - timedelta(hours=1))
+        newer = Tweet(user_id=3, tweet_data="new", create_date=now)
+        db_session.add_all([older, newer])
+        await db_session.commit()
+        assert await rebuild_tweet_scores(db_session) == 2
+        await db_session.commit()
+        assert await self.top_ids(client) == [newer.id, older.id]
+
+        await add_likes_to_scores(db_session, {older.id: 99})
+        await db_session.commit()
+        assert await self.top_ids(client) == [older.id, newer.id]
+
+        override_settings(test_app, monkeypatch, top_feed_follow_boost=5.0)
+        await client.post("http://localhost/users/3/follow")
+        assert await self.top_ids(client) == [newer.id, older.id]
+
+        await client.post(f"/tweets/{newer.id}/likes")
+        likes = await db_session.scalar(
+            select(tweet_scores.c.likes).where(tweet_scores.c.tweet_id == newer.id)
+        )
+        assert likes == 1
+
+        await client.delete(f"/tweets/{older.id}")
+        response = await client.get("/tweets", params={"order": "top", "limit": 1})
+        assert [tweet["id"] for tweet in response.json()["tweets"]] == [newer.id]
+
+    async def test_top_feed_pages(
+        self, client: AsyncClient, db_session: AsyncSession, test_app, monkeypatch
+    ):
+        now = datetime.utcnow()
+        db_session.add_all(
+            Tweet(
+                user_id=2 + number % 2,
+                tweet_data=f"tweet {number}",
+                create_date=now - timedelta(hours=number),
+            )
+            for number in range(9)
+        )
+        await db_session.commit()
+        await rebuild_tweet_scores(db_session)
+        await db_session.commit()
+        # Твиты автора 3 поднимаются выше в середине ленты
+        override_settings(test_app, monkeypatch, top_feed_follow_boost=0.05)
+        await client.post("http://localhost/users/3/follow")
+        expected = await self.top_ids(client)
+
+        pages, cursor = [], None
+        while True:
+            params = {"order": "top", "limit": 2}
+            if cursor is not None:
+                params["cursor"] = cursor
+            answer = (await client.get("/tweets", params=params)).json()
+            pages.append([tweet["id"] for tweet in answer["tweets"]])
+            cursor = answer["next_cursor"]
+            if cursor is None:
+                break
+        assert [len(page) for page in pages] == [2, 2, 2, 2, 1]
+        assert sum(pages, []) == expected
+
+        response = await client.get("/tweets", params={"order": "top", "cursor": "x"})
+        assert response.status_code == 400
+
+    async def test_new_feed_limit(self, client: AsyncClient):
+        for number in range(3):
+            await client.post("/tweets", json={"tweet_data": f"tweet {number}"})
+        response = await client.get("/tweets", params={"limit": 2})
+        contents = [tweet["content"] for tweet in response.json()["tweets"]]
+        assert contents == ["tweet 2", "tweet 1"]
+
+        # Предел TOP_FEED_MAX_PAGE_SIZE только у order=top
+        params = {"limit": FEED_MAX_PAGE_SIZE + 1}
+        response = await client.get("/tweets", params=params)
+        assert response.status_code == 422
+        response = await client.get("/tweets", params={**params, "order": "top"})
+        assert response.status_code == 200
+
+    async def test_new_tweets_are_scored(self, client: AsyncClient):
+        response = await client.post("/tweets", json={"tweet_data": "hello"})
+        assert await self.top_ids(client) == [response.json()["tweet_id"]]
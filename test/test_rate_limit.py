@@ -0,0 +1,50 @@
+import pytest
+from httpx import AsyncClient
+
+from utils.rate_limit import Limit, MemoryStore
+
+
+def test_limit_parse():
+    assert Limit.parse("30/minute") == Limit(30, 60.0)
+    assert Limit.parse("5/seconds") == Limit(5, 1.0)
+    assert Limit.parse("10/90") == Limit(10, 90.0)
+
+
+@pytest.mark.asyncio
+async def test_gcra_allows_burst_then_sustained_rate():
+    store = MemoryStore()
+    limit = Limit(3, 3.0)
+    assert [await store.hit("key", limit, 100.0) for _ in range(3)] == [0, 0, 0]
+    assert await store.hit("key", limit, 100.0) == pytest.approx(1.0)
+    # Другой ключ считается отдельно
+    assert await store.hit("other", limit, 100.0) == 0
+    # Через интервал освобождается одно место
+    assert await store.hit("key", limit, 101.0) == 0
+    assert await store.hit("key", limit, 101.0) > 0
+
+
+@pytest.mark.asyncio
+class TestRateLimitApi:
+    async def test_too_many_likes(self, client: AsyncClient, test_app, monkeypatch):
+        limits = test_app.state.rate_limiter.limits
+        monkeypatch.setitem(limits, "like", Limit(2, 60.0))
+        tweet_ids = []
+        for text in ("first", "second", "third"):
+            response = await client.post("/tweets", json={"tweet_data": text})
+            tweet_ids.append(response.json()["tweet_id"])
+
+        for tweet_id in tweet_ids[:2]:
+            response = await client.post(f"/tweets/{tweet_id}/likes")
+            assert response.status_code == 201
+        response = await client.post(f"/tweets/{tweet_ids[2]}/likes")
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "30"
+        assert response.json()["error_type"] == "Too Many Requests"
+
+        # Лимит лайков не влияет на другие классы запросов
+        response = await client.post("/tweets", json={"tweet_data": "still ok"})
+        assert response.status_code == 201
+
+    async def test_unauthorized_is_not_counted(self, invalid_client: AsyncClient):
+        response = await invalid_client.post("/tweets", json={"tweet_data": "x"})
+        assert response.status_code == 401
@@ -0,0 +1,78 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Tweet
+from database.search import InvertedIndex
+
+from .conftest import unauthorized_structure_response
+
+
+@pytest_asyncio.fixture()
+async def searchable_tweets(db_session: AsyncSession):
+    db_session.add_all(
+        [
+            Tweet(user_id=2, tweet_data="Release tonight, release notes attached"),
+            Tweet(user_id=3, tweet_data="Morning coffee before the release"),
+            Tweet(user_id=4, tweet_data="Nothing interesting here"),
+        ]
+    )
+    await db_session.commit()
+
+
+@pytest.mark.asyncio
+class TestSearchAPI:
+    async def test_search_ranks_results(self, client: AsyncClient, searchable_tweets):
+        response = await client.get("/search", params={"q": "release"})
+        data = response.json()
+        assert response.status_code == 200
+        assert data["result"] is True
+        assert [tweet["id"] for tweet in data["tweets"]] == [1, 2]
+        assert data["tweets"][0]["author"] == {"id": 2, "name": "fake_user1"}
+        assert data["next_cursor"] is None
+
+    async def test_search_cursor_pagination(
+        self, client: AsyncClient, searchable_tweets
+    ):
+        response = await client.get("/search", params={"q": "release", "limit": 1})
+        first_page = response.json()
+        assert [tweet["id"] for tweet in first_page["tweets"]] == [1]
+
+        response = await client.get(
+            "/search",
+            params={"q": "release", "limit": 1, "cursor": first_page["next_cursor"]},
+        )
+        second_page = response.json()
+        assert [tweet["id"] for tweet in second_page["tweets"]] == [2]
+        assert second_page["next_cursor"] is None
+
+    async def test_search_trigram_fallback(
+        self, client: AsyncClient, searchable_tweets
+    ):
+        response = await client.get("/search", params={"q": "interes"})
+        assert [tweet["id"] for tweet in response.json()["tweets"]] == [3]
+
+    async def test_search_invalid_cursor(self, client: AsyncClient):
+        response = await client.get("/search", params={"q": "x", "cursor": "broken"})
+        assert response.status_code == 400
+        assert response.json()["error_message"] == "Invalid search cursor."
+
+    async def test_search_unauthorized(self, invalid_client: AsyncClient):
+        response = await invalid_client.get("/search", params={"q": "release"})
+        assert response.status_code == 401
+        assert response.json() == unauthorized_structure_response
+
+
+def test_inverted_index_search():
+    index = InvertedIndex()
+    index.add(1, "Release tonight, release notes attached")
+    index.add(2, "Morning coffee before the release")
+    index.add(3, "Nothing interesting here")
+
+    assert [tweet_id for _, tweet_id in index.search("release")] == [1, 2]
+    assert [tweet_id for _, tweet_id in index.search("interes")] == [3]
+
+    index.remove(1)
+    assert [tweet_id for _, tweet_id in index.search("release")] == [2]
+    assert index.search("notes") == []
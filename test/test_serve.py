@@ -0,0 +1,29 @@
+from dataclasses import replace
+
+from serve import build_config, worker_count
+from utils.setting import Settings
+
+SETTINGS = Settings(database_url="postgresql+asyncpg://localhost/test")
+
+
+def test_production_config():
+    config = build_config(SETTINGS)
+    assert config["workers"] >= 1
+    assert config["loop"] == "uvloop"
+    assert config["http"] == "httptools"
+    assert "reload" not in config
+
+
+def test_reload_config_is_single_process():
+    config = build_config(SETTINGS, reload=True)
+    assert config["reload"] is True
+    assert "workers" not in config
+    assert "limit_max_requests" not in config
+
+
+def test_several_workers_need_redis():
+    settings = replace(SETTINGS, rate_limit_backend="redis", pubsub_backend="memory")
+    assert worker_count(4, settings) == 1
+    settings = replace(settings, pubsub_backend="redis")
+    assert worker_count(4, settings) == 4
+    assert worker_count(0, settings) == 1
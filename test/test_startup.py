@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+from dotenv import dotenv_values
+
+from utils.setting import BASE_DIR, ENV_FILE
+
+# Почти всё время импорта app занимают FastAPI и SQLAlchemy (около секунды),
+# бюджет оставляет запас на медленные машины
+IMPORT_TIME_BUDGET_US = 3_000_000
+# Загружаются только при старте приложения или в фоновых задачах
+LAZY_MODULES = ("asyncpg", "PIL", "celery", "redis")
+
+
+def import_app() -> Tuple[str, Dict[str, int]]:
+    """stdout of `import app` and the cumulative import time of every module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, total, name = line.split("|")
+        if total.strip().isdigit():
+            cumulative[name.strip()] = int(total)
+    return result.stdout, cumulative
+
+
+def test_import_has_no_side_effects():
+    stdout, cumulative = import_app()
+    assert stdout == ""
+    assert not [module for module in LAZY_MODULES if module in cumulative]
+
+
+def test_import_time_budget():
+    _, cumulative = import_app()
+    assert cumulative["app"] < IMPORT_TIME_BUDGET_US
+
+
+def test_env_file_is_loaded_by_get_settings():
+    env = {key: value for key, value in os.environ.items() if key != "POSTGRES_DB"}
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import os, app; from utils.setting import get_settings;"
+            "print(os.environ.get('POSTGRES_DB')); get_settings();"
+            "print(os.environ.get('POSTGRES_DB'))",
+        ],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.split() == ["None", dotenv_values(ENV_FILE)["POSTGRES_DB"]]
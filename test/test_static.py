@@ -0,0 +1,83 @@
+import gzip
+from pathlib import Path
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from utils.static import (
+    IMMUTABLE_CACHE_CONTROL,
+    PrecompressedStaticFiles,
+    accepted_encodings,
+    precompress_static,
+)
+
+BUNDLE = b"console.log('twitter clone');\n" * 100
+
+
+@pytest.fixture()
+def static_dir(tmp_path: Path) -> Path:
+    (tmp_path / "js").mkdir()
+    (tmp_path / "js" / "app.ee2cdef2.js").write_bytes(BUNDLE)
+    (tmp_path / "favicon.ico").write_bytes(b"icon")
+    precompress_static(tmp_path)
+    return tmp_path
+
+
+async def get(static_dir: Path, path: str, **headers) -> httpx.Response:
+    app = Starlette(
+        routes=[Mount("/static", PrecompressedStaticFiles(directory=static_dir))]
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        return await c.get(path, headers=headers)
+
+
+@pytest.mark.asyncio
+class TestStaticFiles:
+    async def test_gzip_variant_is_served(self, static_dir: Path):
+        response = await get(
+            static_dir, "/static/js/app.ee2cdef2.js", **{"accept-encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert "javascript" in response.headers["content-type"]
+        assert response.content == BUNDLE
+
+    async def test_identity_when_not_accepted(self, static_dir: Path):
+        response = await get(
+            static_dir, "/static/js/app.ee2cdef2.js", **{"accept-encoding": "identity"}
+        )
+        assert "content-encoding" not in response.headers
+        assert response.content == BUNDLE
+
+    async def test_unhashed_files_are_revalidated(self, static_dir: Path):
+        response = await get(static_dir, "/static/favicon.ico")
+        assert response.headers["cache-control"] == "no-cache"
+
+    async def test_spa_index_etag(self, client: httpx.AsyncClient):
+        response = await client.get("http://localhost/profile")
+        assert response.status_code == 200
+        assert "text/html" in response.headers["content-type"]
+        etag = response.headers["etag"]
+
+        response = await client.get(
+            "http://localhost/profile", headers={"if-none-match": etag}
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+
+
+def test_precompress_skips_up_to_date_files(static_dir: Path):
+    gz = static_dir / "js" / "app.ee2cdef2.js.gz"
+    assert gzip.decompress(gz.read_bytes()) == BUNDLE
+    assert not (static_dir / "favicon.ico.gz").exists()
+    assert precompress_static(static_dir) == 0
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, br;q=0.5, deflate;q=0") == ["gzip", "br"]
+    assert accepted_encodings("") == []
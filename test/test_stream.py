@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import pytest
+from httpx import AsyncClient
+
+from utils.pubsub import RESYNC_EVENT, FeedHub, RedisBackend, feed_hub
+
+
+@pytest.mark.asyncio
+class TestStream:
+    async def test_new_tweet_and_likes_are_pushed(self, client: AsyncClient):
+        subscription = feed_hub.subscribe([1])
+        try:
+            response = await client.post("/tweets", json={"tweet_data": "Live!"})
+            tweet_id = response.json()["tweet_id"]
+
+            event = await subscription.get()
+            assert event["type"] == "tweet"
+            assert event["tweet"]["id"] == tweet_id
+            assert event["tweet"]["content"] == "Live!"
+            assert event["tweet"]["likes"] == []
+        finally:
+            feed_hub.unsubscribe(subscription)
+
+    async def test_hub_routes_by_topic(self):
+        hub = FeedHub()
+        follower = hub.subscribe([2, 3])
+        stranger = hub.subscribe([4])
+
+        await hub.publish(2, {"type": "tweet", "id": 1})
+        await hub.publish(5, {"type": "tweet", "id": 2})
+
+        assert await follower.get() == {"type": "tweet", "id": 1}
+        assert follower.qsize() == 0
+        assert stranger.qsize() == 0
+
+        hub.unsubscribe(follower)
+        await hub.publish(3, {"type": "tweet", "id": 3})
+        assert follower.qsize() == 0
+
+    async def test_slow_consumer_queue_is_bounded(self):
+        hub = FeedHub()
+        subscription = hub.subscribe([1])
+        for tweet_id in range(250):
+            await hub.publish(1, {"type": "tweet", "id": tweet_id})
+
+        assert subscription.qsize() <= 100
+        assert subscription.dropped > 0
+        assert await subscription.get() == RESYNC_EVENT
+
+
+class FakePubSub:
+    """Fails with a connection error, or yields the given messages and waits"""
+
+    def __init__(self, messages=None):
+        self.messages = messages
+
+    async def subscribe(self, channel: str):
+        pass
+
+    async def listen(self):
+        if self.messages is None:
+            raise ConnectionError("Connection reset by peer")
+        for message in self.messages:
+            yield message
+        await asyncio.Event().wait()
+
+    async def aclose(self):
+        pass
+
+
+class FakeRedis:
+    def __init__(self, *pubsubs: FakePubSub):
+        self.pubsubs = list(pubsubs)
+
+    def pubsub(self) -> FakePubSub:
+        return self.pubsubs.pop(0)
+
+
+@pytest.mark.asyncio
+async def test_redis_listener_reconnects_and_resyncs():
+    hub = FeedHub()
+    subscription = hub.subscribe([1])
+    event = {"type": "tweet", "id": 1}
+    message = {"type": "message", "data": json.dumps({"topic": 1, "event": event})}
+    backend = RedisBackend("redis://localhost", reconnect_delay=0.01)
+    backend._redis = FakeRedis(FakePubSub([message]))
+
+    listener = asyncio.create_task(backend._listen(hub, FakePubSub()))
+    try:
+        assert await asyncio.wait_for(subscription.get(), 1) == RESYNC_EVENT
+        assert await asyncio.wait_for(subscription.get(), 1) == event
+    finally:
+        listener.cancel()
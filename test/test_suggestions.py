@@ -0,0 +1,35 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import user_to_user
+from database.suggestions import rebuild_follow_suggestions
+
+
+@pytest.mark.asyncio
+class TestSuggestions:
+    async def test_friends_of_friends(
+        self, client: AsyncClient, db_session: AsyncSession
+    ):
+        await db_session.commit()
+        edges = [(1, 2), (1, 3), (2, 4), (2, 5), (3, 4), (3, 1), (4, 1)]
+        await db_session.execute(
+            insert(user_to_user),
+            [{"follower_id": a, "following_id": b} for a, b in edges],
+        )
+        await rebuild_follow_suggestions(db_session)
+        await db_session.commit()
+
+        response = await client.get("/users/suggestions")
+        assert response.status_code == 200
+        assert response.json()["users"] == [
+            {"id": 4, "name": "fake_user3", "mutuals": 2},
+            {"id": 5, "name": "fake_user4", "mutuals": 1},
+        ]
+
+        await client.post("http://localhost/users/4/follow")
+        response = await client.get("/users/suggestions", params={"limit": 5})
+        assert response.json()["users"] == [
+            {"id": 5, "name": "fake_user4", "mutuals": 1}
+        ]
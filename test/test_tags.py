@@ -0,0 +1,82 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.text import extract_hashtags, extract_mentions
+from utils.trending import TrendingTags
+
+from .conftest import TEST_USERNAME
+
+
+@pytest.mark.asyncio
+class TestTagsAPI:
+    async def test_tweets_by_tag(self, client: AsyncClient):
+        await client.post("/tweets", json={"tweet_data": "Hello #Python world"})
+        await client.post("/tweets", json={"tweet_data": "Nothing to see"})
+        await client.post("/tweets", json={"tweet_data": "#python again #news"})
+
+        response = await client.get("/tags/python")
+        data = response.json()
+        assert response.status_code == 200
+        assert data["result"] is True
+        assert [tweet["id"] for tweet in data["tweets"]] == [3, 1]
+        assert data["next_cursor"] is None
+
+        response = await client.get("/tags/python", params={"limit": 1})
+        data = response.json()
+        assert [tweet["id"] for tweet in data["tweets"]] == [3]
+        response = await client.get(
+            "/tags/python", params={"limit": 1, "cursor": data["next_cursor"]}
+        )
+        assert [tweet["id"] for tweet in response.json()["tweets"]] == [1]
+
+    async def test_unknown_tag(self, client: AsyncClient):
+        response = await client.get("/tags/missing")
+        assert response.status_code == 200
+        assert response.json()["tweets"] == []
+
+    async def test_mentions_feed(self, client: AsyncClient):
+        await client.post(
+            "/tweets", json={"tweet_data": f"Note to @{TEST_USERNAME} and @nobody"}
+        )
+        await client.post("/tweets", json={"tweet_data": "@fake_user1 hi"})
+
+        response = await client.get("/users/me/mentions")
+        data = response.json()
+        assert response.status_code == 200
+        assert [tweet["id"] for tweet in data["tweets"]] == [1]
+
+    async def test_trending_tags_are_reloaded(
+        self, client: AsyncClient, db_session: AsyncSession
+    ):
+        # Окно другого воркера: record() для новых твитов в нём не вызывается
+        trending = TrendingTags(reload_seconds=0)
+        await trending.ensure_loaded(db_session)
+        await client.post("/tweets", json={"tweet_data": "#elsewhere"})
+        await trending.ensure_loaded(db_session)
+        assert trending.top(5) == [("elsewhere", 1)]
+
+    async def test_trending_tags(self, client: AsyncClient):
+        await client.post("/tweets", json={"tweet_data": "#trend one"})
+        await client.get("/tags/trending")
+        await client.post("/tweets", json={"tweet_data": "#trend two #other"})
+
+        response = await client.get("/tags/trending")
+        tags = {item["tag"]: item["count"] for item in response.json()["tags"]}
+        assert response.status_code == 200
+        assert tags["trend"] >= 2
+        assert tags["other"] >= 1
+
+
+def test_extract_hashtags_and_mentions():
+    text = "#Python and #python, mail@example.com @maria @maria #дом"
+    assert extract_hashtags(text) == ["python", "дом"]
+    assert extract_mentions(text) == ["maria"]
+
+
+def test_trending_window_expiry():
+    trending = TrendingTags(window_seconds=60, bucket_seconds=10)
+    trending.add(["old"], timestamp=0)
+    trending.add(["new", "new"])
+    trending.add(["new", "old"])
+    assert trending.top(5) == [("new", 3), ("old", 1)]
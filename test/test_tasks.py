@@ -0,0 +1,127 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from database.locks import run_as_leader
+from utils import jobs
+from utils.tasks import TaskQueue
+
+from .conftest import TEST_SETTINGS
+
+
+@pytest.mark.asyncio
+class TestTaskQueue:
+    async def test_failed_job_is_retried(self):
+        queue = TaskQueue(backend="asyncio", workers=2, retry_delay=0.01)
+        calls = []
+
+        @queue.task()
+        async def flaky(value: int):
+            calls.append(value)
+            if len(calls) < 3:
+                raise RuntimeError("temporary failure")
+
+        await flaky.delay(value=42)
+        await queue.join()
+        await queue.stop()
+
+        assert calls == [42, 42, 42]
+
+    async def test_job_gives_up_after_max_attempts(self):
+        queue = TaskQueue(backend="asyncio", workers=1, retry_delay=0.01)
+        calls = []
+
+        @queue.task(max_attempts=2)
+        async def broken():
+            calls.append(1)
+            raise RuntimeError("permanent failure")
+
+        await broken.delay()
+        await queue.join()
+        await queue.stop()
+
+        assert len(calls) == 2
+
+    async def test_periodic_job(self):
+        queue = TaskQueue(backend="asyncio", workers=1)
+        calls = []
+
+        @queue.task()
+        async def tick():
+            calls.append(1)
+
+        queue.schedule(tick, 0.01)
+        await queue.start()
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        count = len(calls)
+        await asyncio.sleep(0.03)
+
+        assert count >= 2
+        assert len(calls) == count
+
+    async def test_schedules_run_in_one_process(self):
+        queue = TaskQueue(backend="asyncio", workers=1)
+        calls = []
+
+        @queue.task()
+        async def tick():
+            calls.append(1)
+
+        queue.schedule(tick, 0.01)
+        await queue.start(schedules=False)
+        await asyncio.sleep(0.03)
+        assert calls == []
+
+        # Два процесса борются за одну блокировку
+        elected = []
+        leaders = [
+            asyncio.create_task(
+                run_as_leader(
+                    12345,
+                    lambda number=number: elected.append(number),
+                    lambda number=number: elected.remove(number),
+                    retry=0.05,
+                )
+            )
+            for number in range(2)
+        ]
+        await asyncio.sleep(0.2)
+        assert len(elected) == 1
+        leader = elected[0]
+        leaders[leader].cancel()
+        await asyncio.gather(leaders[leader], return_exceptions=True)
+        await asyncio.sleep(0.2)
+        assert elected == [1 - leader]
+        leaders[1 - leader].cancel()
+        await asyncio.gather(*leaders, return_exceptions=True)
+        assert elected == []
+
+        queue.start_schedules()
+        await asyncio.sleep(0.03)
+        await queue.stop()
+        assert calls
+
+    async def test_media_cleanup_and_thumbnail(self, tmp_path: Path, monkeypatch):
+        monkeypatch.setattr(jobs, "MEDIA_PATH", tmp_path)
+        monkeypatch.setattr(jobs, "THUMBNAILS_PATH", tmp_path / "thumbnails")
+        Image.new("RGB", (1000, 500)).save(tmp_path / "photo.png")
+
+        await jobs.make_thumbnail(media_path="photo.png")
+        with Image.open(tmp_path / "thumbnails" / "photo.png") as thumbnail:
+            assert max(thumbnail.size) <= 320
+
+        await jobs.remove_media_files(media_paths=["photo.png", "missing.png"])
+        assert not (tmp_path / "photo.png").exists()
+        assert not (tmp_path / "thumbnails" / "photo.png").exists()
+
+
+def test_celery_jobs_run_in_their_own_loop(monkeypatch):
+    celery_app = pytest.importorskip("utils.celery_app")
+    monkeypatch.setattr(celery_app, "get_settings", lambda: TEST_SETTINGS)
+    # Каждая задача Celery выполняется в новом цикле событий: соединения
+    # пула предыдущей задачи в нём использовать нельзя
+    for _ in range(2):
+        celery_app.run_job.apply(args=("trim_tweet_change_log", {})).get()
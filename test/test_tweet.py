@@ -1,8 +1,16 @@
+import io
+import json
 from typing import Dict
 
 import pytest
 from faker import Faker
 from httpx import AsyncClient
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Tweet
+from database.utils import FeedItem, load_options
+from utils.feed import encode_feed, serialize_tweets
 
 from .conftest import unauthorized_structure_response
 
@@ -157,3 +165,63 @@ class TestTweetAPI:
             assert response.status_code == 401
             assert response.json() == unauthorized_structure_response
             assert response.json() == unauthorized_structure_response
+
+    @pytest.mark.asyncio
+    async def test_get_tweets_feed(
+        self, client: AsyncClient, db_session: AsyncSession, create_random_tweets
+    ):
+        file = ("photo.txt", io.BytesIO(b"data"), "text/plain")
+        media_id = (await client.post("/medias", files={"file": file})).json()[
+            "media_id"
+        ]
+        response = await client.post(
+            "/tweets",
+            json={"tweet_data": 'Привет "мир"\n', "tweet_media_ids": [media_id]},
+        )
+        tweet_id = response.json()["tweet_id"]
+        await client.post(self.likes_url.format(tweet_id))
+        await client.post(self.likes_url.format(1))
+
+        response = await client.get(self.base_url)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+
+        db_session.expire_all()
+        tweets = await db_session.scalars(
+            select(Tweet)
+            .options(*load_options("feed"))
+            .order_by(desc(Tweet.create_date), desc(Tweet.id))
+        )
+        body = response.json()
+        assert body == {
+            "result": True,
+            "tweets": serialize_tweets(tweets),
+            "watermark": body["watermark"],
+        }
+
+
+def test_encode_feed():
+    items = [
+        FeedItem(2, "tab\t \u2028", 1, "Имя", ["a.png", "b.png"], [(3, 'x"y')]),
+        FeedItem(1, "", 2, "user"),
+    ]
+    assert json.loads(encode_feed(items)) == {
+        "result": True,
+        "tweets": [
+            {
+                "id": 2,
+                "content": "tab\t \u2028",
+                "attachments": ["a.png", "b.png"],
+                "author": {"id": 1, "name": "Имя"},
+                "likes": [{"user_id": 3, "name": 'x"y'}],
+            },
+            {
+                "id": 1,
+                "content": "",
+                "attachments": [],
+                "author": {"id": 2, "name": "user"},
+                "likes": [],
+            },
+        ],
+    }
+    assert json.loads(encode_feed([])) == {"result": True, "tweets": []}
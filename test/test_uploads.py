@@ -0,0 +1,142 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from httpx import AsyncClient
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Media, UploadSession
+from database.uploads import commit_upload_chunk, lease_upload_session
+from utils import for_file, jobs
+
+
+@pytest.fixture()
+def upload_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(for_file, "MEDIA_PATH", tmp_path)
+    monkeypatch.setattr(for_file, "UPLOAD_PARTS_PATH", tmp_path / "parts")
+    return tmp_path
+
+
+@pytest.mark.asyncio
+class TestUploads:
+    async def test_chunked_upload(
+        self, client: AsyncClient, db_session: AsyncSession, upload_dirs
+    ):
+        response = await client.post(
+            "/uploads", json={"filename": "video.bin", "size": 11}
+        )
+        assert response.status_code == 201
+        upload_id = response.json()["upload_id"]
+        url = f"/uploads/{upload_id}"
+
+        response = await client.put(url, params={"offset": 0}, content=b"hello ")
+        assert response.json()["offset"] == 6
+        response = await client.put(url, params={"offset": 2}, content=b"llo")
+        assert response.status_code == 409
+        assert response.headers["upload-offset"] == "6"
+        assert (await client.post(f"{url}/finalize")).status_code == 409
+
+        assert (await client.get(url)).json()["offset"] == 6
+        response = await client.put(url, params={"offset": 6}, content=b"world")
+        assert response.json()["offset"] == 11
+
+        response = await client.post(f"{url}/finalize")
+        assert response.status_code == 201
+        media_id = response.json()["media_id"]
+        assert (await client.post(f"{url}/finalize")).json()["media_id"] == media_id
+        media = await db_session.get(Media, media_id)
+        assert (upload_dirs / media.media_path).read_bytes() == b"hello world"
+        assert not any((upload_dirs / "parts").iterdir())
+
+    async def test_finalize_failed_commit(
+        self, client: AsyncClient, db_session: AsyncSession, upload_dirs, monkeypatch
+    ):
+        response = await client.post("/uploads", json={"filename": "a.bin", "size": 4})
+        url = f"/uploads/{response.json()['upload_id']}"
+        await client.put(url, params={"offset": 0}, content=b"1234")
+
+        async def commit():
+            raise ConnectionError("connection lost")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(db_session, "commit", commit)
+            with pytest.raises(ConnectionError):
+                await client.post(f"{url}/finalize")
+        await db_session.rollback()
+        # Файл не остался под MEDIA_PATH без строки Media
+        assert not (upload_dirs / "a.bin").exists()
+
+        response = await client.post(f"{url}/finalize")
+        assert response.status_code == 201
+        assert (upload_dirs / "a.bin").read_bytes() == b"1234"
+
+    async def test_chunk_past_declared_size(self, client: AsyncClient, upload_dirs):
+        response = await client.post("/uploads", json={"filename": "a.bin", "size": 4})
+        url = f"/uploads/{response.json()['upload_id']}"
+        response = await client.put(url, params={"offset": 0}, content=b"12345")
+        assert response.status_code == 413
+        assert (await client.get(url)).json()["offset"] == 0
+
+    async def test_chunk_lease(
+        self, client: AsyncClient, db_session: AsyncSession, upload_dirs
+    ):
+        response = await client.post("/uploads", json={"filename": "a.bin", "size": 4})
+        upload_id = response.json()["upload_id"]
+        url = f"/uploads/{upload_id}"
+        # Часть принимает другой запрос
+        _, token = await lease_upload_session(db_session, upload_id, 1, 0)
+        await db_session.commit()
+        response = await client.put(url, params={"offset": 0}, content=b"12")
+        assert response.status_code == 409
+        assert "upload-offset" not in response.headers
+
+        # Его аренда истекла, часть переслана и засчитана
+        await db_session.execute(
+            update(UploadSession).values(lease_until=func.now() - timedelta(1))
+        )
+        await db_session.commit()
+        response = await client.put(url, params={"offset": 0}, content=b"12")
+        assert response.json()["offset"] == 2
+        with pytest.raises(HTTPException) as exc:
+            await commit_upload_chunk(db_session, upload_id, token, 0, 2)
+        assert exc.value.status_code == 409
+        await db_session.rollback()
+
+        # Сессия с действующей арендой не истекает посреди части
+        await lease_upload_session(db_session, upload_id, 1, 2)
+        await db_session.execute(
+            update(UploadSession).values(expires_at=func.now() - timedelta(1))
+        )
+        await db_session.commit()
+        await jobs.expire_upload_sessions()
+        assert for_file.part_path(upload_id).exists()
+
+    async def test_filename_with_path(self, client: AsyncClient):
+        response = await client.post("/uploads", json={"filename": "../a", "size": 1})
+        assert response.status_code == 422
+
+    async def test_other_users_session(
+        self, client: AsyncClient, invalid_client: AsyncClient, upload_dirs
+    ):
+        response = await client.post("/uploads", json={"filename": "a.bin", "size": 1})
+        upload_id = response.json()["upload_id"]
+        response = await client.get(
+            f"/uploads/{upload_id}", headers={"api-key": "fake_api_key1"}
+        )
+        assert response.status_code == 404
+
+    async def test_abandoned_sessions_expire(
+        self, client: AsyncClient, db_session: AsyncSession, upload_dirs
+    ):
+        response = await client.post("/uploads", json={"filename": "a.bin", "size": 1})
+        upload_id = response.json()["upload_id"]
+        await db_session.execute(
+            update(UploadSession).values(expires_at=func.now() - timedelta(days=1))
+        )
+        await db_session.commit()
+        assert (await client.get(f"/uploads/{upload_id}")).status_code == 404
+
+        await jobs.expire_upload_sessions()
+        assert await db_session.scalar(select(func.count(UploadSession.id))) == 0
+        assert not for_file.part_path(upload_id).exists()
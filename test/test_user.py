@@ -1,7 +1,9 @@
 import pytest
 from httpx import AsyncClient
+from sqlalchemy.exc import InvalidRequestError
 
 from database.models import User
+from database.utils import get_user_by_api_key, get_user_by_id
 
 from .conftest import unauthorized_structure_response
 
@@ -61,3 +63,37 @@ class TestUserAPI:
         response = await invalid_client.get(unauthorized)
         assert response.status_code == 401
         assert response.json() == unauthorized_structure_response
+
+    async def test_follow_and_unfollow(self, client: AsyncClient):
+        # Маршруты подписки объявлены без префикса /api
+        url = "http://localhost/users/{}/follow"
+        response = await client.post(url.format(2))
+        assert response.status_code == 201
+        assert response.json() == self.expected_response
+
+        response = await client.post(url.format(2))
+        assert response.status_code == 400
+        assert response.json()["error_message"] == "You already follow that user!"
+        assert (await client.post(url.format(1))).status_code == 400
+        assert (await client.post(url.format(100))).status_code == 404
+
+        me = (await client.get("/users/me")).json()["user"]
+        assert me["followings"] == [{"id": 2, "name": "fake_user1"}]
+        other = (await client.get("/users/2")).json()["user"]
+        assert other["followers"] == [{"id": 1, "name": "testuser"}]
+
+        response = await client.delete(url.format(2))
+        assert response.status_code == 200
+        response = await client.delete(url.format(2))
+        assert response.status_code == 400
+        assert response.json()["error_message"] == "You are not following this user."
+
+    async def test_auth_profile_does_not_load_followings(self, db_session):
+        await db_session.commit()
+        user = await get_user_by_api_key("fake_api_key1", db_session)
+        with pytest.raises(InvalidRequestError):
+            user.following
+
+        user = await get_user_by_id(user.id, db_session, profile="profile")
+        assert user.following == []
+        assert user.followers == []
@@ -1,8 +1,9 @@
-from fastapi import Depends, HTTPException, Security, status
+from fastapi import Depends, HTTPException, Request, Security, status
 from fastapi.security import APIKeyHeader
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.database import async_get_db
+from database.models import User
 from database.utils import get_user_by_api_key
 
 API_KEY_HEADER = APIKeyHeader(name="api-key")
@@ -23,3 +24,16 @@ async def authenticate_user(
         )
 
     return user
+
+
+async def authenticate_admin(
+    request: Request, current_user: User = Depends(authenticate_user)
+):
+    """Allow only users whose api key is listed in ADMIN_API_KEYS"""
+    if current_user.api_key not in request.app.state.settings.admin_api_keys:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required",
+        )
+
+    return current_user
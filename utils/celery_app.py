@@ -0,0 +1,62 @@
+"""
+Celery backend for the background jobs (TASK_BACKEND=celery).
+
+Run the worker with:
+    celery -A utils.celery_app worker
+
+The broker comes from the settings: configure_celery() is called by the
+task queue of the web app and, in the worker, on startup (celeryd_init).
+"""
+
+import asyncio
+from typing import Any, Dict
+
+from celery import Celery
+from celery.signals import celeryd_init
+
+from database.database import configure_database, dispose_database
+from utils.setting import TASK_MAX_ATTEMPTS, TASK_RETRY_DELAY, Settings, get_settings
+from utils.tasks import CELERY_TASK_NAME, task_queue
+
+celery_app = Celery("twitter_clone")
+celery_app.conf.update(
+    # Задача подтверждается только после выполнения: при падении воркера
+    # брокер отдаст её повторно
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
+)
+
+
+def configure_celery(settings: Settings):
+    """Point the Celery app at the broker of the settings"""
+    celery_app.conf.broker_url = settings.celery_broker_url or None
+
+
+@celeryd_init.connect
+def _configure_worker(**kwargs):
+    # Воркер читает app.env и окружение один раз при старте
+    task_queue.configure(get_settings())
+
+
+async def run_in_own_engine(name: str, kwargs: Dict[str, Any]):
+    """
+    Run a job on an engine of its own. Every job runs in a new event loop
+    (asyncio.run), and pooled asyncpg connections can only be used in the
+    loop that opened them.
+    """
+    configure_database(task_queue.settings)
+    try:
+        await task_queue.tasks[name](**kwargs)
+    finally:
+        await dispose_database()
+
+
+@celery_app.task(name=CELERY_TASK_NAME, bind=True, max_retries=TASK_MAX_ATTEMPTS - 1)
+def run_job(self, name: str, kwargs: Dict[str, Any]):
+    import utils.jobs  # noqa: F401 регистрирует задачи в task_queue
+
+    try:
+        asyncio.run(run_in_own_engine(name, kwargs))
+    except Exception as exc:
+        raise self.retry(exc=exc, countdown=TASK_RETRY_DELAY * 2**self.request.retries)
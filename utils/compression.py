@@ -0,0 +1,209 @@
+"""
+Compression of API responses negotiated by Accept-Encoding.
+
+zstd (when the zstandard package is installed), brotli (when the brotli
+package is installed) and gzip are offered, in that order of preference.
+Complete bodies smaller than COMPRESSION_MIN_SIZE are sent as is, large
+ones are compressed in the thread pool. Streaming responses are
+compressed chunk by chunk and every chunk is flushed, so the client gets
+the data as soon as it is produced. Responses that already have a
+Content-Encoding (precompressed static files) are left alone.
+"""
+
+import zlib
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.setting import COMPRESSION_LEVELS
+from utils.static import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "image/svg+xml",
+    "text/html",
+    "text/plain",
+    "text/css",
+)
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Content-Encoding -> потоковый компрессор, в порядке предпочтения
+COMPRESSORS: Dict[str, Callable] = {"gzip": _Gzip}
+if brotli is not None:
+    COMPRESSORS = {"br": _Brotli, **COMPRESSORS}
+if zstandard is not None:
+    COMPRESSORS = {"zstd": _Zstd, **COMPRESSORS}
+
+
+def choose_encoding(
+    accept_encoding: str, available: Optional[List[str]] = None
+) -> Optional[str]:
+    """The preferred encoding the client accepts, None for identity"""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in available or COMPRESSORS:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compress a complete body"""
+    compressor = COMPRESSORS[encoding](level or COMPRESSION_LEVELS[encoding])
+    return compressor.compress(data) + compressor.finish()
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware, so streaming responses keep streaming"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int,
+        threadpool_size: int,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.threadpool_size = threadpool_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(
+            send, encoding, self.minimum_size, self.threadpool_size
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(
+        self, send: Send, encoding: str, minimum_size: int, threadpool_size: int
+    ):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.threadpool_size = threadpool_size
+        self._start: Optional[Message] = None
+        self._compressor = None
+        self._passthrough = False
+
+    def _compressible(self, headers: Headers) -> bool:
+        content_type = headers.get("content-type", "").split(";")[0].strip()
+        return (
+            self._start["status"] not in (204, 304)
+            and "content-encoding" not in headers
+            and content_type in COMPRESSIBLE_TYPES
+        )
+
+    def _set_headers(self, headers: MutableHeaders):
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        # Сжатое представление не побайтно равно исходному: ETag становится
+        # слабым, If-None-Match сравнивает слабо и продолжает совпадать
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = "W/" + etag
+
+    async def _run(self, func, data: bytes) -> bytes:
+        # Большие тела сжимаются в пуле потоков, чтобы не держать цикл событий
+        if len(data) >= self.threadpool_size:
+            return await run_in_threadpool(func, data)
+        return func(data)
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self._start = message
+            self._passthrough = not self._compressible(Headers(raw=message["headers"]))
+            if self._passthrough:
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(raw=self._start["headers"])
+        if self._compressor is None:
+            if not more_body:
+                # Тело целиком в одном сообщении
+                if len(body) < self.minimum_size:
+                    await self._send(self._start)
+                    await self._send(message)
+                    return
+                body = await self._run(partial(compress, encoding=self.encoding), body)
+                self._set_headers(headers)
+                headers["content-length"] = str(len(body))
+                await self._send(self._start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            self._compressor = COMPRESSORS[self.encoding](
+                COMPRESSION_LEVELS[self.encoding]
+            )
+            self._set_headers(headers)
+            if "content-length" in headers:
+                del headers["content-length"]
+            await self._send(self._start)
+
+        chunk = await self._run(self._compressor.compress, body) if body else b""
+        if not more_body:
+            chunk += self._compressor.finish()
+        await self._send(
+            {"type": "http.response.body", "body": chunk, "more_body": more_body}
+        )
@@ -0,0 +1,33 @@
+from typing import Optional
+
+from fastapi.responses import Response
+
+# Ответы API меняются при каждой записи, клиент всегда перепроверяет ETag
+API_CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts) -> str:
+    return '"{}"'.format("-".join(str(part) for part in parts))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists the ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=304, headers={"etag": etag, "cache-control": API_CACHE_CONTROL}
+    )
+
+
+def set_etag(response: Response, etag: str) -> Response:
+    response.headers["etag"] = etag
+    response.headers["cache-control"] = API_CACHE_CONTROL
+    return response
@@ -34,4 +34,8 @@ async def custom_http_exception_handler(request: Request, exc: StarletteHTTPExce
     error_schema = ErrorResponse(
         error_type=responses[exc.status_code], error_message=exc.detail
     )
-    return JSONResponse(status_code=exc.status_code, content=error_schema.model_dump())
+    return JSONResponse(
+        status_code=exc.status_code,
+        content=error_schema.model_dump(),
+        headers=getattr(exc, "headers", None),
+    )
@@ -0,0 +1,60 @@
+import json
+from typing import AsyncIterator, Dict
+
+from fastapi.responses import StreamingResponse
+
+from database.models import Tweet
+from utils.feed import serialize_tweet
+from utils.setting import EXPORT_CHUNK_SIZE
+
+EXPORT_MEDIA_TYPES: Dict[str, str] = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+def export_item(tweet: Tweet) -> bytes:
+    item = serialize_tweet(tweet)
+    item["created_at"] = tweet.create_date.isoformat()
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+async def encode_export(
+    tweets: AsyncIterator[Tweet],
+    export_format: str,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    """
+    Encode tweets one by one as NDJSON lines or as one JSON array. Items
+    are sent in chunks of about chunk_size bytes, so neither the whole
+    result nor a message per tweet is produced.
+    """
+    ndjson = export_format == "ndjson"
+    chunk = bytearray() if ndjson else bytearray(b"[")
+    first = True
+    async for tweet in tweets:
+        if not ndjson and not first:
+            chunk += b","
+        chunk += export_item(tweet)
+        if ndjson:
+            chunk += b"\n"
+        first = False
+        if len(chunk) >= chunk_size:
+            yield bytes(chunk)
+            chunk.clear()
+    if not ndjson:
+        chunk += b"]"
+    if chunk:
+        yield bytes(chunk)
+
+
+def export_response(
+    tweets: AsyncIterator[Tweet], export_format: str, filename: str
+) -> StreamingResponse:
+    return StreamingResponse(
+        encode_export(tweets, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "content-disposition": f'attachment; filename="{filename}.{export_format}"'
+        },
+    )
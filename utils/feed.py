@@ -0,0 +1,98 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from database.models import Tweet
+from database.utils import FeedItem
+
+# Экранирование строк JSON без ensure_ascii, как у JSONResponse
+_quote = json.encoder.encode_basestring
+_FEED_ITEM = (
+    '{"id":%d,"content":%s,"attachments":[%s],'
+    '"author":{"id":%d,"name":%s},"likes":[%s]}'
+)
+
+
+def serialize_tweet(tweet: Tweet) -> Dict[str, Any]:
+    """
+    Convert a Tweet into the feed item format expected by the frontend.
+
+    The tweet must be loaded with database.utils.load_options("feed"),
+    relationships that are not loaded raise on access.
+    """
+    return {
+        "id": tweet.id,
+        "content": tweet.tweet_data,
+        "attachments": [media.media_path for media in tweet.media],
+        "author": {"id": tweet.user_id, "name": tweet.user.username},
+        "likes": [
+            {"user_id": like.user_id, "name": like.user.username}
+            for like in tweet.likes
+        ],
+    }
+
+
+def serialize_tweets(tweets: Iterable[Tweet]) -> List[Dict[str, Any]]:
+    return [serialize_tweet(tweet) for tweet in tweets]
+
+
+def encode_feed_item(item: FeedItem) -> str:
+    """A FeedItem as JSON in the same format as serialize_tweet"""
+    attachments = ",".join(map(_quote, item.attachments or ()))
+    likes = ",".join(
+        '{"user_id":%d,"name":%s}' % (user_id, _quote(name))
+        for user_id, name in item.likes or ()
+    )
+    return _FEED_ITEM % (
+        item.id,
+        _quote(item.content),
+        attachments,
+        item.author_id,
+        _quote(item.author_name),
+        likes,
+    )
+
+
+def encode_feed(
+    items: Iterable[FeedItem], extra: Optional[Dict[str, Any]] = None
+) -> bytes:
+    """
+    The GET /api/tweets response body. Every item is formatted straight
+    and encoded to bytes right away, no intermediate dicts are built.
+    Fields of extra are added after "tweets".
+    """
+    body = b",".join([encode_feed_item(item).encode() for item in items])
+    tail = b""
+    if extra:
+        tail = json.dumps(extra, ensure_ascii=False, separators=(",", ":")).encode()
+        tail = b"," + tail[1:-1]
+    return b'{"result":true,"tweets":[' + body + b"]" + tail + b"}"
+
+
+def new_tweet_event(
+    tweet_id: int,
+    content: str,
+    attachments: List[str],
+    author_id: int,
+    author_name: str,
+) -> Dict[str, Any]:
+    """Stream event for a freshly created tweet, in the feed item format"""
+    return {
+        "type": "tweet",
+        "tweet": {
+            "id": tweet_id,
+            "content": content,
+            "attachments": attachments,
+            "author": {"id": author_id, "name": author_name},
+            "likes": [],
+        },
+    }
+
+
+def likes_event(tweet_id: int, user_id: int, name: str, delta: int) -> Dict[str, Any]:
+    """Stream event for a like (delta=1) or an unlike (delta=-1)"""
+    return {
+        "type": "likes",
+        "tweet_id": tweet_id,
+        "delta": delta,
+        "like": {"user_id": user_id, "name": name},
+    }
@@ -1,9 +1,11 @@
 from pathlib import Path
+from typing import AsyncIterator
 
 from aiofiles import open
+from aiofiles import os as aiofiles_os
 from fastapi import UploadFile
 
-from utils.setting import MEDIA_PATH
+from utils.setting import MEDIA_PATH, UPLOAD_PARTS_PATH
 
 
 async def check_or_get_filename(path: Path) -> Path:
@@ -44,3 +46,62 @@ async def save_uploaded_file(uploaded_file: UploadFile) -> str:
     async with open(filename, "wb") as file:
         await file.write(content)
     return img_path
+
+
+class ChunkTooLarge(ValueError):
+    """The chunk goes past the declared size of the upload"""
+
+
+def part_path(upload_id: str) -> Path:
+    return UPLOAD_PARTS_PATH / f"{upload_id}.part"
+
+
+async def create_part_file(upload_id: str):
+    UPLOAD_PARTS_PATH.mkdir(parents=True, exist_ok=True)
+    async with open(part_path(upload_id), "wb"):
+        pass
+
+
+async def write_chunk(
+    upload_id: str, offset: int, chunks: AsyncIterator[bytes], limit: int
+) -> int:
+    """
+    Write the body of a request into the part file at offset, piece by
+    piece as it arrives, without buffering it. The caller counts the chunk
+    only if it was received completely; bytes of an interrupted chunk are
+    overwritten by the retry.
+
+    Raises:
+        ChunkTooLarge: If the chunk is longer than limit bytes.
+
+    Returns:
+        int: The length of the chunk.
+    """
+    written = 0
+    async with open(part_path(upload_id), "r+b") as file:
+        await file.seek(offset)
+        async for data in chunks:
+            written += len(data)
+            if written > limit:
+                raise ChunkTooLarge(f"The upload is limited to {offset + limit} bytes")
+            await file.write(data)
+    return written
+
+
+async def finish_part_file(upload_id: str, filename: str) -> str:
+    """
+    Move a completed part file under MEDIA_PATH. The file is renamed, not
+    copied.
+
+    Returns:
+        str: The media path of the file.
+    """
+    MEDIA_PATH.mkdir(parents=True, exist_ok=True)
+    target = await check_or_get_filename(MEDIA_PATH / Path(filename).name)
+    await aiofiles_os.replace(part_path(upload_id), target)
+    return target.name
+
+
+async def restore_part_file(upload_id: str, media_path: str):
+    """Undo finish_part_file, the upload can then be finalized again"""
+    await aiofiles_os.replace(MEDIA_PATH / media_path, part_path(upload_id))
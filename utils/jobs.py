@@ -0,0 +1,257 @@
+import logging
+from pathlib import Path
+from typing import Any, Dict, List
+
+from aiofiles import os as aiofiles_os
+from fastapi.concurrency import run_in_threadpool
+
+from database.changes import trim_tweet_changes
+from database.counters import reconcile_counters
+from database.database import async_session
+from database.models import User
+from database.partitions import maintain_partitions
+from database.purge import (
+    collect_orphan_media,
+    get_deleted_tweet_ids,
+    get_deleted_user_ids,
+    purge_tweet,
+    purge_user,
+)
+from database.ranking import rebuild_tweet_scores
+from database.search import index_tweet, unindex_tweet
+from database.suggestions import rebuild_follow_suggestions
+from database.uploads import delete_expired_upload_sessions
+from database.utils import CreatedTweet
+from utils.feed import new_tweet_event
+from utils.for_file import part_path
+from utils.pubsub import feed_hub
+from utils.setting import (
+    MEDIA_PATH,
+    THUMBNAIL_SIZE,
+    THUMBNAILS_PATH,
+    TWEETS_PARTITIONED,
+)
+from utils.tasks import task_queue
+from utils.trending import trending_tags
+
+logger = logging.getLogger(__name__)
+
+
+@task_queue.task()
+async def remove_media_files(media_paths: List[str]):
+    """Remove uploaded files and their thumbnails from disk"""
+    for media_path in media_paths:
+        name = Path(media_path).name
+        for path in (MEDIA_PATH / name, THUMBNAILS_PATH / name):
+            try:
+                await aiofiles_os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _save_thumbnail(source: Path, target: Path):
+    from PIL import Image  # Pillow нужен только воркеру, не при старте
+
+    with Image.open(source) as image:
+        image.thumbnail(THUMBNAIL_SIZE)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        image.save(target)
+
+
+@task_queue.task()
+async def make_thumbnail(media_path: str):
+    """Create a preview for an uploaded image, other files are skipped"""
+    from PIL import UnidentifiedImageError
+
+    name = Path(media_path).name
+    try:
+        await run_in_threadpool(
+            _save_thumbnail, MEDIA_PATH / name, THUMBNAILS_PATH / name
+        )
+    except (UnidentifiedImageError, FileNotFoundError):
+        pass
+
+
+@task_queue.task(local=True)
+async def index_new_tweet(tweet_id: int, text: str, tags: List[str]):
+    index_tweet(tweet_id, text)
+    trending_tags.record(tags)
+
+
+@task_queue.task(local=True)
+async def unindex_deleted_tweets(tweet_ids: List[int]):
+    for tweet_id in tweet_ids:
+        unindex_tweet(tweet_id)
+
+
+@task_queue.task(local=True)
+async def fan_out(author_id: int, event: Dict[str, Any]):
+    """Deliver a feed event to the stream subscribers following the author"""
+    await feed_hub.publish(author_id, event)
+
+
+@task_queue.task()
+async def reconcile_user_counters():
+    """Correct drift of the sharded user counters"""
+    async with async_session() as session:
+        corrected = await reconcile_counters(session)
+        await session.commit()
+    if corrected:
+        logger.warning("Corrected %s user counters", corrected)
+
+
+task_queue.schedule(reconcile_user_counters, "counter_reconcile_interval")
+
+
+@task_queue.task()
+async def rebuild_top_feed_scores():
+    """Backfill and correct the scores of the ?order=top feed"""
+    async with async_session() as session:
+        corrected = await rebuild_tweet_scores(session)
+        await session.commit()
+    if corrected:
+        logger.info("Rebuilt %s tweet scores", corrected)
+
+
+task_queue.schedule(rebuild_top_feed_scores, "top_feed_rebuild_interval")
+
+
+@task_queue.task()
+async def rebuild_suggestions():
+    """Recompute the who-to-follow candidates of every user"""
+    async with async_session() as session:
+        stored = await rebuild_follow_suggestions(session)
+        await session.commit()
+    logger.info("Stored %s follow suggestions", stored)
+
+
+task_queue.schedule(rebuild_suggestions, "suggestions_rebuild_interval")
+
+
+async def _remove_files(media_paths: List[str]):
+    await remove_media_files.delay(media_paths=media_paths)
+
+
+@task_queue.task()
+async def purge_deleted_tweet(tweet_id: int):
+    """Remove likes, media rows and files of a soft-deleted tweet"""
+    async with async_session() as session:
+        await purge_tweet(session, tweet_id, on_media=_remove_files)
+
+
+@task_queue.task()
+async def purge_deleted_tweets():
+    """Purge soft-deleted tweets whose own purge job was lost"""
+    async with async_session() as session:
+        tweet_ids = await get_deleted_tweet_ids(
+            session, task_queue.settings.purge_batch_size
+        )
+        for tweet_id in tweet_ids:
+            await purge_tweet(session, tweet_id, on_media=_remove_files)
+
+
+async def _unindex_tweets(tweet_ids: List[int]):
+    await unindex_deleted_tweets.delay(tweet_ids=tweet_ids)
+
+
+@task_queue.task()
+async def purge_deleted_user(user_id: int):
+    """Delete a closed account with its tweets, likes, follows and files"""
+    async with async_session() as session:
+        await purge_user(
+            session, user_id, on_media=_remove_files, on_tweets=_unindex_tweets
+        )
+
+
+@task_queue.task()
+async def purge_deleted_users():
+    """Purge closed accounts whose own purge job was lost"""
+    async with async_session() as session:
+        user_ids = await get_deleted_user_ids(
+            session, task_queue.settings.purge_batch_size
+        )
+    for user_id in user_ids:
+        await purge_deleted_user(user_id=user_id)
+
+
+task_queue.schedule(purge_deleted_tweets, "purge_interval")
+task_queue.schedule(purge_deleted_users, "purge_interval")
+
+
+@task_queue.task()
+async def collect_orphan_media_files():
+    """Delete uploads that were never attached to a tweet"""
+    async with async_session() as session:
+        stats = await collect_orphan_media(session, on_media=_remove_files)
+    if stats.rows:
+        logger.info(
+            "Collected %s orphan media in %s batches, %.2fs",
+            stats.rows,
+            stats.batches,
+            stats.seconds,
+        )
+
+
+task_queue.schedule(collect_orphan_media_files, "media_gc_interval")
+
+
+@task_queue.task()
+async def maintain_tweet_partitions():
+    """Create next months' partitions and archive the expired ones"""
+    async with async_session() as session:
+        await maintain_partitions(
+            session, task_queue.settings.partition_retention_months
+        )
+
+
+if TWEETS_PARTITIONED:
+    task_queue.schedule(maintain_tweet_partitions, "partition_maintenance_interval")
+
+
+@task_queue.task()
+async def expire_upload_sessions():
+    """Delete abandoned upload sessions and their part files"""
+    batch_size = task_queue.settings.purge_batch_size
+    async with async_session() as session:
+        while True:
+            upload_ids = await delete_expired_upload_sessions(session, batch_size)
+            await session.commit()
+            # Файлы удаляются после строк: удалённую сессию никто не продолжит
+            for upload_id in upload_ids:
+                try:
+                    await aiofiles_os.remove(part_path(upload_id))
+                except FileNotFoundError:
+                    pass
+            if len(upload_ids) < batch_size:
+                break
+
+
+task_queue.schedule(expire_upload_sessions, "upload_expire_interval")
+
+
+@task_queue.task()
+async def trim_tweet_change_log():
+    """Delete expired rows of the polling change log"""
+    async with async_session() as session:
+        await trim_tweet_changes(session)
+
+
+task_queue.schedule(trim_tweet_change_log, "tweet_changes_trim_interval")
+
+
+async def enqueue_new_tweet_jobs(author: User, created: List[CreatedTweet]):
+    """Schedule indexing and stream fan-out for committed tweets"""
+    for tweet in created:
+        await index_new_tweet.delay(
+            tweet_id=tweet.tweet_id, text=tweet.tweet_data, tags=tweet.tags
+        )
+        await fan_out.delay(
+            author_id=author.id,
+            event=new_tweet_event(
+                tweet.tweet_id,
+                tweet.tweet_data,
+                tweet.media_paths,
+                author.id,
+                author.username,
+            ),
+        )
@@ -0,0 +1,212 @@
+"""
+Sampling profiler of single requests (PROFILING_ENABLED=1).
+
+A request is profiled when an admin sends it with `x-profile: 1` (the
+api-key must be listed in ADMIN_API_KEYS) or when it falls into
+PROFILING_SAMPLE_RATE, see Settings. While it runs, a thread samples the stack of the
+request's task every PROFILING_INTERVAL seconds: the Python stack when
+the task is running on the event loop, the chain of awaits when it is
+suspended (waiting for the database, the thread pool, the client...), so
+the profile shows wall time. Stacks are saved in the collapsed format of
+flamegraph.pl and speedscope, one file per request in PROFILES_PATH, and
+the response carries its id in the x-profile-id header. Download with
+GET /api/admin/profiles/{profile_id}.
+
+With profiling disabled the middleware is not installed at all.
+"""
+
+import asyncio
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import FrozenSet, Iterable, Iterator, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.setting import PROFILES_PATH
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "x-profile-id"
+PROFILE_SUFFIX = ".folded"
+# 20261019T101500-get-api-tweets-1a2b3c4d
+PROFILE_ID_RE = re.compile(r"^[0-9T]{15}-[a-z0-9-]+-[0-9a-f]{8}$")
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def _thread_stack(frame: Optional[FrameType]) -> List[str]:
+    """Labels of a thread's frames, outermost first"""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _await_stack(coro) -> List[str]:
+    """Labels of a suspended coroutine and of everything it awaits"""
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None)
+        frame = frame or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(_frame_label(frame))
+        coro = (
+            getattr(coro, "cr_await", None)
+            or getattr(coro, "ag_await", None)
+            or getattr(coro, "gi_yieldfrom", None)
+        )
+    stack.append("<waiting>")
+    return stack
+
+
+class StackSampler:
+    """Collapsed stacks of one asyncio task, sampled from another thread"""
+
+    def __init__(self, task: asyncio.Task, interval: float):
+        self.task = task
+        self.interval = interval
+        self.loop = task.get_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def sample(self):
+        if asyncio.current_task(self.loop) is self.task:
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = _thread_stack(frame)
+        else:
+            stack = _await_stack(self.task.get_coro())
+        if stack:
+            self.samples[";".join(stack)] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def collapsed(self) -> Iterator[str]:
+        for stack, count in self.samples.most_common():
+            yield f"{stack} {count}\n"
+
+
+def new_profile_id(method: str, path: str) -> str:
+    route = re.sub(r"[^a-z0-9]+", "-", path.lower()).strip("-")[:60] or "root"
+    return (
+        f"{time.strftime('%Y%m%dT%H%M%S')}-{method.lower()}-{route}-"
+        f"{uuid.uuid4().hex[:8]}"
+    )
+
+
+def profile_path(profile_id: str, directory: Path = PROFILES_PATH) -> Optional[Path]:
+    """Path of a stored profile, None for ids that are not profile ids"""
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    return directory / f"{profile_id}{PROFILE_SUFFIX}"
+
+
+def list_profiles(directory: Path = PROFILES_PATH) -> List[str]:
+    """Ids of the stored profiles, newest first"""
+    if not directory.exists():
+        return []
+    return sorted(
+        (path.stem for path in directory.glob(f"*{PROFILE_SUFFIX}")), reverse=True
+    )
+
+
+def save_profile(
+    lines: Iterable[str],
+    profile_id: str,
+    directory: Path,
+    keep: int,
+):
+    """Write the collapsed stacks and drop the oldest profiles over keep"""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{profile_id}{PROFILE_SUFFIX}"
+    path.write_text("".join(lines))
+    for old_id in list_profiles(directory)[keep:]:
+        (directory / f"{old_id}{PROFILE_SUFFIX}").unlink(missing_ok=True)
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware, other requests only pay for a header lookup"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        admin_api_keys: FrozenSet[str],
+        sample_rate: float,
+        interval: float,
+        directory: Path,
+        keep: int,
+    ):
+        self.app = app
+        self.admin_api_keys = admin_api_keys
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.directory = directory
+        self.keep = keep
+
+    def _selected(self, scope: Scope) -> bool:
+        headers = Headers(scope=scope)
+        if headers.get(PROFILE_HEADER) == "1":
+            return headers.get("api-key") in self.admin_api_keys
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self._selected(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = new_profile_id(scope["method"], scope["path"])
+
+        async def send_with_id(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[PROFILE_ID_HEADER] = profile_id
+            await send(message)
+
+        sampler = StackSampler(asyncio.current_task(), self.interval)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            await run_in_threadpool(
+                save_profile,
+                sampler.collapsed(),
+                profile_id,
+                self.directory,
+                self.keep,
+            )
+            logger.info(
+                "Profiled %s %s: %s samples, %s",
+                scope["method"],
+                scope["path"],
+                sum(sampler.samples.values()),
+                profile_id,
+            )
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Iterable, Optional, Set
+
+from utils.setting import (
+    PUBSUB_CHANNEL,
+    PUBSUB_RECONNECT_DELAY,
+    PUBSUB_RECONNECT_MAX_DELAY,
+    STREAM_QUEUE_SIZE,
+    Settings,
+)
+
+logger = logging.getLogger(__name__)
+
+Event = Dict[str, Any]
+
+RESYNC_EVENT: Event = {"type": "resync"}
+
+
+class Subscription:
+    """
+    Connection side of the hub: a bounded queue of events for the topics
+    (author ids) the client is interested in.
+
+    When the client does not keep up, the queued events are discarded and
+    replaced with a single "resync" event, so the client refetches the feed
+    once instead of the server buffering without limit.
+    """
+
+    def __init__(self, topics: Iterable[int], maxsize: int = STREAM_QUEUE_SIZE):
+        self.topics: Set[int] = set(topics)
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(maxsize, 2))
+
+    def put(self, event: Event):
+        if self._queue.full():
+            self.resync()
+        self._queue.put_nowait(event)
+
+    def resync(self):
+        """Replace the queued events with a single resync event"""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(RESYNC_EVENT)
+
+    async def get(self) -> Event:
+        return await self._queue.get()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class MemoryBackend:
+    """Single process backend: published events go straight to the hub"""
+
+    async def start(self, hub: "FeedHub"):
+        self._hub = hub
+
+    async def stop(self):
+        pass
+
+    async def publish(self, topic: int, event: Event):
+        self._hub.deliver(topic, event)
+
+
+class RedisBackend:
+    """
+    Backend for several workers: events are published to a Redis channel
+    and every worker delivers them to its own local subscribers.
+
+    When the connection breaks the listener resubscribes with exponential
+    backoff. Events published meanwhile are lost, so after reconnecting
+    every local subscriber gets a resync event.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        channel: str = PUBSUB_CHANNEL,
+        reconnect_delay: float = PUBSUB_RECONNECT_DELAY,
+        max_reconnect_delay: float = PUBSUB_RECONNECT_MAX_DELAY,
+    ):
+        self.url = url
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, hub: "FeedHub"):
+        from redis import asyncio as aioredis
+
+        self._redis = aioredis.from_url(self.url)
+        pubsub = await self._subscribe()
+        self._listener = asyncio.create_task(self._listen(hub, pubsub))
+
+    async def _subscribe(self):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        return pubsub
+
+    async def _listen(self, hub: "FeedHub", pubsub):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = await self._subscribe()
+                    logger.info("Resubscribed to %s", self.channel)
+                    hub.resync_all()
+                    delay = self.reconnect_delay
+                await self._receive(hub, pubsub)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning(
+                    "Feed events listener failed, reconnecting in %.1fs",
+                    delay,
+                    exc_info=True,
+                )
+            if pubsub is not None:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+                pubsub = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _receive(self, hub: "FeedHub", pubsub):
+        async for message in pubsub.listen():
+            if message["type"] != "message":
+                continue
+            try:
+                payload = json.loads(message["data"])
+                hub.deliver(payload["topic"], payload["event"])
+            except (ValueError, KeyError):
+                logger.warning("Malformed feed event: %r", message["data"])
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def publish(self, topic: int, event: Event):
+        await self._redis.publish(
+            self.channel, json.dumps({"topic": topic, "event": event})
+        )
+
+
+class FeedHub:
+    """
+    In-process publish/subscribe hub for feed events.
+
+    Topics are author ids: a new tweet or a like-count change is published
+    once on the author's topic and delivered to every connection following
+    that author, without any database work on the write path.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._started = False
+
+    def configure(self, settings: Settings):
+        """Use the backend of the settings; the hub must not be started yet"""
+        if self._started:
+            raise RuntimeError("Feed hub is already started")
+        self.backend = create_backend(settings)
+
+    async def start(self):
+        if not self._started:
+            await self.backend.start(self)
+            self._started = True
+
+    async def stop(self):
+        if self._started:
+            await self.backend.stop()
+            self._started = False
+
+    def subscribe(self, topics: Iterable[int]) -> Subscription:
+        subscription = Subscription(topics)
+        for topic in subscription.topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def resync_all(self):
+        """Ask every subscriber to refetch, after events may have been lost"""
+        subscriptions = set()
+        for subscribers in self._subscribers.values():
+            subscriptions.update(subscribers)
+        for subscription in subscriptions:
+            subscription.resync()
+
+    def deliver(self, topic: int, event: Event):
+        for subscription in self._subscribers.get(topic, ()):
+            subscription.put(event)
+
+    async def publish(self, topic: int, event: Event):
+        """Best effort: a broken broker must not fail the write request"""
+        try:
+            await self.start()
+            await self.backend.publish(topic, event)
+        except Exception:
+            logger.exception("Failed to publish feed event on topic %s", topic)
+
+
+def create_backend(settings: Settings):
+    if settings.pubsub_backend == "redis":
+        return RedisBackend(settings.redis_url)
+    return MemoryBackend()
+
+
+feed_hub = FeedHub()
@@ -0,0 +1,170 @@
+"""
+Per-user rate limits for write endpoints.
+
+Limits use GCRA (generic cell rate algorithm): for every (user, endpoint
+class) only the theoretical arrival time of the next request is stored.
+A limit of "30/minute" lets a client make up to 30 requests at once and
+then one every two seconds. The key comes from the user that
+authenticate_user has already loaded for the request, so checking a limit
+never touches the database.
+"""
+
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+from fastapi import Depends, HTTPException, Request, status
+
+from database.models import User
+from utils.authorize import authenticate_user
+from utils.setting import RATE_LIMITS, Settings
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class Limit:
+    rate: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        """Parse "30/minute" (or "30/60" seconds)"""
+        rate, _, period = value.partition("/")
+        period = period.strip()
+        seconds = PERIODS.get(period.rstrip("s"))
+        return cls(int(rate), float(seconds if seconds is not None else period))
+
+    @property
+    def interval(self) -> float:
+        """Time between requests at the sustained rate"""
+        return self.period / self.rate
+
+    @property
+    def tolerance(self) -> float:
+        """How far ahead of now the arrival time may run, i.e. the burst"""
+        return self.period
+
+
+class MemoryStore:
+    """Arrival times kept in the process, enough for a single worker"""
+
+    def __init__(self):
+        self._tat: Dict[str, float] = {}
+        self._next_sweep = 0.0
+
+    def clear(self):
+        self._tat.clear()
+
+    def _sweep(self, now: float):
+        # Ключи с прошедшим временем ничем не отличаются от отсутствующих
+        self._tat = {key: tat for key, tat in self._tat.items() if tat > now}
+        self._next_sweep = now + 60
+
+    async def hit(self, key: str, limit: Limit, now: float) -> float:
+        if now >= self._next_sweep:
+            self._sweep(now)
+        new_tat = max(self._tat.get(key, now), now) + limit.interval
+        allow_at = new_tat - limit.tolerance
+        if now < allow_at:
+            return allow_at - now
+        self._tat[key] = new_tat
+        return 0.0
+
+
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local tolerance = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+if tat < now then tat = now end
+local new_tat = tat + interval
+local allow_at = new_tat - tolerance
+if now < allow_at then return tostring(allow_at - now) end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return '0'
+"""
+
+
+class RedisStore:
+    """Arrival times shared by all workers, updated atomically by a script"""
+
+    def __init__(self, url: str, prefix: str = "rate-limit:"):
+        self.url = url
+        self.prefix = prefix
+        self._script = None
+
+    def clear(self):
+        pass
+
+    async def hit(self, key: str, limit: Limit, now: float) -> float:
+        if self._script is None:
+            from redis import asyncio as aioredis
+
+            self._script = aioredis.from_url(self.url).register_script(GCRA_SCRIPT)
+        retry_after = await self._script(
+            keys=[self.prefix + key], args=[now, limit.interval, limit.tolerance]
+        )
+        return float(retry_after)
+
+
+class RateLimiter:
+    def __init__(
+        self, store, limits: Dict[str, str] = RATE_LIMITS, enabled: bool = True
+    ):
+        self.store = store
+        self.enabled = enabled
+        self.limits = {name: Limit.parse(value) for name, value in limits.items()}
+
+    async def hit(self, endpoint: str, user_id: int) -> float:
+        """
+        Count a request of the user to the endpoint class.
+
+        Returns:
+            float: 0 if the request is allowed, otherwise seconds to wait.
+        """
+        limit = self.limits.get(endpoint)
+        if not self.enabled or limit is None:
+            return 0.0
+        try:
+            return await self.store.hit(f"{endpoint}:{user_id}", limit, time.time())
+        except Exception:
+            # Недоступный Redis не должен ломать запись, пропускаем запрос
+            logger.exception("Rate limit check failed for %s", endpoint)
+            return 0.0
+
+
+def create_store(settings: Settings):
+    if settings.rate_limit_backend == "redis":
+        return RedisStore(settings.redis_url)
+    return MemoryStore()
+
+
+def create_rate_limiter(settings: Settings) -> RateLimiter:
+    """The limiter of an app, see app.state.rate_limiter"""
+    return RateLimiter(
+        create_store(settings), settings.rate_limits, settings.rate_limit_enabled
+    )
+
+
+def rate_limit(endpoint: str):
+    """Dependency enforcing the limit of the endpoint class for the user"""
+
+    async def check_rate_limit(
+        request: Request,
+        current_user: User = Depends(authenticate_user),
+    ):
+        rate_limiter = request.app.state.rate_limiter
+        retry_after = await rate_limiter.hit(endpoint, current_user.id)
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded, try again later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    return check_rate_limit
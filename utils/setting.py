@@ -1,5 +1,248 @@
+import os
+from dataclasses import MISSING, dataclass, field, fields
+from functools import lru_cache
 from pathlib import Path
+from typing import Any, Dict, FrozenSet, Mapping
+
+from dotenv import load_dotenv
 
 # Папка для хранения img
 BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_PATH = BASE_DIR / "uploads"
+# Собранный фронтенд (SPA)
+STATIC_DIR = BASE_DIR / "server" / "static"
+# Переменные окружения для локальной разработки, читаются в get_settings()
+ENV_FILE = BASE_DIR / "app.env"
+
+# Конфигурация полнотекстового поиска PostgreSQL (используется в GIN индексе)
+SEARCH_TS_CONFIG = "simple"
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Окно для подсчёта популярных хэштегов
+TRENDING_WINDOW_SECONDS = 60 * 60
+TRENDING_BUCKET_SECONDS = 60
+TRENDING_SIZE = 10
+# Окно перечитывается из базы: в нём появляются теги твитов, записанных
+# другими воркерами
+TRENDING_RELOAD_SECONDS = 60
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 100
+
+PUBSUB_CHANNEL = "feed-events"
+STREAM_QUEUE_SIZE = 100
+# Переподключение к Redis после обрыва: первая пауза, удваивается до предела
+PUBSUB_RECONNECT_DELAY = 0.5
+PUBSUB_RECONNECT_MAX_DELAY = 30.0
+
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 1.0
+TASK_SHUTDOWN_TIMEOUT = 10.0
+
+# Превью изображений
+THUMBNAILS_PATH = MEDIA_PATH / "thumbnails"
+THUMBNAIL_SIZE = (320, 320)
+
+# Максимальное число твитов в POST /api/tweets/batch
+TWEET_BATCH_MAX_SIZE = 100
+
+# Ограничения частоты запросов по умолчанию: "<число>/<second|minute|hour>"
+# на пользователя, переопределяются переменными RATE_LIMIT_<КЛАСС>
+RATE_LIMITS = {
+    "tweet": "30/minute",
+    "like": "120/minute",
+    "follow": "60/minute",
+    "upload": "20/minute",
+}
+
+# Потоковый экспорт твитов
+EXPORT_BATCH_SIZE = 500  # строк за одно чтение курсора
+EXPORT_CHUNK_SIZE = 64 * 1024  # байт в одном фрагменте ответа
+
+# Секционирование tweets и likes по месяцам (только PostgreSQL, для новой
+# базы). Определяет схему моделей (database.models), поэтому читается из
+# окружения процесса при импорте, а не из Settings: serve.py и воркер Celery
+# загружают app.env раньше, чем импортируются модели
+TWEETS_PARTITIONED = os.environ.get("TWEETS_PARTITIONED", "0") == "1"
+
+# Лента ?order=top: кандидатов на страницу, которые переранжируются по
+# близости к автору, и сколько последних лайков пользователя её определяют
+TOP_FEED_PAGE_SIZE = 50
+TOP_FEED_MAX_PAGE_SIZE = 200
+TOP_FEED_CANDIDATES = 4
+TOP_FEED_AFFINITY_LIKES = 1000
+
+SUGGESTIONS_PAGE_SIZE = 10
+
+# Загрузка больших файлов по частям: недописанные файлы
+UPLOAD_PARTS_PATH = MEDIA_PATH / "parts"
+
+# Изменений журнала ?since_id= за один ответ
+TWEET_CHANGES_LIMIT = 1000
+
+# Уровни сжатия ответов API выбраны под динамические ответы, где важна и
+# задержка, а не только размер
+COMPRESSION_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+# Профили запросов (utils.profiler)
+PROFILES_PATH = BASE_DIR / "profiles"
+
+
+def _env(name: str, default: Any = MISSING, default_factory: Any = MISSING):
+    """A Settings field that Settings.from_env() reads from the variable name"""
+    return field(
+        default=default, default_factory=default_factory, metadata={"env": name}
+    )
+
+
+def _parse(kind: Any, value: str) -> Any:
+    if kind is bool:
+        return value == "1"
+    if kind == FrozenSet[str]:
+        return frozenset(item.strip() for item in value.split(",") if item.strip())
+    return kind(value)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Settings of one application instance, see app.create_app. The app
+    passes them to what it builds: middleware, rate limiter, task queue
+    and database engine. Fields declared with an environment variable are
+    read from it by from_env().
+    """
+
+    database_url: str
+    # Логирование каждого SQL-запроса, только для отладки
+    database_echo: bool = _env("DB_ECHO", False)
+    # Кэш подготовленных операторов asyncpg на соединение. Должен вмещать все
+    # частые запросы (см. database.utils), 0 - для PgBouncer в режиме transaction
+    statement_cache_size: int = _env("DB_STATEMENT_CACHE_SIZE", 500)
+
+    # Запуск сервера (serve.py). По умолчанию один воркер на каждое доступное
+    # процессу ядро, воркер перезапускается после max_requests запросов
+    # (0 - без ограничения)
+    server_host: str = _env("SERVER_HOST", "0.0.0.0")
+    server_port: int = _env("SERVER_PORT", 8000)
+    web_concurrency: int = _env(
+        "WEB_CONCURRENCY", default_factory=lambda: len(os.sched_getaffinity(0)) or 1
+    )
+    keep_alive_timeout: int = _env("KEEP_ALIVE_TIMEOUT", 5)
+    graceful_shutdown_timeout: int = _env("GRACEFUL_SHUTDOWN_TIMEOUT", 30)
+    max_requests: int = _env("MAX_REQUESTS", 10000)
+    access_log: bool = _env("ACCESS_LOG", False)
+
+    # Рассылка событий ленты: memory - в пределах процесса, redis - между
+    # воркерами
+    pubsub_backend: str = _env("PUBSUB_BACKEND", "memory")
+    redis_url: str = _env("REDIS_URL", "redis://localhost:6379/0")
+
+    # Фоновые задачи: asyncio - пул воркеров в процессе, celery - через брокер
+    # (по умолчанию redis_url)
+    task_backend: str = _env("TASK_BACKEND", "asyncio")
+    task_workers: int = _env("TASK_WORKERS", 4)
+    celery_broker_url: str = _env("CELERY_BROKER_URL", "")
+    # Периодические задачи ставит один процесс из всех воркеров; остальные раз
+    # в столько секунд проверяют, не освободилось ли место (database.locks)
+    scheduler_leader_retry: float = _env("SCHEDULER_LEADER_RETRY", 10.0)
+
+    # Ограничение частоты запросов, RATE_LIMITS с переопределениями
+    rate_limit_enabled: bool = _env("RATE_LIMIT_ENABLED", True)
+    rate_limit_backend: str = _env("RATE_LIMIT_BACKEND", "memory")
+    rate_limits: Mapping[str, str] = field(default_factory=lambda: dict(RATE_LIMITS))
+    # api-key пользователей с доступом к /api/admin/*, через запятую
+    admin_api_keys: FrozenSet[str] = _env("ADMIN_API_KEYS", frozenset())
+
+    # Счётчики пользователей: число шардов и период сверки с таблицами
+    counter_shards: int = _env("COUNTER_SHARDS", 8)
+    counter_reconcile_interval: float = _env("COUNTER_RECONCILE_INTERVAL", 3600.0)
+
+    # Очистка удалённых твитов: строк за одну транзакцию и период проверки
+    purge_batch_size: int = _env("PURGE_BATCH_SIZE", 1000)
+    purge_interval: float = _env("PURGE_INTERVAL", 300.0)
+
+    # Секции tweets и likes: сколько будущих месяцев держать созданными
+    # заранее, секции старше скольких месяцев переносятся в архивную схему
+    # (0 - никогда)
+    partition_months_ahead: int = _env("PARTITION_MONTHS_AHEAD", 2)
+    partition_retention_months: int = _env("PARTITION_RETENTION_MONTHS", 0)
+    partition_archive_schema: str = _env("PARTITION_ARCHIVE_SCHEMA", "archive")
+    partition_maintenance_interval: float = _env(
+        "PARTITION_MAINTENANCE_INTERVAL", 86400.0
+    )
+
+    # Лента ?order=top: за каждые top_feed_decay_seconds твит должен набрать
+    # в 10 раз больше лайков, чтобы удержать место. Подписка на автора весит
+    # как десятикратное число лайков
+    top_feed_decay_seconds: float = _env("TOP_FEED_DECAY_SECONDS", 45000.0)
+    top_feed_follow_boost: float = _env("TOP_FEED_FOLLOW_BOOST", 1.0)
+    top_feed_rebuild_interval: float = _env("TOP_FEED_REBUILD_INTERVAL", 86400.0)
+
+    # Рекомендации "кого читать": кандидатов на пользователя и период пересчёта
+    suggestions_per_user: int = _env("SUGGESTIONS_PER_USER", 50)
+    suggestions_rebuild_interval: float = _env("SUGGESTIONS_REBUILD_INTERVAL", 3600.0)
+
+    # Загрузка по частям: предельный размер, срок жизни брошенной сессии
+    # (продлевается каждой частью) и период очистки. Аренда сессии на время
+    # приёма одной части: по её истечении часть может прислать другой запрос
+    # (например, повтор после обрыва соединения)
+    upload_max_size: int = _env("UPLOAD_MAX_SIZE", 512 * 1024 * 1024)
+    upload_session_ttl: int = _env("UPLOAD_SESSION_TTL", 24 * 60 * 60)
+    upload_expire_interval: float = _env("UPLOAD_EXPIRE_INTERVAL", 600.0)
+    upload_lease_seconds: int = _env("UPLOAD_LEASE_SECONDS", 300)
+
+    # Сборка непривязанных к твитам загрузок: сколько ждать привязки, строк за
+    # одну транзакцию и период запуска
+    media_gc_grace_seconds: int = _env("MEDIA_GC_GRACE_SECONDS", 24 * 60 * 60)
+    media_gc_batch_size: int = _env("MEDIA_GC_BATCH_SIZE", 500)
+    media_gc_interval: float = _env("MEDIA_GC_INTERVAL", 3600.0)
+
+    # Журнал изменений для ?since_id=: срок хранения и период очистки
+    tweet_changes_retention: int = _env("TWEET_CHANGES_RETENTION", 24 * 60 * 60)
+    tweet_changes_trim_interval: float = _env("TWEET_CHANGES_TRIM_INTERVAL", 3600.0)
+
+    # Сжатие ответов API: тела меньше compression_min_size не сжимаются, тела
+    # от compression_threadpool_size сжимаются в пуле потоков
+    compression: bool = _env("COMPRESSION_ENABLED", True)
+    compression_min_size: int = _env("COMPRESSION_MIN_SIZE", 1024)
+    compression_threadpool_size: int = _env("COMPRESSION_THREADPOOL_SIZE", 64 * 1024)
+
+    # Профилирование отдельных запросов (utils.profiler): запросы админов с
+    # заголовком x-profile: 1 и доля profiling_sample_rate остальных.
+    # Выключено - middleware не устанавливается и ничего не стоит
+    profiling: bool = _env("PROFILING_ENABLED", False)
+    profiling_sample_rate: float = _env("PROFILING_SAMPLE_RATE", 0.0)
+    profiling_interval: float = _env("PROFILING_INTERVAL", 0.005)
+    profiles_path: Path = PROFILES_PATH
+    profiles_keep: int = _env("PROFILES_KEEP", 200)
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] = os.environ) -> "Settings":
+        values: Dict[str, Any] = {
+            item.name: _parse(item.type, env[item.metadata["env"]])
+            for item in fields(cls)
+            if "env" in item.metadata and item.metadata["env"] in env
+        }
+        return cls(
+            database_url=(
+                f"postgresql+asyncpg://{env.get('POSTGRES_USER')}:"
+                f"{env.get('POSTGRES_PASSWORD')}@{env.get('DB_HOST')}"
+                f":{env.get('DB_PORT')}/{env.get('POSTGRES_DB')}"
+            ),
+            rate_limits={
+                name: env.get(f"RATE_LIMIT_{name.upper()}", limit)
+                for name, limit in RATE_LIMITS.items()
+            },
+            **values,
+        )
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """
+    Settings from app.env and the environment, read once per process by
+    the entry points: create_app() without settings, serve.py and the
+    Celery worker. Variables set in the environment take precedence.
+    """
+    load_dotenv(ENV_FILE)
+    return Settings.from_env()
@@ -0,0 +1,188 @@
+"""
+Static files of the SPA.
+
+Assets are compressed ahead of time (gzip and, when the brotli package is
+installed, brotli) and served according to Accept-Encoding. Bundles with a
+content hash in their name never change, so they are cached forever by
+browsers. Precompress at build time with:
+    python -m utils.static
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from utils.etag import etag_matches
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него отдаём только gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_SUFFIXES = (".js", ".css", ".html", ".map", ".svg", ".json", ".ico")
+MIN_COMPRESS_SIZE = 1024
+# app.ee2cdef2.js, chunk-vendors.de691de6.css, app.ee2cdef2.js.map ...
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{8,}\.(js|css)(\.map)?$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# (Content-Encoding, расширение файла) в порядке предпочтения
+ENCODINGS: List[Tuple[str, str]] = [("gzip", ".gz")]
+if brotli is not None:
+    ENCODINGS.insert(0, ("br", ".br"))
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress_static(directory: Path, min_size: int = MIN_COMPRESS_SIZE) -> int:
+    """
+    Write .br/.gz variants next to compressible files. Variants that are
+    newer than their source are kept, so only changed files are compressed.
+
+    Returns:
+        int: The number of files written.
+    """
+    written = 0
+    for source in directory.rglob("*"):
+        if not source.is_file() or source.suffix not in COMPRESSIBLE_SUFFIXES:
+            continue
+        source_stat = source.stat()
+        if source_stat.st_size < min_size:
+            continue
+        data = None
+        for encoding, suffix in ENCODINGS:
+            target = source.with_name(source.name + suffix)
+            if target.exists() and target.stat().st_mtime >= source_stat.st_mtime:
+                continue
+            if data is None:
+                data = source.read_bytes()
+            compressed = _compress(data, encoding)
+            if len(compressed) >= len(data):
+                continue
+            # Запись через временный файл: воркеры могут сжимать одновременно
+            temporary = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+            temporary.write_bytes(compressed)
+            os.replace(temporary, target)
+            written += 1
+    return written
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """Content codings from an Accept-Encoding header, except those with q=0"""
+    accepted = []
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip() and quality > 0:
+            accepted.append(name.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves precompressed variants and cache headers"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Файлы статики не меняются во время работы, stat кэшируется
+        self._variants: Dict[Tuple[str, str], Optional[os.stat_result]] = {}
+
+    def _variant(self, full_path: str, suffix: str) -> Optional[os.stat_result]:
+        key = (full_path, suffix)
+        if key not in self._variants:
+            try:
+                self._variants[key] = os.stat(full_path + suffix)
+            except OSError:
+                self._variants[key] = None
+        return self._variants[key]
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        full_path = str(full_path)
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        response: Optional[Response] = None
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            variant_stat = self._variant(full_path, suffix)
+            if variant_stat is None:
+                continue
+            response = FileResponse(
+                full_path + suffix,
+                status_code=status_code,
+                stat_result=variant_stat,
+                media_type=mimetypes.guess_type(full_path)[0] or "text/plain",
+            )
+            response.headers["content-encoding"] = encoding
+            break
+        if response is None:
+            response = FileResponse(
+                full_path, status_code=status_code, stat_result=stat_result
+            )
+
+        if HASHED_NAME_RE.search(full_path):
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+        if full_path.endswith(COMPRESSIBLE_SUFFIXES):
+            response.headers["vary"] = "Accept-Encoding"
+
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class SpaIndex:
+    """index.html of the SPA, read once and served with an ETag"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._content: Optional[bytes] = None
+        self._etag = ""
+
+    def _load(self):
+        self._content = self.path.read_bytes()
+        self._etag = '"{}"'.format(hashlib.md5(self._content).hexdigest())
+
+    def response(self, if_none_match: Optional[str] = None) -> Response:
+        if self._content is None:
+            self._load()
+        headers = {"etag": self._etag, "cache-control": REVALIDATE_CACHE_CONTROL}
+        if etag_matches(if_none_match, self._etag):
+            return Response(status_code=304, headers=headers)
+        return Response(self._content, media_type="text/html", headers=headers)
+
+
+if __name__ == "__main__":
+    from utils.setting import STATIC_DIR
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Precompressed %s files", precompress_static(STATIC_DIR))
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+from dataclasses import dataclass, replace
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from utils.setting import (
+    TASK_MAX_ATTEMPTS,
+    TASK_RETRY_DELAY,
+    TASK_SHUTDOWN_TIMEOUT,
+    Settings,
+    get_settings,
+)
+
+logger = logging.getLogger(__name__)
+
+# Имя единственной Celery задачи, через которую запускаются все наши задачи
+CELERY_TASK_NAME = "twitter_clone.run_job"
+
+
+@dataclass(frozen=True)
+class Job:
+    name: str
+    kwargs: Dict[str, Any]
+    attempt: int = 1
+
+
+class Task:
+    """A registered coroutine function that can be run in the background"""
+
+    def __init__(
+        self,
+        queue: "TaskQueue",
+        func: Callable[..., Awaitable[Any]],
+        name: str,
+        local: bool,
+        max_attempts: int,
+    ):
+        self.queue = queue
+        self.func = func
+        self.name = name
+        self.local = local
+        self.max_attempts = max_attempts
+
+    async def __call__(self, **kwargs):
+        return await self.func(**kwargs)
+
+    async def delay(self, **kwargs):
+        """Schedule the task, the caller does not wait for it to run"""
+        await self.queue.enqueue(self, kwargs)
+
+
+class TaskQueue:
+    """
+    Background jobs for side effects that should not delay the response.
+
+    By default jobs run on a pool of asyncio workers inside the web process
+    and failed jobs are retried with exponential backoff. With the celery
+    task backend, jobs are sent to Celery (see utils.celery_app) and
+    survive restarts of the web process. Tasks declared with local=True
+    always run in-process because they update process local state (search
+    index, trending counters, stream subscribers).
+
+    configure() gives the queue the settings of the app (or of the Celery
+    worker): its backend and workers, and the settings the jobs read from
+    task_queue.settings.
+
+    Tasks registered with schedule() are enqueued periodically while the
+    queue is started with schedules, or between start_schedules() and
+    stop_schedules() (only one of several worker processes runs them,
+    see database.locks).
+    """
+
+    def __init__(
+        self,
+        backend: str = "asyncio",
+        workers: int = 4,
+        max_attempts: int = TASK_MAX_ATTEMPTS,
+        retry_delay: float = TASK_RETRY_DELAY,
+    ):
+        self.backend = backend
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._settings: Optional[Settings] = None
+        self.tasks: Dict[str, Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        self._schedules: List[Tuple[Task, Union[float, str]]] = []
+        self._periodic: List[asyncio.Task] = []
+
+    def configure(self, settings: Settings):
+        """Use the backend, the number of workers and the job settings"""
+        self._settings = settings
+        self.backend = settings.task_backend
+        self.workers = settings.task_workers
+        if self.backend == "celery":
+            from utils.celery_app import configure_celery
+
+            configure_celery(settings)
+
+    @property
+    def settings(self) -> Settings:
+        """Settings of the jobs, from get_settings() if nothing configured them"""
+        if self._settings is None:
+            self.configure(get_settings())
+        return self._settings
+
+    def task(
+        self,
+        name: Optional[str] = None,
+        local: bool = False,
+        max_attempts: Optional[int] = None,
+    ):
+        def decorator(func: Callable[..., Awaitable[Any]]) -> Task:
+            task = Task(
+                self,
+                func,
+                name or func.__name__,
+                local,
+                max_attempts or self.max_attempts,
+            )
+            self.tasks[task.name] = task
+            return task
+
+        return decorator
+
+    def schedule(self, task: Task, interval: Union[float, str]):
+        """
+        Enqueue the task on start and then every interval seconds. interval
+        is a number or the name of the settings field that holds it.
+        """
+        self._schedules.append((task, interval))
+
+    async def _every(self, task: Task, interval: float):
+        while True:
+            try:
+                await task.delay()
+            except Exception:
+                logger.exception("Failed to schedule periodic job %s", task.name)
+            await asyncio.sleep(interval)
+
+    def _ensure_workers(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._queue is None:
+            # Воркеры привязаны к циклу событий, в котором их запустили
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._workers = [
+                loop.create_task(self._worker(self._queue)) for _ in range(self.workers)
+            ]
+        return self._queue
+
+    async def start(self, schedules: bool = True):
+        self._ensure_workers()
+        if schedules:
+            self.start_schedules()
+
+    def start_schedules(self):
+        if not self._periodic:
+            self._periodic = [
+                asyncio.create_task(
+                    self._every(
+                        task,
+                        (
+                            getattr(self.settings, interval)
+                            if isinstance(interval, str)
+                            else interval
+                        ),
+                    )
+                )
+                for task, interval in self._schedules
+            ]
+
+    def stop_schedules(self):
+        for task in self._periodic:
+            task.cancel()
+        self._periodic = []
+
+    async def stop(self, timeout: float = TASK_SHUTDOWN_TIMEOUT):
+        """Let the queued jobs finish, then stop the workers"""
+        self.stop_schedules()
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Stopping with %s background jobs left",
+                self._queue.qsize() + len(self._retries),
+            )
+        for task in [*self._workers, *self._retries]:
+            task.cancel()
+        self._loop, self._queue, self._workers = None, None, []
+        self._retries = set()
+
+    async def join(self):
+        """Wait until every queued job, including pending retries, is done"""
+        while self._queue is not None:
+            await self._queue.join()
+            if not self._retries:
+                break
+            await asyncio.wait(self._retries)
+
+    async def enqueue(self, task: Task, kwargs: Dict[str, Any]):
+        if self.backend == "celery" and not task.local:
+            from utils.celery_app import celery_app
+
+            await asyncio.to_thread(
+                celery_app.send_task, CELERY_TASK_NAME, args=(task.name, kwargs)
+            )
+            return
+        self._ensure_workers().put_nowait(Job(task.name, kwargs))
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job = await queue.get()
+            try:
+                await self.run(job)
+            finally:
+                queue.task_done()
+
+    async def run(self, job: Job):
+        task = self.tasks[job.name]
+        try:
+            await task.func(**job.kwargs)
+        except Exception:
+            if job.attempt >= task.max_attempts:
+                logger.exception(
+                    "Job %s failed after %s attempts", job.name, job.attempt
+                )
+                return
+            delay = self.retry_delay * 2 ** (job.attempt - 1)
+            logger.warning(
+                "Job %s failed (attempt %s), retrying in %.1fs",
+                job.name,
+                job.attempt,
+                delay,
+                exc_info=True,
+            )
+            retry = asyncio.create_task(
+                self._retry_later(replace(job, attempt=job.attempt + 1), delay)
+            )
+            self._retries.add(retry)
+            retry.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, job: Job, delay: float):
+        await asyncio.sleep(delay)
+        self._ensure_workers().put_nowait(job)
+
+
+task_queue = TaskQueue()
@@ -0,0 +1,19 @@
+import re
+from typing import List
+
+HASHTAG_RE = re.compile(r"(?<![\w#])#(\w{1,100})", re.UNICODE)
+MENTION_RE = re.compile(r"(?<![\w@])@(\w{1,255})", re.UNICODE)
+
+
+def _unique(values: List[str]) -> List[str]:
+    return list(dict.fromkeys(values))
+
+
+def extract_hashtags(text: str) -> List[str]:
+    """Return normalized (lower case) hashtags in order of appearance"""
+    return _unique([tag.lower() for tag in HASHTAG_RE.findall(text)])
+
+
+def extract_mentions(text: str) -> List[str]:
+    """Return mentioned usernames in order of appearance"""
+    return _unique(MENTION_RE.findall(text))
@@ -0,0 +1,98 @@
+import heapq
+import time
+from collections import Counter, deque
+from typing import Deque, Iterable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.tags import get_recent_tag_usage
+from utils.setting import (
+    TRENDING_BUCKET_SECONDS,
+    TRENDING_RELOAD_SECONDS,
+    TRENDING_WINDOW_SECONDS,
+)
+
+
+class TrendingTags:
+    """
+    Sliding window counter of hashtag usage.
+
+    Usages are grouped into fixed size time buckets. Totals for the whole
+    window are kept incrementally: a new usage increments them and buckets
+    falling out of the window are subtracted, so reading the top tags never
+    rescans the history.
+    """
+
+    def __init__(
+        self,
+        window_seconds: int = TRENDING_WINDOW_SECONDS,
+        bucket_seconds: int = TRENDING_BUCKET_SECONDS,
+        reload_seconds: float = TRENDING_RELOAD_SECONDS,
+    ):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.reload_seconds = reload_seconds
+        self.loaded = False
+        self._loaded_at = 0.0
+        self._buckets: Deque[Tuple[int, Counter]] = deque()
+        self._totals: Counter = Counter()
+
+    def clear(self):
+        self.loaded = False
+        self._buckets.clear()
+        self._totals.clear()
+
+    def _expire(self, now: float):
+        oldest = int(now - self.window_seconds) // self.bucket_seconds
+        while self._buckets and self._buckets[0][0] < oldest:
+            _, counts = self._buckets.popleft()
+            self._totals.subtract(counts)
+            for tag in counts:
+                if self._totals[tag] <= 0:
+                    del self._totals[tag]
+
+    def _bucket(self, timestamp: float) -> Counter:
+        key = int(timestamp) // self.bucket_seconds
+        if not self._buckets or self._buckets[-1][0] < key:
+            self._buckets.append((key, Counter()))
+        # Запоздавшие записи попадают в последнюю корзину
+        return self._buckets[-1][1]
+
+    def add(self, tags: Iterable[str], timestamp: Optional[float] = None):
+        now = time.time()
+        timestamp = now if timestamp is None else timestamp
+        if timestamp < now - self.window_seconds:
+            return
+        counts = self._bucket(timestamp)
+        for tag in tags:
+            counts[tag] += 1
+            self._totals[tag] += 1
+        self._expire(now)
+
+    def record(self, tags: Iterable[str]):
+        """Count a new usage once the window has been warmed up"""
+        if self.loaded:
+            self.add(tags)
+
+    async def ensure_loaded(self, session: AsyncSession):
+        """
+        Warm the window up from the database, and read it again every
+        reload_seconds: other worker processes record their own tweets.
+        """
+        if self.loaded and time.monotonic() - self._loaded_at < self.reload_seconds:
+            return
+        usages = await get_recent_tag_usage(session, self.window_seconds)
+        self._buckets.clear()
+        self._totals.clear()
+        now = time.time()
+        for tag, age in sorted(usages, key=lambda usage: -usage[1]):
+            self.add([tag], timestamp=now - age)
+        self.loaded = True
+        self._loaded_at = time.monotonic()
+
+    def top(self, size: int) -> List[Tuple[str, int]]:
+        self._expire(time.time())
+        return heapq.nlargest(size, self._totals.items(), key=lambda item: item[1])
+
+
+trending_tags = TrendingTags()